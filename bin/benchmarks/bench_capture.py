@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+"""
+Measure writing a capture file, reading it back completely, and reading a short time range out of the middle of it
+with the time index.
+
+The frames are stamped as if they were received at a fixed rate, so a long capture can be written quickly.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from common import rpdo_frames
+from pycomfoconnect.capture import CaptureReader, CaptureWriter, index_path
+from pycomfoconnect.recorder import RX
+
+
+def write(path, frames, rate):
+    start = time.perf_counter()
+
+    with CaptureWriter(path) as capture:
+        for number, frame in enumerate(frames):
+            capture.write_frames(RX, [frame], number / rate)
+
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(path)
+    print('%-24s %8d frames %8.3f s %10.0f frames/s %8.1f MiB, index %d bytes' % (
+        'write', len(frames), elapsed, len(frames) / elapsed, size / 2 ** 20, os.path.getsize(index_path(path))))
+
+
+def read(name, path, start=None, end=None):
+    started = time.perf_counter()
+
+    with CaptureReader(path) as capture:
+        count = 0
+        for record in capture.frames(start, end):
+            count += 1
+
+    elapsed = time.perf_counter() - started
+    print('%-24s %8d frames %8.3f s %10.0f frames/s' % (name, count, elapsed, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark writing and reading capture files.')
+    parser.add_argument('--frames', type=int, default=1000000, help='number of frames (default=1000000)')
+    parser.add_argument('--rate', type=float, default=50, help='frames per second of capture time (default=50)')
+    parser.add_argument('--range', type=float, default=60, help='seconds to read from the middle (default=60)')
+    args = parser.parse_args()
+
+    # A handful of distinct frames is enough, the capture doesn't look at them
+    frames = rpdo_frames(1000) * (args.frames // 1000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.cap')
+
+        write(path, frames, args.rate)
+        read('read all', path)
+
+        middle = len(frames) / args.rate / 2
+        read('read %g s from middle' % args.range, path, middle, middle + args.range)
+
+
+if __name__ == '__main__':
+    main()
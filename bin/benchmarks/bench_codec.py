@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+"""
+Measure the cost of decoding and handling sensor updates, with and without the RpdoFilter, and the cost of
+encoding the commands we send, with and without frame templates.
+
+The frames look like a real session: a handful of subscribed sensors that mostly repeat their previous value,
+and some updates for a sensor we aren't subscribed to anymore.
+"""
+
+import argparse
+import random
+import struct
+import time
+
+from common import BRIDGE_UUID, LOCAL_UUID, rpdo_frame
+from pycomfoconnect.comfoconnect import rpdo_value
+from pycomfoconnect.const import CMD_FAN_MODE_HIGH
+from pycomfoconnect.message import Message, TemplateCache
+from pycomfoconnect.rpdofilter import RpdoFilter
+from pycomfoconnect.zehnder_pb2 import GatewayOperation, KeepAlive, CnRpdoRequest, CnRmiRequest
+
+SUBSCRIBED = [65, 117, 221, 274, 290]
+UNSUBSCRIBED = 227
+
+# The commands we send over and over again
+COMMANDS = [
+    (KeepAlive, None),
+    (CnRpdoRequest, {'pdid': 65, 'type': 1, 'zone': 1}),
+    (CnRmiRequest, {'nodeId': 1, 'message': CMD_FAN_MODE_HIGH}),
+]
+
+
+def session_frames(count, change_rate, unsubscribed_rate):
+    """Build count frames where a sensor changes its value with probability change_rate."""
+
+    rng = random.Random(1)
+    values = dict((pdid, 0) for pdid in SUBSCRIBED)
+
+    frames = []
+    for reference in range(1, count + 1):
+        if rng.random() < unsubscribed_rate:
+            pdid = UNSUBSCRIBED
+        else:
+            pdid = SUBSCRIBED[reference % len(SUBSCRIBED)]
+            if rng.random() < change_rate:
+                values[pdid] += 1
+        frames.append(rpdo_frame(reference, pdid, struct.pack('<h', values.get(pdid, 0))))
+
+    return frames
+
+
+def handle(message):
+    """What ComfoConnect does with a sensor update."""
+
+    if message.cmd.type == GatewayOperation.CnRpdoNotificationType:
+        return message.msg.pdid, rpdo_value(message.msg.data)
+
+
+def run(name, frames, rpdo_filter=None):
+    start = time.perf_counter()
+    cpu = time.process_time()
+
+    handled = 0
+    for frame in frames:
+        if rpdo_filter is not None and not rpdo_filter.accept(frame):
+            continue
+        handle(Message.decode(frame))
+        handled += 1
+
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    print('%-24s %8d frames %8d handled %8.3f s %7.3f s cpu %10.0f frames/s' % (
+        name, len(frames), handled, elapsed, cpu, len(frames) / elapsed))
+
+    return cpu
+
+
+def run_accept(name, frames, rpdo_filter):
+    """Only the cost of the RpdoFilter, to compare with the cost of decoding a frame."""
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+
+    for frame in frames:
+        rpdo_filter.accept(frame)
+
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    print('%-24s %8d frames %8.3f s %7.3f s cpu %7.2f us/frame' % (
+        name, len(frames), elapsed, cpu, cpu / len(frames) * 1e6))
+
+
+def run_encode(name, count, create):
+    start = time.perf_counter()
+    cpu = time.process_time()
+
+    for reference in range(1, count + 1):
+        command, params = COMMANDS[reference % len(COMMANDS)]
+        create(command, reference, params).encode_parts()
+
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    print('%-24s %8d frames %8.3f s %7.3f s cpu %10.0f frames/s' % (name, count, elapsed, cpu, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark decoding sensor updates and encoding commands.')
+    parser.add_argument('--frames', type=int, default=100000, help='number of frames (default=100000)')
+    parser.add_argument('--change-rate', type=float, default=0.1,
+                        help='probability that an update has a new value (default=0.1)')
+    parser.add_argument('--unsubscribed-rate', type=float, default=0.05,
+                        help='fraction of updates for a sensor we are not subscribed to (default=0.05)')
+    args = parser.parse_args()
+
+    frames = session_frames(args.frames, args.change_rate, args.unsubscribed_rate)
+
+    baseline = run('decode all', frames)
+
+    subscribed = RpdoFilter(dedup=False)
+    for pdid in SUBSCRIBED:
+        subscribed.subscribe(pdid)
+    run('filter unsubscribed', frames, subscribed)
+
+    accept = RpdoFilter(dedup=False)
+    for pdid in SUBSCRIBED:
+        accept.subscribe(pdid)
+    run_accept('accept only', frames, accept)
+
+    dedup = RpdoFilter()
+    for pdid in SUBSCRIBED:
+        dedup.subscribe(pdid)
+    cpu = run('filter + dedup', frames, dedup)
+
+    print('skipped %d frames (%d unchanged, %d unsubscribed), %.0f%% cpu saved' % (
+        dedup.skipped, dedup.unchanged, dedup.unsubscribed, (1 - cpu / baseline) * 100))
+    print()
+
+    run_encode('encode Message.create', args.frames, lambda command, reference, params: Message.create(
+        LOCAL_UUID, BRIDGE_UUID, command, {'reference': reference}, params))
+    run_encode('encode FrameTemplate', args.frames, TemplateCache(LOCAL_UUID, BRIDGE_UUID).create)
+
+
+if __name__ == '__main__':
+    main()
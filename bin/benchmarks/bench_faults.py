@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+"""
+Measure how ComfoConnect recovers from network faults.
+
+The client talks to a simulated bridge (or a real one with --bridge) through a FaultProxy. For every fault we
+report the longest gap in sensor updates, the updates that were lost compared to the rate without faults, the
+reconnects that were needed and how long re-registering the sensors took.
+"""
+
+import argparse
+import time
+
+from common import LOCAL_UUID
+from faultproxy import FaultProxy
+from fakebridge import FakeBridge
+from pycomfoconnect import Bridge, ComfoConnect
+from pycomfoconnect.reconnect import ReconnectPolicy
+from pycomfoconnect.watchdog import Watchdog
+
+SENSORS = [65, 117, 221, 274, 290]
+
+
+class TimedComfoConnect(ComfoConnect):
+    """Remembers when sensor updates arrive and how long re-registering the sensors takes."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.updates = []
+        self.reregistrations = []
+        self.callback_sensor = lambda var, value: self.updates.append(time.monotonic())
+
+    def _reregister_sensors(self):
+        start = time.monotonic()
+        super()._reregister_sensors()
+        if self.sensors:
+            self.reregistrations.append(time.monotonic() - start)
+
+
+def latency(proxy, duration):
+    proxy.latency = 0.05
+    time.sleep(duration)
+
+
+def jitter(proxy, duration):
+    proxy.jitter = 0.1
+    time.sleep(duration)
+
+
+def loss(proxy, duration):
+    proxy.loss = 0.05
+    time.sleep(duration)
+
+
+def fragmentation(proxy, duration):
+    proxy.fragment = 7
+    time.sleep(duration)
+
+
+def drop(proxy, duration):
+    proxy.drop()
+    time.sleep(duration)
+
+
+def reset(proxy, duration):
+    proxy.reset()
+    time.sleep(duration)
+
+
+def stall(proxy, duration):
+    # The bridge stays unreachable for a second, after that the old connection stays half-open
+    proxy.stall(1)
+    time.sleep(duration)
+
+
+FAULTS = [
+    ('none', lambda proxy, duration: time.sleep(duration)),
+    ('latency 50ms', latency),
+    ('jitter 0-100ms', jitter),
+    ('loss 5%', loss),
+    ('fragmentation', fragmentation),
+    ('drop (FIN)', drop),
+    ('reset (RST)', reset),
+    ('half-open stall', stall),
+]
+
+
+def run(comfoconnect, proxy, name, fault, duration, settle):
+    """Inject a fault for duration seconds, and measure until settle seconds after it has been cleared."""
+
+    history = len(comfoconnect.reconnect_policy.history)
+    reregistrations = len(comfoconnect.reregistrations)
+
+    start = time.monotonic()
+    fault(proxy, duration)
+    proxy.clear()
+    time.sleep(settle)
+    end = time.monotonic()
+
+    updates = [start] + [update for update in comfoconnect.updates if start <= update < end] + [end]
+    gap = max(b - a for a, b in zip(updates, updates[1:]))
+
+    attempts = list(comfoconnect.reconnect_policy.history)[history:]
+    reregistered = comfoconnect.reregistrations[reregistrations:]
+
+    return {
+        'name': name,
+        'elapsed': end - start,
+        'received': len(updates) - 2,
+        'gap': gap,
+        'reconnects': len(attempts),
+        'failed': len([attempt for attempt in attempts if not attempt.succeeded]),
+        'reregister': max(reregistered) if reregistered else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the recovery from network faults.')
+    parser.add_argument('--bridge', help='address of a real bridge, a simulated bridge is used by default')
+    parser.add_argument('--pin', type=int, default=0, help='pin of the real bridge (default=0)')
+    parser.add_argument('--interval', type=float, default=0.1,
+                        help='seconds between sensor updates of the simulated bridge (default=0.1)')
+    parser.add_argument('--duration', type=float, default=3, help='seconds to inject every fault (default=3)')
+    parser.add_argument('--settle', type=float, default=5,
+                        help='seconds to keep measuring after a fault (default=5)')
+    parser.add_argument('--stall-timeout', type=float, default=3,
+                        help='seconds of silence before the watchdog reconnects (default=3)')
+    args = parser.parse_args()
+
+    fake = None
+    if args.bridge:
+        bridges = Bridge.discover(args.bridge)
+        if not bridges:
+            raise SystemExit('No bridge found at %s' % args.bridge)
+        target = bridges[0]
+    else:
+        fake = FakeBridge(interval=args.interval).start()
+        target = Bridge(fake.host, fake.uuid, fake.port)
+
+    proxy = FaultProxy(target.host, target.port).start()
+
+    comfoconnect = TimedComfoConnect(
+        Bridge(proxy.host, target.uuid, proxy.port), LOCAL_UUID, pin=args.pin,
+        reconnect_policy=ReconnectPolicy(connect_timeout=2, handshake_timeout=3),
+        watchdog=Watchdog(probe_after=args.stall_timeout / 3, stall_timeout=args.stall_timeout, check_interval=0.1),
+    )
+    comfoconnect.connect(True)
+    for sensor_id in SENSORS:
+        comfoconnect.register_sensor(sensor_id)
+
+    print('%-16s %8s %8s %8s %9s %10s %12s' % (
+        'fault', 'updates', 'lost', 'max gap', 'attempts', 'failed', 'reregister'))
+
+    rate = None
+    for name, fault in FAULTS:
+        result = run(comfoconnect, proxy, name, fault, args.duration, args.settle)
+
+        # The run without faults tells us how many updates to expect
+        if rate is None:
+            rate = result['received'] / result['elapsed']
+        expected = rate * result['elapsed']
+        lost = max(0, 1 - result['received'] / expected) if expected else 0
+
+        print('%-16s %8d %7.1f%% %7.3fs %9d %10d %11.3fs' % (
+            name, result['received'], lost * 100, result['gap'], result['reconnects'], result['failed'],
+            result['reregister']))
+
+    comfoconnect.disconnect()
+    proxy.stop()
+    if fake is not None:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
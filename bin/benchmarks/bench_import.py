@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""
+Measure how long it takes to import pycomfoconnect in a fresh interpreter, with python -X importtime.
+
+Scripts like checkStatus.py and startBoost.py start a new interpreter on every run, so this is paid every time.
+Every scenario is timed a few times, and the median is compared with its budget. Some modules must never be
+imported by a scenario, a script that only sends commands has no use for asyncio. The exit code is 1 when a budget
+is exceeded or a forbidden module was imported, so this can guard against startup regressions.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Name, statement, budget in milliseconds, modules that must not be imported
+SCENARIOS = [
+    ('command script',
+     'from pycomfoconnect import ComfoConnect, Bridge, DiscoveryCache, CMD_FAN_MODE_BOOST_START',
+     100, ['asyncio', 'ssl', 'google.protobuf.descriptor_pb2']),
+    ('asyncio client',
+     'from pycomfoconnect import AsyncBridge, AsyncComfoConnect',
+     150, ['google.protobuf.descriptor_pb2']),
+]
+
+
+def import_times(statement):
+    """Run statement in a new interpreter. Returns the cumulative import time in seconds of every module."""
+
+    env = dict(os.environ, PYTHONPATH=BIN_DIR)
+
+    # We want to measure importing, not compiling
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=env, cwd=BIN_DIR,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = (int(cumulative), len(name) - len(name.lstrip()))
+
+    return times
+
+
+def run(name, statement, budget, forbidden, repeat, startup):
+    # Once to write the bytecode cache
+    import_times(statement)
+
+    totals = []
+    for _ in range(repeat):
+        times = import_times(statement)
+
+        # Everything the statement imported at the top level. Modules that are imported with importlib aren't
+        # reported themselves, only the modules they import.
+        totals.append(sum(cumulative for module, (cumulative, depth) in times.items()
+                          if depth == 1 and module not in startup) / 1e6)
+
+    median = statistics.median(totals)
+    imported = [module for module in forbidden if module in times]
+
+    ok = median * 1000 <= budget and not imported
+    print('%-16s %8.1f ms (min %6.1f ms, budget %4d ms) %s' % (
+        name, median * 1000, min(totals) * 1000, budget, 'ok' if ok else 'FAIL'))
+    if imported:
+        print('%-16s imports %s' % ('', ', '.join(imported)))
+
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the import time of pycomfoconnect against a budget.')
+    parser.add_argument('--repeat', type=int, default=9, help='number of runs per scenario (default=9)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply the budgets, for slower or faster machines (default=1.0)')
+    args = parser.parse_args()
+
+    # What the interpreter imports by itself
+    startup = import_times('pass')
+
+    ok = True
+    for name, statement, budget, forbidden in SCENARIOS:
+        ok = run(name, statement, int(budget * args.scale), forbidden, args.repeat, startup) and ok
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
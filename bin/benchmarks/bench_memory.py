@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+"""
+Measure the memory that is kept alive by retained sensor updates: the decoded Message with and without __slots__,
+and the SensorUpdate record the RPDO path keeps instead.
+
+The frames are received and decoded while tracing, and only what is retained afterwards is counted.
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from common import rpdo_frames
+from pycomfoconnect.message import Message
+from pycomfoconnect.sensorupdate import SensorUpdate
+
+
+class DictMessage(object):
+    """The attributes of a Message in a __dict__, like before Message got __slots__."""
+
+    def __init__(self, message):
+        for name in Message.__slots__:
+            setattr(self, name, getattr(message, name))
+
+
+def retain_messages(count, wrap=None):
+    retained = []
+    for frame in rpdo_frames(count):
+        message = Message.decode(frame, 0.0)
+
+        # Whoever keeps a message has looked at it
+        message.cmd, message.msg, message.src, message.dst
+        retained.append(message if wrap is None else wrap(message))
+
+    return retained
+
+
+def retain_updates(count):
+    return [SensorUpdate.from_message(Message.decode(frame, 0.0)) for frame in rpdo_frames(count)]
+
+
+def run(name, count, retain):
+    gc.collect()
+    tracemalloc.start()
+
+    retained = retain()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.stop()
+    del retained
+
+    print('%-24s %8d updates %10.1f MiB %8.0f bytes/update' % (name, count, size / 2 ** 20, size / count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the memory of retained sensor updates.')
+    parser.add_argument('--updates', type=int, default=100000, help='number of updates (default=100000)')
+    args = parser.parse_args()
+
+    run('Message with __dict__', args.updates, lambda: retain_messages(args.updates, DictMessage))
+    run('Message with __slots__', args.updates, lambda: retain_messages(args.updates))
+    run('SensorUpdate', args.updates, lambda: retain_updates(args.updates))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+"""
+Measure reading ComfoConnect frames out of a pcap or pcapng file, and converting them to a capture file.
+
+Without a file, a synthetic pcap is written first: a session with a bridge where the frames are split over TCP
+segments at random places, and some segments are retransmitted or arrive out of order. The frames that are read back
+are compared with the frames that were written. The peak of traced memory shows that it doesn't grow with the file.
+"""
+
+import argparse
+import os
+import random
+import struct
+import tempfile
+import time
+import tracemalloc
+
+from common import rpdo_frames
+from pycomfoconnect.pcap import PcapReader
+
+BRIDGE_ADDRESS = bytes([192, 168, 1, 50])
+APP_ADDRESS = bytes([192, 168, 1, 20])
+APP_PORT = 50123
+BRIDGE_PORT = 56747
+
+
+def packet(src, dst, src_port, dst_port, seq, flags, payload):
+    """Build an Ethernet frame with an IPv4 packet with a TCP segment, without valid checksums."""
+
+    tcp = struct.pack('>HHLLBBHHH', src_port, dst_port, seq, 0, 5 << 4, flags, 65535, 0, 0) + payload
+    ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0x4000, 64, 6, 0, src, dst) + tcp
+    return b'\x00' * 12 + b'\x08\x00' + ip
+
+
+def synthetic_pcap(path, frames, seed=1):
+    """Write the frames as a session from the bridge, split over segments with some retransmissions and reordering."""
+
+    rng = random.Random(seed)
+    stream = b''.join(frames)
+
+    segments = []
+    seq = 1000
+    segments.append((seq - 1, 0x02, b''))
+    offset = 0
+    while offset < len(stream):
+        size = rng.randint(1, 1460)
+        segments.append((seq + offset, 0x18, stream[offset:offset + size]))
+        offset += size
+
+    packets = []
+    for segment in segments:
+        packets.append(segment)
+        if rng.random() < 0.01:
+            packets.append(segment)
+    for number in range(2, len(packets) - 1):
+        if rng.random() < 0.01:
+            packets[number], packets[number + 1] = packets[number + 1], packets[number]
+    packets.append((seq + len(stream), 0x11, b''))
+
+    with open(path, 'wb') as pcapfile:
+        pcapfile.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for number, (seq, flags, payload) in enumerate(packets):
+            data = packet(BRIDGE_ADDRESS, APP_ADDRESS, BRIDGE_PORT, APP_PORT, seq & 0xffffffff, flags, payload)
+            pcapfile.write(struct.pack('<IIII', 1600000000 + number // 1000, number % 1000 * 1000, len(data),
+                                       len(data)))
+            pcapfile.write(data)
+
+
+def read(path, expected=None):
+    reader = PcapReader(path)
+    start = time.perf_counter()
+
+    count = 0
+    ok = True
+    for frame in reader.frames():
+        if expected is not None and (count >= len(expected) or frame.data != expected[count]):
+            ok = False
+        count += 1
+
+    elapsed = time.perf_counter() - start
+
+    if expected is not None and count != len(expected):
+        ok = False
+
+    size = os.path.getsize(path)
+    print('%-24s %8d frames %8.3f s %10.0f frames/s %8.1f MiB/s%s' % (
+        'read', count, elapsed, count / elapsed, size / elapsed / 2 ** 20,
+        '' if expected is None else (', frames ok' if ok else ', frames MISMATCH')))
+
+
+def peak_memory(path):
+    # Tracing slows everything down, so this is a separate pass
+    tracemalloc.start()
+    for frame in PcapReader(path).frames():
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print('%-24s %8.1f KiB for a %.1f MiB file' % ('peak memory', peak / 1024, os.path.getsize(path) / 2 ** 20))
+
+
+def convert(path, capture_path):
+    start = time.perf_counter()
+    count = PcapReader(path).to_capture(capture_path)
+    elapsed = time.perf_counter() - start
+    print('%-24s %8d frames %8.3f s %10.0f frames/s' % ('convert to capture', count, elapsed, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reading ComfoConnect frames out of pcap files.')
+    parser.add_argument('pcap', nargs='?', help='pcap or pcapng file to read (default=a synthetic pcap)')
+    parser.add_argument('--frames', type=int, default=200000,
+                        help='number of frames of the synthetic pcap (default=200000)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.pcap
+        expected = None
+        if path is None:
+            path = os.path.join(directory, 'bench.pcap')
+            expected = rpdo_frames(args.frames)
+            synthetic_pcap(path, expected)
+
+        read(path, expected)
+        peak_memory(path)
+        convert(path, os.path.join(directory, 'bench.cap'))
+
+
+if __name__ == '__main__':
+    main()
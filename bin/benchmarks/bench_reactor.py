@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+"""
+Compare a thread pair per ComfoConnect with a single shared Reactor for many bridges.
+
+Every bridge is simulated by a FakeBridge that pushes sensor updates at a fixed interval.
+"""
+
+import argparse
+import threading
+import time
+
+from common import LOCAL_UUID
+from fakebridge import FakeBridge
+from pycomfoconnect import Bridge, ComfoConnect, Reactor
+
+
+def client_threads():
+    """Returns the amount of threads that don't belong to the simulated bridges."""
+
+    return len([thread for thread in threading.enumerate() if not thread.name.startswith('fakebridge')])
+
+
+def run(name, bridges, sensors, duration, reactor=None):
+    received = [0]
+
+    def callback_sensor(var, value):
+        received[0] += 1
+
+    threads_before = client_threads()
+
+    clients = []
+    for fake in bridges:
+        comfoconnect = ComfoConnect(Bridge(fake.host, fake.uuid, fake.port), LOCAL_UUID, reactor=reactor)
+        comfoconnect.callback_sensor = callback_sensor
+        comfoconnect.connect(True)
+        for sensor_id in sensors:
+            comfoconnect.register_sensor(sensor_id)
+        clients.append(comfoconnect)
+
+    threads = client_threads() - threads_before
+    time.sleep(duration)
+    updates = received[0]
+
+    for comfoconnect in clients:
+        comfoconnect.disconnect()
+
+    print('%-10s %4d bridges %4d client threads %8d updates %8.0f updates/s' % (
+        name, len(bridges), threads, updates, updates / duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark threads versus a shared reactor.')
+    parser.add_argument('--bridges', type=int, default=20, help='number of simulated bridges (default=20)')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between sensor updates (default=0.05)')
+    parser.add_argument('--duration', type=float, default=5, help='seconds to measure (default=5)')
+    args = parser.parse_args()
+
+    sensors = [65, 117, 221, 274, 290]
+    bridges = [FakeBridge(interval=args.interval).start() for _ in range(args.bridges)]
+
+    run('threads', bridges, sensors, args.duration)
+
+    reactor = Reactor()
+    run('reactor', bridges, sensors, args.duration, reactor)
+    reactor.stop()
+
+    for fake in bridges:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
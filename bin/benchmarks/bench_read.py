@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""
+Compare the legacy one-frame-per-select read path with Bridge.read_messages().
+
+A sender thread pushes bursts of CnRpdoNotification frames over a socketpair, and the reader
+drains them either one frame per select (like the old Bridge.read_message) or in batches.
+"""
+
+import argparse
+import select
+import socket
+import struct
+import threading
+import time
+
+from common import BRIDGE_UUID, rpdo_frames, report
+from pycomfoconnect.bridge import Bridge
+from pycomfoconnect.message import Message
+from pycomfoconnect.recorder import FlightRecorder
+
+
+def legacy_read_message(sock, timeout=1):
+    """The read path as it was before the receive buffer: select, recv(4), recv(msg_len)."""
+
+    ready = select.select([sock], [], [], timeout)
+    if not ready[0]:
+        return None
+
+    msg_len_buf = sock.recv(4)
+    msg_len = struct.unpack('>L', msg_len_buf)[0]
+    msg_buf = sock.recv(msg_len)
+
+    return Message.decode(msg_len_buf + msg_buf)
+
+
+def sender(sock, frames, burst):
+    """Send the frames in bursts of burst frames."""
+
+    for i in range(0, len(frames), burst):
+        sock.sendall(b''.join(frames[i:i + burst]))
+    sock.shutdown(socket.SHUT_WR)
+
+
+def run(name, frames, burst, reader):
+    rx, tx = socket.socketpair()
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    rx.setblocking(0)
+
+    thread = threading.Thread(target=sender, args=(tx, frames, burst))
+    start = time.perf_counter()
+    thread.start()
+    received = reader(rx, len(frames))
+    elapsed = time.perf_counter() - start
+    thread.join()
+
+    rx.close()
+    tx.close()
+
+    assert received == len(frames), '%s: received %d of %d frames' % (name, received, len(frames))
+    report(name, received, elapsed)
+
+
+def read_legacy(sock, count):
+    received = 0
+    while received < count:
+        if legacy_read_message(sock):
+            received += 1
+    return received
+
+
+def read_single(sock, count):
+    bridge = Bridge('127.0.0.1', BRIDGE_UUID)
+    bridge._socket = sock
+
+    received = 0
+    while received < count:
+        if bridge.read_message():
+            received += 1
+    return received
+
+
+def read_batched(sock, count, recorder=None):
+    bridge = Bridge('127.0.0.1', BRIDGE_UUID)
+    bridge._socket = sock
+    bridge.recorder = recorder
+
+    received = 0
+    while received < count:
+        received += len(bridge.read_messages())
+    return received
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Bridge read path.')
+    parser.add_argument('--frames', type=int, default=100000, help='number of frames to send (default=100000)')
+    parser.add_argument('--burst', type=int, default=50, help='frames per burst (default=50)')
+    args = parser.parse_args()
+
+    frames = rpdo_frames(args.frames)
+
+    run('legacy (select per frame)', frames, args.burst, read_legacy)
+    run('Bridge.read_message', frames, args.burst, read_single)
+    run('Bridge.read_messages', frames, args.burst, read_batched)
+    run('read_messages + recorder', frames, args.burst,
+        lambda sock, count: read_batched(sock, count, FlightRecorder()))
+
+
+if __name__ == '__main__':
+    main()
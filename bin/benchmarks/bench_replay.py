@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+"""
+Replay a capture through a ComfoConnect, and report the frames per second and the latency of every stage.
+
+Without a capture, a synthetic one with sensor updates at a fixed rate is written first. Replaying the same capture
+before and after a change to the decoding or dispatching of messages shows what the change does to real traffic.
+"""
+
+import argparse
+import os
+import tempfile
+
+from common import BRIDGE_UUID, LOCAL_UUID, rpdo_frames
+from pycomfoconnect import Bridge, ComfoConnect, Reactor, RpdoFilter
+from pycomfoconnect.capture import CaptureWriter
+from pycomfoconnect.recorder import RX
+from pycomfoconnect.replay import Replayer
+
+
+def synthetic_capture(path, count, rate):
+    """Write a capture of count sensor updates that arrived at rate frames per second."""
+
+    with CaptureWriter(path) as capture:
+        for number, frame in enumerate(rpdo_frames(count)):
+            capture.write_frames(RX, [frame], number / rate, kernel_time=True)
+
+
+def run(name, path, speed, reactor=None, rpdo_filter=None):
+    received = [0]
+
+    def callback_sensor(var, value):
+        received[0] += 1
+
+    comfoconnect = ComfoConnect(Bridge('127.0.0.1', BRIDGE_UUID, timestamps=True), LOCAL_UUID, reactor=reactor,
+                                rpdo_filter=rpdo_filter)
+    comfoconnect.callback_sensor = callback_sensor
+
+    stats = Replayer(comfoconnect, speed).run(path)
+
+    print('%s, %d callbacks' % (name, received[0]))
+    print(stats.summary())
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark replaying a capture through a ComfoConnect.')
+    parser.add_argument('capture', nargs='?', help='capture file to replay (default=a synthetic capture)')
+    parser.add_argument('--frames', type=int, default=100000,
+                        help='number of frames of the synthetic capture (default=100000)')
+    parser.add_argument('--rate', type=float, default=50,
+                        help='frames per second of the synthetic capture (default=50)')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='times faster than real time, 1 for real time, 0 for as fast as possible (default=0)')
+    args = parser.parse_args()
+
+    speed = args.speed or None
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.capture
+        if path is None:
+            path = os.path.join(directory, 'replay.cap')
+            synthetic_capture(path, args.frames, args.rate)
+
+        run('message thread', path, speed)
+        run('message thread + RpdoFilter', path, speed, rpdo_filter=RpdoFilter())
+
+        reactor = Reactor()
+        try:
+            run('reactor', path, speed, reactor=reactor)
+        finally:
+            reactor.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Shared helpers for the pycomfoconnect benchmarks.
+"""
+
+import os
+import sys
+
+# Make the pycomfoconnect package importable when running from the benchmarks folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pycomfoconnect.message import Message  # noqa: E402
+from pycomfoconnect.zehnder_pb2 import GatewayOperation, CnRpdoNotification  # noqa: E402
+
+LOCAL_UUID = bytes.fromhex('00000000000000000000000000001337')
+BRIDGE_UUID = bytes.fromhex('0000000000251010800170b3d54264b4')
+
+
+def rpdo_frame(reference, pdid, data):
+    """Build the raw bytes of a CnRpdoNotification like the bridge sends them."""
+
+    cmd = GatewayOperation()
+    cmd.type = GatewayOperation.CnRpdoNotificationType
+    cmd.reference = reference
+
+    msg = CnRpdoNotification()
+    msg.pdid = pdid
+    msg.data = data
+
+    return Message(cmd, msg, BRIDGE_UUID, LOCAL_UUID).encode()
+
+
+def rpdo_frames(count):
+    """Build a list of count CnRpdoNotification frames for a handful of sensors."""
+
+    sensors = [(65, b'\x02'), (117, b'\x1e'), (221, b'\xf0\x00'), (274, b'\xd2\x00'), (290, b'\x37')]
+
+    return [rpdo_frame(i + 1, *sensors[i % len(sensors)]) for i in range(count)]
+
+
+def report(name, count, elapsed):
+    """Print a single benchmark result line."""
+
+    print('%-32s %8d frames %8.3f s %10.0f frames/s' % (name, count, elapsed, count / elapsed))
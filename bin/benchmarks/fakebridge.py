@@ -0,0 +1,158 @@
+"""
+A simulated ComfoConnect LAN C bridge for the benchmarks.
+
+It accepts sessions, confirms the requests pycomfoconnect sends, and pushes a CnRpdoNotification for every
+registered sensor at a fixed interval.
+"""
+
+import socket
+import struct
+import threading
+import time
+
+from common import BRIDGE_UUID
+from pycomfoconnect.message import Message
+from pycomfoconnect.zehnder_pb2 import *
+
+# Replies for the requests we know, with the fields we fill in
+REPLIES = {
+    StartSessionRequest: (StartSessionConfirm, {}),
+    CloseSessionRequest: (CloseSessionConfirm, {}),
+    RegisterAppRequest: (RegisterAppConfirm, {}),
+    VersionRequest: (VersionConfirm, {'gatewayVersion': 1049600, 'serialNumber': 'DEM0123456789',
+                                      'comfoNetVersion': 1073750016}),
+    CnTimeRequest: (CnTimeConfirm, {'currentTime': 0}),
+    CnRmiRequest: (CnRmiResponse, {'message': b''}),
+    CnRpdoRequest: (CnRpdoConfirm, {}),
+}
+
+
+class FakeBridge(object):
+    """Serves one session at a time on a local TCP port."""
+
+    def __init__(self, host='127.0.0.1', port=0, uuid=BRIDGE_UUID, interval=1.0):
+        self.uuid = uuid
+        self.interval = interval
+        self.notifications = 0
+
+        # Result of every CnRpdoConfirm, like GatewayOperation.NOT_EXIST for a bridge that refuses the sensors
+        self.rpdo_result = None
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(4)
+        self.host, self.port = self._server.getsockname()
+
+        self._stopping = False
+        self._sessions = []
+        self._thread = threading.Thread(target=self._accept_loop, name='fakebridge-accept')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping = True
+        self._server.close()
+        for conn in list(self._sessions):
+            self._close(conn)
+
+    def drop_sessions(self):
+        """Close all open sessions, like a bridge that reboots."""
+
+        for conn in list(self._sessions):
+            self._close(conn)
+
+    def _close(self, conn):
+        if conn in self._sessions:
+            self._sessions.remove(conn)
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.close()
+
+    def _accept_loop(self):
+        while not self._stopping:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+
+            # The bridge only allows a single session
+            self.drop_sessions()
+            self._sessions.append(conn)
+
+            thread = threading.Thread(target=self._session_loop, args=(conn,), name='fakebridge-session')
+            thread.daemon = True
+            thread.start()
+
+    def _session_loop(self, conn):
+        subscriptions = {}
+        lock = threading.Lock()
+        reference = [0]
+
+        def send(command, local_uuid, params, cmd_params):
+            with lock:
+                message = Message.create(self.uuid, local_uuid, command, cmd_params, params)
+                conn.sendall(message.encode())
+
+        def notify():
+            value = 0
+            while conn in self._sessions:
+                time.sleep(self.interval)
+                value += 1
+                try:
+                    for pdid, local_uuid in list(subscriptions.items()):
+                        reference[0] += 1
+                        send(CnRpdoNotification, local_uuid, {'pdid': pdid, 'data': struct.pack('<h', value)},
+                             {'reference': reference[0]})
+                        self.notifications += 1
+                except OSError:
+                    return
+
+        notifier = threading.Thread(target=notify, name='fakebridge-notify')
+        notifier.daemon = True
+        notifier.start()
+
+        try:
+            while True:
+                header = self._recv_exactly(conn, 4)
+                if header is None:
+                    break
+                body = self._recv_exactly(conn, struct.unpack('>L', header)[0])
+                if body is None:
+                    break
+
+                message = Message.decode(header + body)
+                command = message.msg.__class__
+
+                if command is CnRpdoRequest:
+                    subscriptions[message.msg.pdid] = message.src
+
+                if command in REPLIES:
+                    reply, params = REPLIES[command]
+                    cmd_params = {'reference': message.cmd.reference}
+                    if command is CnRpdoRequest and self.rpdo_result is not None:
+                        cmd_params['result'] = self.rpdo_result
+                    send(reply, message.src, params, cmd_params)
+
+                if command is CloseSessionRequest:
+                    break
+
+        except OSError:
+            pass
+
+        self._close(conn)
+
+    @staticmethod
+    def _recv_exactly(conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
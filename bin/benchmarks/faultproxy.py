@@ -0,0 +1,216 @@
+"""
+A TCP proxy that injects network faults between pycomfoconnect and a bridge.
+
+Point the client at the proxy instead of the bridge, and change the fault settings while it runs:
+
+* latency and jitter delay every chunk of data by latency + random(0, jitter) seconds.
+* loss holds back a chunk for retransmit_delay seconds with this probability, like a lost TCP segment.
+* fragment splits every chunk in random pieces of at most this many bytes, that are sent separately.
+* drop() closes all connections with a FIN, reset() with a RST.
+* stall() silently discards all traffic of the open connections, like a peer that has vanished.
+"""
+
+import collections
+import random
+import socket
+import struct
+import threading
+import time
+
+
+class _Link(object):
+    """A client connection and its connection to the target."""
+
+    def __init__(self, client, upstream):
+        self.client = client
+        self.upstream = upstream
+        self.blackholed = False
+        self.closed = False
+
+
+class FaultProxy(object):
+    """Forwards TCP connections to a target and injects faults."""
+
+    def __init__(self, target_host, target_port, host='127.0.0.1', port=0):
+        self.target = (target_host, target_port)
+
+        # Fault settings, they can be changed at any time
+        self.latency = 0
+        self.jitter = 0
+        self.loss = 0
+        self.retransmit_delay = 0.2
+        self.fragment = 0
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(4)
+        self.host, self.port = self._server.getsockname()
+
+        self._stopping = False
+        self._stalled_until = 0
+        self._links = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._accept_loop, name='faultproxy-accept')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping = True
+        self._server.close()
+        self.drop()
+
+    def clear(self):
+        """Stop injecting faults."""
+
+        self.latency = 0
+        self.jitter = 0
+        self.loss = 0
+        self.fragment = 0
+        self._stalled_until = 0
+
+    def drop(self):
+        """Close all connections gracefully."""
+
+        for link in self._take_links():
+            self._close(link)
+
+    def reset(self):
+        """Abort all connections, both sides receive a RST."""
+
+        for link in self._take_links():
+            for sock in (link.client, link.upstream):
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                except OSError:
+                    pass
+            self._close(link)
+
+    def stall(self, duration=None):
+        """Blackhole the open connections. New connections are blackholed too during duration seconds."""
+
+        if duration is not None:
+            self._stalled_until = time.monotonic() + duration
+
+        with self._lock:
+            for link in self._links:
+                link.blackholed = True
+
+    def _take_links(self):
+        with self._lock:
+            links = self._links
+            self._links = []
+
+        return links
+
+    def _close(self, link):
+        link.closed = True
+        for sock in (link.client, link.upstream):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def _accept_loop(self):
+        while not self._stopping:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+
+            try:
+                upstream = socket.create_connection(self.target, timeout=5)
+            except OSError:
+                client.close()
+                continue
+
+            for sock in (client, upstream):
+                sock.settimeout(None)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            link = _Link(client, upstream)
+            link.blackholed = time.monotonic() < self._stalled_until
+            with self._lock:
+                self._links.append(link)
+
+            for src, dst, name in ((client, upstream, 'up'), (upstream, client, 'down')):
+                self._start_pipe(link, src, dst, name)
+
+    def _start_pipe(self, link, src, dst, name):
+        """Start a reader and a writer thread, so delays don't hold back the reading."""
+
+        pending = collections.deque()
+        ready = threading.Condition()
+
+        reader = threading.Thread(target=self._read_loop, args=(link, src, pending, ready),
+                                  name='faultproxy-%s-read' % name)
+        writer = threading.Thread(target=self._write_loop, args=(link, dst, pending, ready),
+                                  name='faultproxy-%s-write' % name)
+        for thread in (reader, writer):
+            thread.daemon = True
+            thread.start()
+
+    def _read_loop(self, link, src, pending, ready):
+        last_due = 0
+        while True:
+            try:
+                data = src.recv(65536)
+            except OSError:
+                data = b''
+
+            if link.blackholed and data:
+                continue
+
+            # Keep the order of the stream, a chunk is never delivered before the previous one
+            due = time.monotonic() + self.latency + random.uniform(0, self.jitter)
+            if self.loss and random.random() < self.loss:
+                due += self.retransmit_delay
+            last_due = max(last_due, due)
+
+            with ready:
+                pending.append((last_due, data))
+                ready.notify()
+
+            if not data:
+                return
+
+    def _write_loop(self, link, dst, pending, ready):
+        while True:
+            with ready:
+                while not pending:
+                    ready.wait()
+                due, data = pending.popleft()
+
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            if not data:
+                # The other side has closed the connection
+                if not link.closed:
+                    with self._lock:
+                        if link in self._links:
+                            self._links.remove(link)
+                    self._close(link)
+                return
+
+            if link.blackholed:
+                continue
+
+            fragment = self.fragment
+            try:
+                if fragment:
+                    offset = 0
+                    while offset < len(data):
+                        size = random.randint(1, fragment)
+                        dst.sendall(data[offset:offset + size])
+                        offset += size
+                        time.sleep(0.0005)
+                else:
+                    dst.sendall(data)
+            except OSError:
+                return
@@ -6,6 +6,8 @@ import socket
 import sys, os
 from pycomfoconnect import ComfoConnect
 from pycomfoconnect import Bridge
+from pycomfoconnect import DiscoveryCache
+from pycomfoconnect import FlightRecorder
 from pycomfoconnect import SENSOR_TEMPERATURE_SUPPLY
 from pycomfoconnect import SENSOR_TEMPERATURE_EXHAUST
 from pycomfoconnect import SENSOR_TEMPERATURE_EXTRACT
@@ -45,7 +47,7 @@ local_name = 'Loxberry'
 local_uuid = bytes.fromhex('00000000000000000000000000000005')
 
 
-def bridge_discovery(ip):
+def bridge_discovery(ip, cache):
     ## Bridge discovery ################################################################################################
 
     # Method 1: Use discovery to initialise Bridge
@@ -55,12 +57,8 @@ def bridge_discovery(ip):
     # else:
     #     bridge = None
 
-    # Method 2: Use direct discovery to initialise Bridge
-    bridges = Bridge.discover(ip)
-    if bridges:
-        bridge = bridges[0]
-    else:
-        bridge = None
+    # Method 2: Use direct discovery to initialise Bridge, unless we already know the bridge from a previous run
+    bridge = cache.discover(ip)
 
     # Method 3: Setup bridge manually
     # bridge = Bridge(args.ip, bytes.fromhex('0000000000251010800170b3d54264b4'))
@@ -106,12 +104,17 @@ def main(args):
     global miniserverIP 
     miniserverIP = pluginconfig.get('ZehnderCtrl', 'miniserverIP')
     
-    # Discover the bridge
-    bridge = bridge_discovery(zehnderIP)
+    # Discover the bridge, the discovery cache lives next to the plugin config
+    cache = DiscoveryCache(os.path.join(os.path.dirname(os.path.abspath(args.configfile)), 'discoverycache.json'))
+    bridge = bridge_discovery(zehnderIP, cache)
 
     ## Setup a Comfoconnect session  ###################################################################################
 
-    comfoconnect = ComfoConnect(bridge, local_uuid, local_name, pin)
+    # The last frames on the wire are written next to the plugin config when the connection breaks
+    recorder = FlightRecorder(path=os.path.join(os.path.dirname(os.path.abspath(args.configfile)),
+                                                'comfoconnect-{timestamp}.flt'))
+
+    comfoconnect = ComfoConnect(bridge, local_uuid, local_name, pin, discovery_cache=cache, recorder=recorder)
     comfoconnect.callback_sensor = callback_sensor
 
     try:
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Change a module generated by protoc so that its message classes are created when they are first used.
+
+protoc creates every message class when the module is imported, and most scripts only need a few of them. Run this
+every time zehnder_pb2.py is generated again:
+
+    protoc --python_out=../pycomfoconnect zehnder.proto
+    ./lazy_pb2.py ../pycomfoconnect/zehnder_pb2.py
+
+Only the end of the module is replaced, the descriptors are kept as protoc wrote them. Running it twice on the same
+module changes nothing.
+"""
+
+import argparse
+import re
+import sys
+
+MARKER = '# Changed by protobuf/lazy_pb2.py'
+
+HEADER = '''%s: the message classes are created lazily at the end of this file. Run it again
+# every time this file is generated.
+''' % MARKER
+
+LAZY_CLASSES = '''# The message classes are created when they are first used, see __getattr__ below. Creating all of them takes
+# longer than most scripts need the bridge for.
+_classes = {}
+_classes_lock = threading.RLock()
+
+__all__ = ['DESCRIPTOR'] + list(DESCRIPTOR.message_types_by_name)
+
+
+def _message_class(descriptor):
+  """Returns the class of a message type. It's created together with its nested types and the types it refers to."""
+
+  with _classes_lock:
+    cls = _classes.get(descriptor.full_name)
+    if cls is None:
+      attributes = dict(DESCRIPTOR=descriptor, __module__=%(module)r)
+      for nested_type in descriptor.nested_types:
+        attributes[nested_type.name] = _message_class(nested_type)
+
+      cls = _reflection.GeneratedProtocolMessageType(descriptor.name, (_message.Message,), attributes)
+      _classes[descriptor.full_name] = cls
+      _sym_db.RegisterMessage(cls)
+
+      for field in descriptor.fields:
+        if field.message_type is not None:
+          _message_class(field.message_type)
+
+  return cls
+
+
+def __getattr__(name):
+  descriptor = DESCRIPTOR.message_types_by_name.get(name)
+  if descriptor is None:
+    raise AttributeError("module %%r has no attribute %%r" %% (__name__, name))
+
+  cls = globals()[name] = _message_class(descriptor)
+  return cls
+
+
+'''
+
+# The first message class protoc creates, up to the end of the module
+CLASSES_RE = re.compile(r"^\w+ = _reflection\.GeneratedProtocolMessageType\("
+                        r".*?(?=^# @@protoc_insertion_point\(module_scope\))", re.MULTILINE | re.DOTALL)
+MODULE_RE = re.compile(r"^  __module__ = '([\w.]+)'$", re.MULTILINE)
+
+
+def make_lazy(source) -> str:
+    """Returns the source of a module generated by protoc, with lazily created message classes."""
+
+    if MARKER in source:
+        return source
+
+    module = MODULE_RE.search(source)
+    classes = CLASSES_RE.search(source)
+    if module is None or classes is None:
+        raise Exception('This does not look like a module generated by protoc.')
+
+    source = source[:classes.start()] + LAZY_CLASSES % {'module': module.group(1)} + source[classes.end():]
+
+    # protoc imports descriptor_pb2 even when no options need it, and it's slow to import
+    if 'descriptor_pb2.' not in source:
+        source = source.replace('from google.protobuf import descriptor_pb2\n', '', 1)
+    source = source.replace('import sys\n', 'import sys\nimport threading\n', 1)
+
+    # After the comment with the name of the .proto file
+    header, _, rest = source.partition('\n\n')
+    return header + '\n#\n' + HEADER + '\n' + rest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the message classes of a protoc generated module lazily.')
+    parser.add_argument('module', help='the _pb2.py module to change in place')
+    args = parser.parse_args()
+
+    with open(args.module) as module:
+        source = module.read()
+
+    try:
+        lazy = make_lazy(source)
+    except Exception as exc:
+        print('%s: %s' % (args.module, exc), file=sys.stderr)
+        return 1
+
+    if lazy != source:
+        with open(args.module, 'w') as module:
+            module.write(lazy)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
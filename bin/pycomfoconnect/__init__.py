@@ -8,6 +8,34 @@ DEFAULT_PIN = 0
 
 __author__ = 'Michaël Arnauts <michael.arnauts@gmail.com>'
 
+import importlib
+
 from .comfoconnect import *
 from .error import *
-from .const import *
\ No newline at end of file
+from .const import *
+
+# Imported when they are first used, so scripts that don't need them don't pay for asyncio
+_LAZY_IMPORTS = {
+    'AsyncBridge': 'aio',
+    'AsyncComfoConnect': 'aio',
+    'LivenessMonitor': 'liveness',
+}
+
+# A star import gets everything, like before the lazy imports
+__all__ = [name for name in globals() if not name.startswith('_') and name != 'importlib'] + \
+    list(_LAZY_IMPORTS) + [name for name in zehnder_pb2.__all__ if name not in globals()]
+
+
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    # Message classes are looked up in zehnder_pb2, that also creates them on first use
+    module = importlib.import_module('.' + _LAZY_IMPORTS.get(name, 'zehnder_pb2'), __name__)
+    try:
+        value = getattr(module, name)
+    except AttributeError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name)) from None
+
+    globals()[name] = value
+    return value
@@ -0,0 +1,701 @@
+import asyncio
+import logging
+import time
+
+from .bridge import Bridge, ReceiveBuffer, set_keepalive
+from .comfoconnect import DEFAULT_LOCAL_UUID, DEFAULT_LOCAL_DEVICENAME, DEFAULT_PIN, KEEPALIVE, RPDO_TYPE_MAP
+from .error import *
+from .message import Message, TemplateCache
+from .reconnect import ReconnectPolicy
+from .recorder import RX, TX, FlightRecorder
+from .rpdofilter import RpdoFilter
+from .sensorupdate import SensorUpdate
+from .watchdog import Watchdog
+from .zehnder_pb2 import CloseSessionRequest, CnRmiRequest, CnRpdoRequest, CnTimeRequest, DeregisterAppRequest, \
+    GatewayOperation, KeepAlive, ListRegisteredAppsRequest, RegisterAppRequest, StartSessionRequest, VersionRequest
+
+_LOGGER = logging.getLogger('aio')
+
+
+class BridgeProtocol(asyncio.BufferedProtocol):
+    """Splits the stream of a bridge connection in messages."""
+
+    def __init__(self, bridge):
+        self._bridge = bridge
+        self._buffer = ReceiveBuffer(Bridge.RECV_SIZE)
+        self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def get_buffer(self, sizehint):
+        return self._buffer.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        self._bridge.last_received = time.monotonic()
+        self._buffer.commit(nbytes)
+
+        # The event loop doesn't give us kernel timestamps, this is the closest we get to the arrival of the data
+        received = time.time()
+
+        frame_filter = self._bridge.frame_filter
+
+        frames = self._buffer.frames()
+        if self._bridge.recorder is not None or self._bridge.capture is not None:
+            frames = list(frames)
+            if self._bridge.recorder is not None:
+                self._bridge.recorder.record_frames(RX, frames, received)
+            if self._bridge.capture is not None:
+                self._bridge.capture.write_frames(RX, frames, received)
+
+        for frame in frames:
+            if frame_filter is not None and not frame_filter(frame):
+                continue
+
+            # Decode message
+            message = Message.decode(frame, received)
+
+            # Debug message
+            _LOGGER.debug("RX %s", message)
+
+            self._bridge.on_message(message)
+
+    def connection_lost(self, exc):
+        self._bridge._connection_lost(self._transport, exc)
+
+
+class AsyncBridge(object):
+    """Implements an asyncio interface to send and receive messages from the Bridge."""
+
+    def __init__(self, host: str, uuid: str, port: int = Bridge.PORT) -> None:
+        self.host = host
+        self.uuid = uuid
+        self.port = port
+
+        self._transport = None
+        self.last_received = 0
+
+        # Optional function that gets the raw bytes of every frame, and returns False to drop it before decoding
+        self.frame_filter = None
+
+        # Optional FlightRecorder that keeps the last frames we have sent and received
+        self.recorder = None
+
+        # Optional CaptureWriter that stores every frame we send and receive
+        self.capture = None
+
+        # Invoked with every message we receive, and when the connection is lost
+        self.on_message = lambda message: None
+        self.on_connection_lost = lambda exc: None
+
+    @classmethod
+    def from_bridge(cls, bridge: Bridge):
+        """Create an AsyncBridge for a Bridge, for example one that was found by Bridge.discover()."""
+
+        return cls(bridge.host, bridge.uuid, bridge.port)
+
+    async def connect(self, timeout=None) -> bool:
+        """Open connection to the bridge. Raises asyncio.TimeoutError when the bridge doesn't answer on time."""
+
+        if self._transport is None:
+            loop = asyncio.get_running_loop()
+            self._transport, _ = await asyncio.wait_for(
+                loop.create_connection(lambda: BridgeProtocol(self), self.host, self.port),
+                timeout
+            )
+            self.last_received = time.monotonic()
+
+        return True
+
+    def set_keepalive(self, idle, interval, count, user_timeout=None):
+        """Let the kernel probe the connection when it's idle, see Bridge.set_keepalive()."""
+
+        if self._transport is not None:
+            set_keepalive(self._transport.get_extra_info('socket'), idle, interval, count, user_timeout)
+
+    def disconnect(self) -> bool:
+        """Close connection to the bridge."""
+
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+        return True
+
+    def abort(self):
+        """Drop the connection without waiting for unsent data, since a stalled connection would never flush it."""
+
+        if self._transport is not None:
+            self._transport.abort()
+            self._transport = None
+
+    def is_connected(self):
+        """Returns whether there is an open connection."""
+
+        return self._transport is not None
+
+    def write_message(self, message: Message) -> bool:
+        """Send a message."""
+
+        return self.write_messages([message])
+
+    def write_messages(self, messages) -> bool:
+        """Send several messages at once."""
+
+        if self._transport is None:
+            raise Exception('Not connected!')
+
+        recorder, capture = self.recorder, self.capture
+        now = time.time()
+
+        # Collect the parts of all packets
+        buffers = []
+        for message in messages:
+            parts = message.encode_parts()
+            buffers.extend(parts)
+
+            if recorder is not None:
+                recorder.record_parts(TX, parts, now)
+            if capture is not None:
+                capture.write_parts(TX, parts, now)
+
+            # Debug message
+            _LOGGER.debug("TX %s", message)
+
+        self._transport.writelines(buffers)
+
+        return True
+
+    def _connection_lost(self, transport, exc):
+        if self._transport is not None and self._transport is not transport:
+            # An old connection that we closed ourselves, we are connected again already
+            return
+
+        self._transport = None
+        self.on_connection_lost(exc)
+
+
+class AsyncComfoConnect(object):
+    """Implements the commands to communicate with the ComfoConnect ventilation unit as coroutines.
+
+    Pass a FlightRecorder with a path as recorder to keep the last frames on the wire, and have them written to a
+    file when the connection breaks or the bridge stops answering. Without one, nothing is recorded.
+    """
+
+    """Callback function to invoke when sensor updates are received."""
+    callback_sensor = None
+
+    """Callback function to invoke with the SensorUpdate of every sensor update that is received."""
+    callback_update = None
+
+    def __init__(self, bridge: AsyncBridge, local_uuid=DEFAULT_LOCAL_UUID, local_devicename=DEFAULT_LOCAL_DEVICENAME,
+                 pin=DEFAULT_PIN, reconnect_policy: ReconnectPolicy = None, watchdog: Watchdog = None,
+                 rpdo_filter: RpdoFilter = None, recorder: FlightRecorder = None):
+        self._bridge = bridge
+        self._local_uuid = local_uuid
+        self._local_devicename = local_devicename
+        self._pin = pin
+        self._reference = 1
+
+        # Pre-encoded frames of the commands we send
+        self._templates = TemplateCache(local_uuid, bridge.uuid)
+
+        # Replies we are waiting for, by reference
+        self._pending = {}
+        self._running = False
+        self._keepalive_task = None
+        self._watchdog_task = None
+        self._reconnect_task = None
+        self._subscribers = []
+
+        # Deadlines and backoff for (re)connecting, and the history of reconnect attempts
+        self.reconnect_policy = reconnect_policy or ReconnectPolicy()
+
+        # Detects a connection that silently stopped delivering messages
+        self.watchdog = watchdog or Watchdog()
+
+        # Optional RpdoFilter that drops sensor updates we don't need before they are decoded
+        self.rpdo_filter = rpdo_filter
+        if rpdo_filter is not None:
+            self._bridge.frame_filter = rpdo_filter.accept
+
+        # Optional FlightRecorder that keeps the last frames on the wire, and dumps them when something goes wrong
+        self.recorder = recorder
+        self._bridge.recorder = self.recorder
+
+        self._bridge.on_message = self._handle_message
+        self._bridge.on_connection_lost = self._connection_lost
+
+        self.sensors = {}
+
+        # The last SensorUpdate of every sensor
+        self.last_updates = {}
+
+    @property
+    def sensor_received(self) -> dict:
+        """Wall clock time the last update of every sensor arrived."""
+
+        return dict((pdid, update.received) for pdid, update in self.last_updates.items())
+
+    # ==================================================================================================================
+    # Core functions
+    # ==================================================================================================================
+
+    async def connect(self, takeover=False):
+        """Connect to the bridge and login. Disconnect existing clients if needed by default."""
+
+        try:
+            # Start connection
+            await self._connect(takeover=takeover)
+
+        except PyComfoConnectNotAllowed:
+            raise Exception('Could not connect to the bridge since the PIN seems to be invalid.')
+
+        except PyComfoConnectOtherSession:
+            raise Exception('Could not connect to the bridge since there is already an open session.')
+
+        except Exception as exc:
+            _LOGGER.error(exc)
+            raise Exception('Could not connect to the bridge.')
+
+        self._running = True
+        await self._start_session()
+
+        return True
+
+    async def disconnect(self):
+        """Disconnect from the bridge."""
+
+        self._running = False
+
+        for task in (self._keepalive_task, self._watchdog_task, self._reconnect_task):
+            if task is not None:
+                task.cancel()
+        self._keepalive_task = None
+        self._watchdog_task = None
+        self._reconnect_task = None
+
+        self._bridge.disconnect()
+
+    def is_connected(self):
+        """Returns whether there is a connection with the bridge."""
+
+        return self._bridge.is_connected()
+
+    async def register_sensor(self, sensor_id: int, sensor_type: int = None):
+        """Register a sensor on the bridge and keep it in memory that we are registered to this sensor."""
+
+        if not sensor_type:
+            sensor_type = RPDO_TYPE_MAP.get(sensor_id)
+
+        if sensor_type is None:
+            raise Exception("Registering sensor %d with unknown type" % sensor_id)
+
+        # Let the updates through before the bridge starts sending them
+        if self.rpdo_filter is not None:
+            self.rpdo_filter.subscribe(sensor_id)
+
+        # Register on bridge
+        try:
+            reply = await self.cmd_rpdo_request(sensor_id, sensor_type)
+
+        except PyComfoConnectNotAllowed:
+            if self.rpdo_filter is not None:
+                self.rpdo_filter.unsubscribe(sensor_id)
+            return None
+
+        # Register in memory
+        self.sensors[sensor_id] = sensor_type
+
+        return reply
+
+    async def unregister_sensor(self, sensor_id: int, sensor_type: int = None):
+        """Unregister a sensor on the bridge and forget that we are registered to this sensor."""
+
+        if sensor_type is None:
+            sensor_type = RPDO_TYPE_MAP.get(sensor_id)
+
+        if sensor_type is None:
+            raise Exception("Unregistering sensor %d with unknown type" % sensor_id)
+
+        # Unregister in memory
+        self.sensors.pop(sensor_id, None)
+        if self.rpdo_filter is not None:
+            self.rpdo_filter.unsubscribe(sensor_id)
+
+        # Unregister on bridge
+        await self.cmd_rpdo_request(sensor_id, sensor_type, timeout=0)
+
+    async def sensor_updates(self):
+        """Yields a (sensor_id, value) tuple for every sensor update that is received."""
+
+        updates = asyncio.Queue()
+        self._subscribers.append(updates)
+        try:
+            while True:
+                yield await updates.get()
+        finally:
+            self._subscribers.remove(updates)
+
+    def _create_message(self, command, params=None):
+        """Construct a message with the next reference. Commands we have sent before aren't serialized again."""
+
+        message = self._templates.create(command, self._reference, params)
+
+        # Increase message reference
+        self._reference += 1
+
+        return message
+
+    async def _command(self, command, params=None, timeout=5):
+        """Sends a command and wait for a response if the request is known to return a result."""
+
+        # Construct the message
+        reference = self._reference
+        message = self._create_message(command, params)
+
+        # Check if this command has a confirm type set
+        confirm_type = Message.class_to_confirm.get(command)
+        if confirm_type is None:
+            self._bridge.write_message(message)
+            return None
+
+        reply = asyncio.get_running_loop().create_future()
+        self._pending[reference] = (confirm_type, reply)
+
+        try:
+            # Send the message
+            self._bridge.write_message(message)
+
+            return await asyncio.wait_for(reply, timeout)
+
+        except asyncio.TimeoutError:
+            self._dump('Timeout waiting for response')
+            raise ValueError('Timeout waiting for response.')
+
+        finally:
+            self._pending.pop(reference, None)
+
+    # ==================================================================================================================
+    # Connection
+    # ==================================================================================================================
+
+    async def _connect(self, takeover=False):
+        """Connect to the bridge and login. Disconnect existing clients if needed by default."""
+
+        policy = self.reconnect_policy
+
+        # Connect to the bridge
+        await self._bridge.connect(timeout=policy.connect_timeout)
+
+        # Let the kernel notice a dead connection too
+        watchdog = self.watchdog
+        watchdog.reset()
+        self._bridge.set_keepalive(watchdog.keepalive_idle, watchdog.keepalive_interval, watchdog.keepalive_count,
+                                   watchdog.stall_timeout)
+
+        await asyncio.wait_for(self._login(takeover), policy.handshake_timeout)
+
+        return True
+
+    async def _login(self, takeover):
+        """Start the session, and register ourselves when needed."""
+
+        try:
+            # Login
+            await self.cmd_start_session(takeover)
+
+        except PyComfoConnectNotAllowed:
+            # No dice, maybe we are not registered yet...
+
+            # Register
+            await self.cmd_register_app(self._local_uuid, self._local_devicename, self._pin)
+
+            # Login
+            await self.cmd_start_session(takeover)
+
+    async def _start_session(self):
+        """Start sending keepalives and re-register for sensor updates."""
+
+        self._keepalive_task = asyncio.ensure_future(self._keepalive_loop())
+        self._watchdog_task = asyncio.ensure_future(self._watchdog_loop())
+
+        await asyncio.gather(*[
+            self.cmd_rpdo_request(sensor_id, sensor_type)
+            for sensor_id, sensor_type in list(self.sensors.items())
+        ])
+
+    def _dump(self, reason):
+        """Write the last frames on the wire to a file, when we have a recorder."""
+
+        if self.recorder is not None:
+            self.recorder.dump_on_error(reason)
+
+    async def _keepalive_loop(self):
+        """Sends a keepalive every KEEPALIVE seconds."""
+
+        while self._bridge.is_connected():
+            await self.cmd_keepalive()
+            await asyncio.sleep(KEEPALIVE)
+
+    async def _watchdog_loop(self):
+        """Probes a connection that has been quiet for a while, and drops it when it has stalled."""
+
+        watchdog = self.watchdog
+
+        while self._bridge.is_connected():
+            status = watchdog.poll(self._bridge.last_received)
+
+            if status == Watchdog.STALLED:
+                _LOGGER.warning('The bridge stopped responding. We will try to reconnect.')
+                self._dump('The bridge stopped responding')
+                self._bridge.abort()
+                return
+
+            if status == Watchdog.PROBE:
+                # A KeepAlive isn't confirmed, so we ask for the time instead
+                reference = self._reference
+                message = self._create_message(CnTimeRequest)
+                watchdog.probe_sent(reference)
+                self._bridge.write_message(message)
+
+            await asyncio.sleep(watchdog.next_check(self._bridge.last_received))
+
+    def _connection_lost(self, exc):
+        """Fail the commands that are waiting for a reply, and reconnect if we didn't disconnect ourselves."""
+
+        for confirm_type, reply in self._pending.values():
+            if not reply.done():
+                reply.set_exception(BrokenPipeError())
+
+        for task in (self._keepalive_task, self._watchdog_task):
+            if task is not None:
+                task.cancel()
+        self._keepalive_task = None
+        self._watchdog_task = None
+
+        if self._running and self._reconnect_task is None:
+            _LOGGER.warning('The connection was broken. We will try to reconnect later.')
+            self._dump('The connection was broken')
+            self._reconnect_task = asyncio.ensure_future(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        """Makes sure that there is a connection open."""
+
+        policy = self.reconnect_policy
+
+        try:
+            while self._running:
+
+                # The first retry is immediate, the next ones wait a bit longer every time to avoid hammering the bridge
+                delay = policy.next_delay()
+                await asyncio.sleep(delay)
+
+                attempt = policy.start_attempt(delay)
+                try:
+                    # Re-connect
+                    await self._connect()
+
+                except PyComfoConnectOtherSession as exc:
+                    self._bridge.disconnect()
+                    _LOGGER.error('Could not connect to the bridge since there is already an open session.')
+                    policy.finish_attempt(attempt, exc)
+                    continue
+
+                except Exception as exc:
+                    self._bridge.disconnect()
+                    _LOGGER.error('Could not connect to the bridge: %s', exc)
+                    policy.finish_attempt(attempt, exc)
+                    continue
+
+                try:
+                    await self._start_session()
+
+                except Exception as exc:
+                    # Close the connection and start over after a backoff
+                    _LOGGER.error('Could not re-register the sensors: %s', exc)
+                    self._bridge.disconnect()
+                    policy.finish_attempt(attempt, exc)
+                    continue
+
+                # Only a session with its sensors back is a success
+                policy.finish_attempt(attempt)
+                return
+
+        finally:
+            self._reconnect_task = None
+
+    # ==================================================================================================================
+    # Messages
+    # ==================================================================================================================
+
+    def _handle_message(self, message):
+        """Resolve the command that waits for this message, or send it to a callback method."""
+
+        if message.cmd.type == GatewayOperation.CnRpdoNotificationType:
+            self._handle_rpdo_notification(message)
+
+        elif message.cmd.type == GatewayOperation.GatewayNotificationType:
+            _LOGGER.info('Unhandled GatewayNotificationType')
+
+        elif message.cmd.type == GatewayOperation.CnNodeNotificationType:
+            _LOGGER.info('Unhandled CnNodeNotificationType')
+
+        elif message.cmd.type == GatewayOperation.CnAlarmNotificationType:
+            _LOGGER.info('Unhandled CnAlarmNotificationType')
+
+        elif message.cmd.type == GatewayOperation.CloseSessionRequestType:
+            _LOGGER.info('The Bridge has asked us to close the connection. We will try to reconnect later.')
+            self._bridge.disconnect()
+
+        elif self.watchdog.is_probe_reply(message):
+            # We only needed to know that the bridge still answers
+            pass
+
+        else:
+            confirm_type, reply = self._pending.get(message.cmd.reference, (None, None))
+            if reply is None or reply.done() or message.msg_class != confirm_type:
+                _LOGGER.debug('Dropping unexpected message with reference %d', message.cmd.reference)
+                return
+
+            try:
+                message.raise_for_result()
+            except PyComfoConnectError as exc:
+                reply.set_exception(exc)
+            else:
+                reply.set_result(message)
+
+    def _handle_rpdo_notification(self, message):
+        """Invoke the callback and pass the update to the sensor_updates() iterators."""
+
+        update = SensorUpdate.from_message(message)
+        self.last_updates[update.pdid] = update
+
+        if self.callback_sensor:
+            self.callback_sensor(update.pdid, update.value)
+
+        if self.callback_update:
+            self.callback_update(update)
+
+        for updates in self._subscribers:
+            updates.put_nowait((update.pdid, update.value))
+
+        return True
+
+    # ==================================================================================================================
+    # Commands
+    # ==================================================================================================================
+
+    async def cmd_start_session(self, take_over=False):
+        """Starts the session on the device by logging in and optionally disconnecting an already existing session."""
+
+        reply = await self._command(
+            StartSessionRequest,
+            {
+                'takeover': take_over
+            }
+        )
+        return reply  # TODO: parse output
+
+    async def cmd_close_session(self):
+        """Stops the current session."""
+
+        reply = await self._command(
+            CloseSessionRequest
+        )
+        return reply  # TODO: parse output
+
+    async def cmd_list_registered_apps(self):
+        """Returns a list of all the registered clients."""
+
+        reply = await self._command(
+            ListRegisteredAppsRequest
+        )
+        return [
+            {'uuid': app.uuid, 'devicename': app.devicename} for app in reply.msg.apps
+        ]
+
+    async def cmd_register_app(self, uuid, device_name, pin):
+        """Register a new app by specifying our own uuid, device_name and pin code."""
+
+        reply = await self._command(
+            RegisterAppRequest,
+            {
+                'uuid': uuid,
+                'devicename': device_name,
+                'pin': pin,
+            }
+        )
+        return reply  # TODO: parse output
+
+    async def cmd_deregister_app(self, uuid):
+        """Remove the specified app from the registration list."""
+
+        if uuid == self._local_uuid:
+            raise Exception('You should not deregister yourself.')
+
+        try:
+            await self._command(
+                DeregisterAppRequest,
+                {
+                    'uuid': uuid
+                }
+            )
+            return True
+
+        except PyComfoConnectBadRequest:
+            return False
+
+    async def cmd_version_request(self):
+        """Returns version information."""
+
+        reply = await self._command(
+            VersionRequest
+        )
+        return {
+            'gatewayVersion': reply.msg.gatewayVersion,
+            'serialNumber': reply.msg.serialNumber,
+            'comfoNetVersion': reply.msg.comfoNetVersion,
+        }
+
+    async def cmd_time_request(self):
+        """Returns the current time on the device."""
+
+        reply = await self._command(
+            CnTimeRequest
+        )
+        return reply.msg.currentTime
+
+    async def cmd_rmi_request(self, message, node_id: int = 1):
+        """Sends a RMI request."""
+
+        await self._command(
+            CnRmiRequest,
+            {
+                'nodeId': node_id or 1,
+                'message': message
+            }
+        )
+        return True
+
+    async def cmd_rpdo_request(self, pdid: int, type: int = 1, zone: int = 1, timeout=None):
+        """Register a RPDO request."""
+
+        reply = await self._command(
+            CnRpdoRequest,
+            {
+                'pdid': pdid,
+                'type': type,
+                'zone': zone or 1,
+                'timeout': timeout
+            }
+        )
+        return reply
+
+    async def cmd_keepalive(self):
+        """Sends a keepalive."""
+
+        await self._command(
+            KeepAlive
+        )
+        return True
@@ -1,87 +1,471 @@
+import collections
+import itertools
 import logging
+import queue
 import select
 import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
-from .message import *
+from google.protobuf.message import DecodeError
+
+from .discovery import broadcast_addresses, expand_targets, normalize_uuid
+from .message import Message
+from .recorder import RX, TX
+from .zehnder_pb2 import DiscoveryOperation
 
 _LOGGER = logging.getLogger('bridge')
 
+# Socket option for kernel receive timestamps in nanoseconds. The socket module doesn't define it, 35 is its value on
+# Linux. The timestamps arrive as a struct timespec in a control message of the same type.
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35 if sys.platform.startswith('linux') else None)
+_TIMESPEC = struct.Struct('@ll')
+
+
+def enable_timestamps(tcpsocket) -> bool:
+    """Ask the kernel to timestamp the data we receive on a socket. Returns False when that isn't supported."""
+
+    if SO_TIMESTAMPNS is None:
+        return False
+
+    try:
+        tcpsocket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        return False
+
+    return True
+
+
+def set_keepalive(tcpsocket, idle, interval, count, user_timeout=None):
+    """Enable TCP keepalive on a socket, with the options that are supported on this platform."""
+
+    tcpsocket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    options = [
+        ('TCP_KEEPIDLE', idle),
+        ('TCP_KEEPINTVL', interval),
+        ('TCP_KEEPCNT', count),
+    ]
+    if user_timeout is not None:
+        # TCP_USER_TIMEOUT is in milliseconds
+        options.append(('TCP_USER_TIMEOUT', int(user_timeout * 1000)))
+
+    for name, value in options:
+        if hasattr(socket, name):
+            tcpsocket.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), int(value))
+
+
+class ReceiveBuffer(object):
+    """Reassembles length-prefixed frames in pooled buffers that are filled with recv_into.
+
+    Frames are handed out as memoryview slices of the buffer, so nothing is copied until someone needs real bytes.
+    A buffer that is still referenced by such a slice is never overwritten; we switch to another buffer instead.
+    """
+
+    # Amount of retired buffers we keep around for reuse
+    POOL_SIZE = 4
+
+    def __init__(self, size=65536):
+        self._size = size
+        self._pool = []
+        self._slab = self._new_slab(size)
+        self._start = 0
+        self._end = 0
+
+    @staticmethod
+    def _new_slab(size):
+        # One spare byte, so we can cheaply check if the buffer is still in use (see _is_free)
+        return bytearray(size + 1)
+
+    @staticmethod
+    def _is_free(slab):
+        """Returns whether no memoryview slice references this buffer anymore."""
+
+        # A bytearray can't be resized while there are exported buffers.
+        try:
+            del slab[-1]
+        except BufferError:
+            return False
+
+        slab.append(0)
+        return True
+
+    def clear(self):
+        """Forget all buffered data."""
+
+        self._start = 0
+        self._end = 0
+
+    def get_buffer(self) -> memoryview:
+        """Returns the free space of the buffer. Call commit with the amount of bytes that were written in it."""
+
+        self._make_room()
+
+        return memoryview(self._slab)[self._end:len(self._slab) - 1]
+
+    def recv_into(self, sock) -> int:
+        """Read available data from the socket in the free space of the buffer."""
+
+        with self.get_buffer() as view:
+            return sock.recv_into(view)
+
+    def recvmsg_into(self, sock):
+        """Read available data like recv_into. Returns the amount of bytes and the kernel receive timestamp.
+
+        The timestamp is None when the socket doesn't have timestamps enabled.
+        """
+
+        with self.get_buffer() as view:
+            nbytes, ancdata, flags, address = sock.recvmsg_into([view], socket.CMSG_SPACE(_TIMESPEC.size))
+
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= _TIMESPEC.size:
+                seconds, nanoseconds = _TIMESPEC.unpack_from(data)
+                return nbytes, seconds + nanoseconds / 1e9
+
+        return nbytes, None
+
+    def commit(self, nbytes):
+        """Marks nbytes of the free space as filled."""
+
+        self._end += nbytes
+
+    def feed(self, data) -> list:
+        """Add data that was received elsewhere, and returns the complete frames."""
+
+        frames = []
+        offset = 0
+        while offset < len(data):
+            with self.get_buffer() as view:
+                nbytes = min(len(view), len(data) - offset)
+                view[:nbytes] = data[offset:offset + nbytes]
+            self.commit(nbytes)
+            offset += nbytes
+            frames.extend(self.frames())
+
+        return frames
+
+    def pending(self) -> bytes:
+        """Returns the data of the trailing partial frame."""
+
+        return bytes(self._slab[self._start:self._end])
+
+    def frames(self):
+        """Returns all complete frames in the buffer, and keeps a trailing partial frame."""
+
+        frames = []
+        slab = self._slab
+        with memoryview(slab) as view:
+            offset = self._start
+            while self._end - offset >= 4:
+                end = offset + 4 + struct.unpack_from('>L', slab, offset)[0]
+                if end > self._end:
+                    break
+
+                frames.append(view[offset:end])
+                offset = end
+
+        self._start = offset
+
+        return frames
+
+    def _make_room(self):
+        """Make sure that there is free space after the pending data."""
+
+        capacity = len(self._slab) - 1
+        pending = self._end - self._start
+
+        # We need room for at least the frame we are currently receiving
+        needed = 0
+        if pending >= 4:
+            needed = 4 + struct.unpack_from('>L', self._slab, self._start)[0]
+
+        if capacity - self._end >= self._size // 4 and self._start + needed <= capacity:
+            return
+
+        needed = max(needed, self._size)
+
+        if needed <= capacity and self._is_free(self._slab):
+            # Move the pending data to the front of the current buffer
+            self._slab[0:pending] = self._slab[self._start:self._end]
+
+        else:
+            # Move the pending data to another buffer, our current one is still being used
+            slab = self._take_slab(needed)
+            slab[0:pending] = self._slab[self._start:self._end]
+            if len(self._pool) < self.POOL_SIZE:
+                self._pool.append(self._slab)
+            self._slab = slab
+
+        self._start = 0
+        self._end = pending
+
+    def _take_slab(self, size):
+        """Returns a free buffer of at least size bytes from the pool, or allocates a new one."""
+
+        for slab in self._pool:
+            if len(slab) - 1 >= size and self._is_free(slab):
+                self._pool.remove(slab)
+                return slab
+
+        return self._new_slab(max(size, self._size))
+
 
 class Bridge(object):
     """Implements an interface to send and receive messages from the Bridge."""
 
     PORT = 56747
 
+    # Amount of bytes we try to read from the socket for every readiness event
+    RECV_SIZE = 65536
+
+    # Messages we decode per call at most. A whole burst at once keeps thousands of messages alive, and the garbage
+    # collector walks over all of them again and again.
+    READ_BATCH = 64
+
+    # Maximum amount of buffers we pass to a single sendmsg call
+    IOV_MAX = 1024
+
+    # Seconds we wait for the socket to accept more data before we consider the connection broken
+    SEND_TIMEOUT = 10
+
+    # Seconds write_messages() waits for the writer before it gives up
+    WRITE_TIMEOUT = 30
+
+    # Seconds the writer waits for more messages to send them together
+    WRITE_COALESCE_WINDOW = 0.002
+
     @staticmethod
-    def discover(host=None, timeout=5):
+    def discover(host=None, timeout=5, targets=None, uuids=None):
         """Broadcast the network and look for local bridges."""
 
+        return list(Bridge.discover_iter(host, timeout, targets, uuids))
+
+    @staticmethod
+    def discover_iter(host=None, timeout=5, targets=None, uuids=None, retry_interval=1):
+        """Probe all local networks at once, and yield the bridges as soon as they answer.
+
+        Without a host, we broadcast on every local interface, and also probe the hosts and CIDR ranges in targets.
+        We stop early when the bridge at host has answered, or when all bridges with the given uuids are found.
+        Probes to broadcast addresses and single hosts are repeated every retry_interval seconds until timeout, since
+        UDP packets can get lost. The hosts of a CIDR range are only probed once, repeating a probe to hundreds of
+        hosts every second is too much.
+        """
+
+        # Build the list of addresses to probe, and the addresses of the ranges that are only probed once
+        ranges = []
+        if host is not None:
+            addresses = [host]
+        else:
+            addresses = ['<broadcast>'] + broadcast_addresses()
+            for target in targets or []:
+                expanded = expand_targets([target])
+                if len(expanded) == 1:
+                    addresses.extend(expanded)
+                else:
+                    ranges.extend(expanded)
+
+        expected = None
+        if uuids:
+            expected = set(normalize_uuid(uuid) for uuid in uuids)
+
         # Setup socket
         udpsocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         udpsocket.setblocking(0)
         udpsocket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 
-        # Send broadcast packet
-        if host is None:
-            udpsocket.sendto(b"\x0a\x00", ('<broadcast>', Bridge.PORT))
-        else:
-            udpsocket.sendto(b"\x0a\x00", (host, Bridge.PORT))
-
-        # Try to read response
         parser = DiscoveryOperation()
-        bridges = []
-        while True:
-            ready = select.select([udpsocket], [], [], timeout)
-            if not ready[0]:
-                break
+        found = set()
+        deadline = time.monotonic() + timeout
+        next_probe = 0
 
-            data, source = udpsocket.recvfrom(100)
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+
+                # Send search packets
+                if now >= next_probe:
+                    for address in addresses + ranges:
+                        try:
+                            udpsocket.sendto(b"\x0a\x00", (address, Bridge.PORT))
+                        except OSError as exc:
+                            _LOGGER.debug('Could not probe %s: %s', address, exc)
+                    ranges = []
+                    next_probe = now + retry_interval
+
+                # Try to read response
+                ready = select.select([udpsocket], [], [], min(deadline, next_probe) - now)
+                if not ready[0]:
+                    continue
+
+                try:
+                    data, source = udpsocket.recvfrom(1024)
+                    parser.ParseFromString(data)
+                except (OSError, DecodeError):
+                    continue
+
+                ip_address = parser.searchGatewayResponse.ipaddress
+                uuid = parser.searchGatewayResponse.uuid
+
+                # We hear the same bridge on multiple interfaces, and for every retry
+                if uuid in found:
+                    continue
+                found.add(uuid)
+
+                yield Bridge(ip_address, uuid)
+
+                # Don't look for other bridges if we directly discovered it by IP
+                if host:
+                    break
+
+                # Don't look any further if we found all bridges we were looking for
+                if expected is not None:
+                    expected.discard(uuid)
+                    if not expected:
+                        break
+
+        finally:
+            udpsocket.close()
+
+    def __init__(self, host: str, uuid: str, port: int = PORT, timestamps=False) -> None:
+        self.host = host
+        self.uuid = uuid
+        self.port = port
 
-            # Parse data
-            parser.ParseFromString(data)
-            ip_address = parser.searchGatewayResponse.ipaddress
-            uuid = parser.searchGatewayResponse.uuid
+        # Read with recvmsg, so messages are stamped with the time the kernel received them
+        self.timestamps = timestamps
 
-            # Add a new Bridge to the list
-            bridges.append(
-                Bridge(ip_address, uuid)
-            )
+        self._socket = None
+        self.debug = False
 
-            # Don't look for other bridges if we directly discovered it by IP
-            if host:
-                break
+        # Receive buffer with a trailing partial frame, and the complete frames with their receive time that are
+        # waiting to be decoded
+        self._rx_buffer = ReceiveBuffer(self.RECV_SIZE)
+        self._rx_frames = collections.deque()
 
-        udpsocket.close()
+        # Monotonic time of the last data we received, or of the connect
+        self.last_received = 0
 
-        # Return found bridges
-        return bridges
+        # Optional function that gets the raw bytes of every frame, and returns False to drop it before decoding
+        self.frame_filter = None
 
-    def __init__(self, host: str, uuid: str) -> None:
-        self.host = host
-        self.uuid = uuid
+        # Optional FlightRecorder that keeps the last frames we have sent and received
+        self.recorder = None
 
-        self._socket = None
-        self.debug = False
+        # Optional CaptureWriter that stores every frame we send and receive
+        self.capture = None
+
+        # Outbound queue that is drained by the writer thread, so only one thread writes to the socket
+        self._lock = threading.Lock()
+        self._outbox = None
+        self._writer = None
 
-    def connect(self) -> bool:
-        """Open connection to the bridge."""
+        # Optional Reactor that services this connection instead of our own threads
+        self.reactor = None
+
+        # The buffers a reactor still has to send when the socket had no room, each with the futures that resolve
+        # once it's sent. Only the reactor thread touches these.
+        self._tx_pending = collections.deque()
+
+    def connect(self, timeout=None) -> bool:
+        """Open connection to the bridge. Raises socket.timeout when the bridge doesn't answer within timeout seconds."""
 
         if self._socket is None:
             tcpsocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            tcpsocket.connect((self.host, Bridge.PORT))
+            tcpsocket.settimeout(timeout)
+            try:
+                tcpsocket.connect((self.host, self.port))
+            except OSError:
+                tcpsocket.close()
+                raise
             tcpsocket.setblocking(0)
+            if self.timestamps:
+                enable_timestamps(tcpsocket)
             self._socket = tcpsocket
+            self._rx_buffer.clear()
+            self._rx_frames.clear()
+            self.last_received = time.monotonic()
 
         return True
 
     def disconnect(self) -> bool:
         """Close connection to the bridge."""
 
-        self._socket.close()
-        self._socket = None
+        tcpsocket, _ = self.detach()
+        if tcpsocket is not None:
+            tcpsocket.close()
 
         return True
 
+    def attach(self, tcpsocket, pending=b'') -> bool:
+        """Continue a connection that was opened elsewhere, for example by a previous process.
+
+        pending is the data that was already received from the connection, but not read yet.
+        """
+
+        if self._socket is not None:
+            raise Exception('Already connected!')
+
+        tcpsocket.setblocking(0)
+        if self.timestamps:
+            enable_timestamps(tcpsocket)
+        self._socket = tcpsocket
+        self._rx_buffer.clear()
+        self._rx_frames.clear()
+        self._queue_frames(self._rx_buffer.feed(pending), time.time())
+        self.last_received = time.monotonic()
+
+        return True
+
+    def detach(self):
+        """Stop using the connection without closing it. Returns the socket and the data we received but didn't read.
+
+        Messages that are already queued are sent first.
+        """
+
+        with self._lock:
+            tcpsocket = self._socket
+            writer = self._writer
+            outbox = self._outbox
+            self._socket = None
+            self._writer = None
+            self._outbox = None
+
+            if writer is not None:
+                # Let the writer send what is already queued, and stop
+                outbox.put(None)
+
+        if writer is not None and writer is not threading.current_thread():
+            writer.join()
+
+        while writer is None and outbox is not None:
+            # The reactor didn't get to these messages anymore
+            try:
+                messages, parts, future = outbox.get_nowait()
+            except queue.Empty:
+                break
+            future.set_result(False)
+
+        if self._tx_pending:
+            self._finish_pending(tcpsocket)
+
+        pending = b''.join(bytes(frame) for frame, received in self._rx_frames) + self._rx_buffer.pending()
+        self._rx_buffer.clear()
+        self._rx_frames.clear()
+
+        return tcpsocket, pending
+
+    def set_keepalive(self, idle, interval, count, user_timeout=None):
+        """Let the kernel detect a dead connection with TCP keepalive probes, and give up on unacknowledged data."""
+
+        if self._socket is not None:
+            set_keepalive(self._socket, idle, interval, count, user_timeout)
+
     def is_connected(self):
         """Returns weather there is an open socket."""
 
@@ -90,53 +474,364 @@ class Bridge(object):
     def read_message(self, timeout=1) -> Message:
         """Read a message from the connection."""
 
+        messages = self.read_messages(1, timeout)
+        if not messages:
+            return None
+
+        return messages[0]
+
+    def read_messages(self, max_frames=None, timeout=1, waker=None) -> list:
+        """Read the messages that are available after a single wait for the connection, up to max_frames or READ_BATCH.
+
+        Messages that are left are returned by the next call without waiting. The wait can be interrupted by another
+        thread with the optional waker.
+        """
+
         if self._socket is None:
             raise BrokenPipeError()
 
-        # Check if there is data available
-        ready = select.select([self._socket], [], [], timeout)
-        if not ready[0]:
-            # Timeout
-            return None
+        if not self._rx_frames:
+            # Check if there is data available
+            readers = [self._socket] if waker is None else [self._socket, waker]
+            ready = select.select(readers, [], [], timeout)[0]
+            if waker is not None and waker in ready:
+                waker.drain()
+            if self._socket not in ready:
+                # Timeout or woken up
+                return []
 
-        # Read packet size
-        msg_len_buf = self._socket.recv(4)
-        if not msg_len_buf:
-            # No data, but there has to be.
+            self._fill_buffer()
+
+        return self._decode_frames(max_frames)
+
+    def read_available(self) -> list:
+        """Read the messages that are available without waiting, up to READ_BATCH, for a reactor that knows the socket
+        is readable.
+        """
+
+        if self._socket is None:
             raise BrokenPipeError()
 
-        # Read rest of packet
-        msg_len = struct.unpack('>L', msg_len_buf)[0]
-        msg_buf = self._socket.recv(msg_len)
-        if not msg_buf:
+        self._fill_buffer()
+
+        return self._decode_frames()
+
+    def _decode_frames(self, max_frames=None) -> list:
+        """Decode the complete frames we have received, up to max_frames or READ_BATCH."""
+
+        if max_frames is None:
+            max_frames = self.READ_BATCH
+
+        messages = []
+        while self._rx_frames and len(messages) < max_frames:
+            # Decode message
+            message = Message.decode(*self._rx_frames.popleft())
+
+            # Debug message
+            _LOGGER.debug("RX %s", message)
+
+            messages.append(message)
+
+        return messages
+
+    def _fill_buffer(self):
+        """Read everything that is available from the socket and split it in complete frames."""
+
+        try:
+            if self.timestamps:
+                nbytes, received = self._rx_buffer.recvmsg_into(self._socket)
+            else:
+                nbytes, received = self._rx_buffer.recv_into(self._socket), None
+        except BlockingIOError:
+            return
+
+        if not nbytes:
             # No data, but there has to be.
             raise BrokenPipeError()
 
-        # Decode message
-        message = Message.decode(msg_len_buf + msg_buf)
+        self.last_received = time.monotonic()
+        self._rx_buffer.commit(nbytes)
+
+        # Without a kernel timestamp, this is the closest we get to the arrival of the data
+        kernel_time = received is not None
+        if received is None:
+            received = time.time()
 
-        # Debug message
-        _LOGGER.debug("RX %s", message)
+        self._queue_frames(self._rx_buffer.frames(), received, kernel_time)
 
-        return message
+    def _queue_frames(self, frames, received, kernel_time=False):
+        """Queue complete frames for decoding, unless the frame_filter drops them."""
+
+        if self.recorder is not None or self.capture is not None:
+            frames = list(frames)
+            if self.recorder is not None:
+                self.recorder.record_frames(RX, frames, received)
+            if self.capture is not None:
+                self.capture.write_frames(RX, frames, received, kernel_time)
+
+        if self.frame_filter is not None:
+            frames = [frame for frame in frames if self.frame_filter(frame)]
+
+        self._rx_frames.extend((frame, received) for frame in frames)
 
     def write_message(self, message: Message) -> bool:
         """Send a message."""
 
-        if self._socket is None:
-            raise Exception('Not connected!')
+        return self.write_messages([message])
+
+    def write_messages(self, messages) -> bool:
+        """Send several messages at once, and wait until they are sent."""
+
+        try:
+            return self.queue_messages(messages).result(self.WRITE_TIMEOUT)
+        except FutureTimeoutError:
+            _LOGGER.warning('The writer did not send our messages within %d seconds.', self.WRITE_TIMEOUT)
+            return False
+
+    def queue_messages(self, messages) -> Future:
+        """Queue messages for the writer. The returned future resolves to whether they were sent.
+
+        The messages are serialized right away, so a message that can't be encoded raises here.
+        """
+
+        parts = [message.encode_parts() for message in messages]
+        future = Future()
+
+        with self._lock:
+            if self._socket is None:
+                raise Exception('Not connected!')
+
+            if self._outbox is None:
+                self._outbox = queue.Queue()
+
+                # A reactor sends our messages from its own thread
+                if self.reactor is None:
+                    self._writer = threading.Thread(target=self._writer_loop, args=(self._socket, self._outbox))
+                    self._writer.daemon = True
+                    self._writer.start()
+
+            self._outbox.put((messages, parts, future))
+            tcpsocket, outbox = self._socket, self._outbox
+
+        if self.reactor is not None:
+            if self.reactor.in_reactor_thread():
+                self._flush_outbox(tcpsocket, outbox)
+            else:
+                self.reactor.call_soon_threadsafe(self._flush_outbox, tcpsocket, outbox)
+
+        return future
+
+    def _writer_loop(self, tcpsocket, outbox):
+        """Send everything that is queued within a short window with as few system calls as possible."""
+
+        stopping = False
+        while not stopping:
+            item = outbox.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.WRITE_COALESCE_WINDOW
+            while True:
+                try:
+                    item = outbox.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    stopping = True
+                    break
 
-        # Construct packet
-        packet = message.encode()
+                batch.append(item)
 
-        # Debug message
-        _LOGGER.debug("TX %s", message)
+            self._send_batch(tcpsocket, batch)
 
-        # Send packet
+    def _flush_outbox(self, tcpsocket, outbox):
+        """Send everything that is queued at once. This runs on the reactor thread."""
+
+        batch = []
+        while True:
+            try:
+                batch.append(outbox.get_nowait())
+            except queue.Empty:
+                break
+
+        if not batch:
+            return
+
+        try:
+            buffers = [buffer for buffer in self._batch_buffers(batch) if buffer]
+        except Exception as exc:
+            _LOGGER.error('Could not send messages: %s', exc)
+            for messages, parts, future in batch:
+                future.set_exception(exc)
+            return
+
+        futures = [future for messages, parts, future in batch]
+        if not buffers:
+            for future in futures:
+                future.set_result(True)
+            return
+
+        self._tx_pending.extend((buffer, []) for buffer in buffers)
+        self._tx_pending[-1][1].extend(futures)
+        self._write_pending(tcpsocket)
+
+    def _write_pending(self, tcpsocket):
+        """Send what the socket takes without blocking. This runs on the reactor thread.
+
+        When the socket has no room for everything, the reactor calls this again when it has.
+        """
+
+        pending = self._tx_pending
         try:
-            self._socket.sendall(packet)
-        except BrokenPipeError:
-            self.disconnect()
+            while pending:
+                buffers = [buffer for buffer, _ in itertools.islice(pending, self.IOV_MAX)]
+                try:
+                    if hasattr(tcpsocket, 'sendmsg'):
+                        sent = tcpsocket.sendmsg(buffers)
+                    else:
+                        # No sendmsg on this platform
+                        sent = tcpsocket.send(buffers[0])
+                except BlockingIOError:
+                    self.reactor.set_writing(self, True)
+                    return
+
+                # Resolve the futures of the buffers that are sent, and keep the remainder of a partially sent one
+                while sent:
+                    buffer, futures = pending[0]
+                    if sent < len(buffer):
+                        pending[0] = (memoryview(buffer)[sent:], futures)
+                        break
+                    sent -= len(buffer)
+                    pending.popleft()
+                    for future in futures:
+                        future.set_result(True)
+
+        except OSError:
+            # Like the writer thread, we leave it to the reader to tear the connection down
+            self._shutdown(tcpsocket)
+            self._fail_pending()
+
+        self.reactor.set_writing(self, False)
+
+    def _finish_pending(self, tcpsocket):
+        """Send what the reactor didn't get to before we let go of the connection, a successor needs whole frames.
+
+        On the reactor thread, or without a connection, it's dropped instead.
+        """
+
+        if tcpsocket is None or self.reactor.in_reactor_thread():
+            self._fail_pending()
+            return
+
+        buffers = []
+        futures = []
+        for buffer, buffer_futures in self._tx_pending:
+            buffers.append(buffer)
+            futures.extend(buffer_futures)
+        self._tx_pending.clear()
+
+        try:
+            self._send_buffers(tcpsocket, buffers)
+        except OSError:
+            for future in futures:
+                future.set_result(False)
+            return
+
+        for future in futures:
+            future.set_result(True)
+
+    def _fail_pending(self):
+        for buffer, futures in self._tx_pending:
+            for future in futures:
+                future.set_result(False)
+        self._tx_pending.clear()
+
+    def _send_batch(self, tcpsocket, batch):
+        """Send the messages of a batch of queued items, and resolve their futures."""
+
+        try:
+            result = self._send_items(tcpsocket, batch)
+        except Exception as exc:
+            # Nobody may be left waiting for these messages, and the writer has to keep going
+            _LOGGER.error('Could not send messages: %s', exc)
+            for messages, parts, future in batch:
+                future.set_exception(exc)
+            return
+
+        for messages, parts, future in batch:
+            future.set_result(result)
+
+    def _send_items(self, tcpsocket, batch) -> bool:
+        """Send the encoded messages of a batch of queued items. Returns whether they were sent."""
+
+        buffers = self._batch_buffers(batch)
+
+        # Send packets
+        try:
+            self._send_buffers(tcpsocket, buffers)
+        except OSError:
+            # Only the thread that reads from the socket tears the connection down. It notices the broken connection
+            # when it reads from the socket.
+            self._shutdown(tcpsocket)
             return False
 
         return True
+
+    @staticmethod
+    def _shutdown(tcpsocket):
+        try:
+            tcpsocket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _batch_buffers(self, batch) -> list:
+        """Returns the parts of every message of a batch of queued items, and records them as sent."""
+
+        recorder, capture = self.recorder, self.capture
+        now = time.time()
+
+        # Collect the parts of all packets
+        buffers = []
+        for messages, parts, future in batch:
+            for message, message_parts in zip(messages, parts):
+                buffers.extend(message_parts)
+
+                if recorder is not None:
+                    recorder.record_parts(TX, message_parts, now)
+                if capture is not None:
+                    capture.write_parts(TX, message_parts, now)
+
+                # Debug message
+                _LOGGER.debug("TX %s", message)
+
+        return buffers
+
+    def _send_buffers(self, tcpsocket, buffers):
+        """Send a list of buffers with scatter-gather I/O."""
+
+        if not hasattr(tcpsocket, 'sendmsg'):
+            # No sendmsg on this platform
+            tcpsocket.sendall(b''.join(buffers))
+            return
+
+        buffers = [buffer for buffer in buffers if buffer]
+        index = 0
+        while index < len(buffers):
+            try:
+                sent = tcpsocket.sendmsg(buffers[index:index + self.IOV_MAX])
+            except BlockingIOError:
+                # Wait until the socket accepts data again
+                if not select.select([], [tcpsocket], [], self.SEND_TIMEOUT)[1]:
+                    raise BrokenPipeError()
+                continue
+
+            # Skip what has been sent, and continue with the remainder of a partially sent buffer
+            while sent:
+                length = len(buffers[index])
+                if sent < length:
+                    buffers[index] = memoryview(buffers[index])[sent:]
+                    break
+                sent -= length
+                index += 1
@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+from .bridge import Bridge
+
+_LOGGER = logging.getLogger('cache')
+
+# Seconds a cached address is trusted before we discover the bridge again
+DEFAULT_TTL = 24 * 3600
+
+
+class DiscoveryCache(object):
+    """Remembers the address of bridges by UUID in a JSON file, so we don't need to discover them on every start."""
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path) as cachefile:
+                data = json.load(cachefile)
+        except (OSError, ValueError):
+            return {}
+
+        # Anything else than an object of entries was not written by us
+        if not isinstance(data, dict):
+            return {}
+
+        return {uuid_hex: entry for uuid_hex, entry in data.items() if isinstance(entry, dict)}
+
+    def _save(self, entries):
+        # Write to a temporary file first, so a crash never leaves a broken cache behind, and
+        # with a unique name, so processes that save at the same time don't write into each other's file
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(self.path)),
+                                             prefix=os.path.basename(self.path) + '.', suffix='.tmp',
+                                             delete=False) as cachefile:
+                tmp_path = cachefile.name
+                json.dump(entries, cachefile, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            _LOGGER.warning('Could not write discovery cache %s: %s', self.path, exc)
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+    def lookup(self, uuid=None, host=None) -> Bridge:
+        """Returns the cached bridge with this uuid, or that was discovered at this host."""
+
+        now = time.time()
+        for uuid_hex, entry in self._load().items():
+            if now - entry.get('updated', 0) > self.ttl:
+                continue
+
+            if uuid is not None and bytes.fromhex(uuid_hex) != uuid:
+                continue
+
+            if host is not None and host not in (entry.get('host'), entry.get('requested')):
+                continue
+
+            return Bridge(entry['host'], bytes.fromhex(uuid_hex))
+
+        return None
+
+    def store(self, bridge: Bridge, requested=None):
+        """Remember the address of a bridge. requested is the address we were asked to look at."""
+
+        entries = self._load()
+        entry = entries.setdefault(bridge.uuid.hex(), {})
+        entry['host'] = bridge.host
+        entry['updated'] = time.time()
+        if requested is not None:
+            entry['requested'] = requested
+
+        self._save(entries)
+
+    def forget(self, uuid):
+        """Remove a bridge from the cache."""
+
+        entries = self._load()
+        if entries.pop(uuid.hex(), None) is not None:
+            self._save(entries)
+
+    def discover(self, host=None, timeout=5) -> Bridge:
+        """Returns the bridge at host from the cache, or discovers it and caches the result."""
+
+        bridge = self.lookup(host=host)
+        if bridge is not None:
+            return bridge
+
+        for bridge in Bridge.discover_iter(host, timeout):
+            self.store(bridge, requested=host)
+            return bridge
+
+        return None
+
+    def rediscover(self, bridge: Bridge, timeout=5) -> Bridge:
+        """Locate a bridge by its UUID on all local networks, for example after its address changed by DHCP."""
+
+        for found in Bridge.discover_iter(timeout=timeout, uuids=[bridge.uuid]):
+            self.store(found)
+            return found
+
+        return None
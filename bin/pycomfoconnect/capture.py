@@ -0,0 +1,315 @@
+import array
+import bisect
+import collections
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from .recorder import RX, TX
+
+_LOGGER = logging.getLogger('capture')
+
+MAGIC = b'PCCCAP01'
+
+# Time the capture was started
+_HEADER = struct.Struct('>d')
+
+# Flags, timestamp and length of the frame, followed by the frame
+_RECORD = struct.Struct('>BdL')
+
+# Timestamp and file offset of the first record at or after it
+_INDEX_ENTRY = struct.Struct('>dQ')
+
+# Flags of a record
+FLAG_TX = 0x01
+FLAG_KERNEL_TIME = 0x02
+
+# Records can be slightly out of order, a sent frame is stamped when it's sent and a received one when the kernel
+# received it. We look this many seconds around a time range to not miss them.
+TIME_SLACK = 1.0
+
+CaptureRecord = collections.namedtuple('CaptureRecord', ['timestamp', 'direction', 'kernel_time', 'data'])
+
+
+def index_path(path):
+    """Returns the path of the time index of a capture."""
+
+    return path + '.idx'
+
+
+class CaptureWriter(object):
+    """Appends every frame that is sent or received to a capture file, with a sparse time index next to it.
+
+    A record is the flags, the timestamp and the length of a frame, followed by the raw frame. Every index_interval
+    seconds, the offset of the next record is added to the index. Writes are buffered and flushed every
+    flush_interval seconds, so a crash loses at most that much. An existing capture is appended to, after cutting off
+    a record that was torn by a crash.
+    """
+
+    def __init__(self, path, buffer_size=1 << 16, index_interval=1.0, flush_interval=5.0):
+        self.path = path
+        self.index_interval = index_interval
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            self._recover(path)
+
+        self._file = open(path, 'ab', buffering=buffer_size)
+        self._index = open(index_path(path), 'ab')
+        self._offset = self._file.tell()
+
+        if self._offset == 0:
+            self._file.write(MAGIC + _HEADER.pack(time.time()))
+            self._offset = len(MAGIC) + _HEADER.size
+
+        # Index entries wait here until the data they point to is on disk
+        self._index_buffer = []
+        self._next_index = 0
+        self._last_flush = time.monotonic()
+
+        # Statistics
+        self.frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _recover(path):
+        """Cut off what a writer that didn't close left behind: a torn last record, and index entries past it."""
+
+        data_offset = len(MAGIC) + _HEADER.size
+
+        with open(path, 'r+b') as capturefile:
+            size = capturefile.seek(0, os.SEEK_END)
+            capturefile.seek(0)
+            header = capturefile.read(data_offset)
+            if header[:len(MAGIC)] != MAGIC[:len(header)]:
+                raise Exception('%s is not a capture file.' % path)
+
+            if size < data_offset:
+                # Not even the header was written completely
+                capturefile.truncate(0)
+                open(index_path(path), 'wb').close()
+                return
+
+            entries = []
+            try:
+                with open(index_path(path), 'rb') as indexfile:
+                    index = indexfile.read()
+                entries = list(_INDEX_ENTRY.iter_unpack(index[:len(index) - len(index) % _INDEX_ENTRY.size]))
+            except FileNotFoundError:
+                pass
+
+            # Every record from the last entry that points into the file on is checked
+            while entries and entries[-1][1] > size:
+                entries.pop()
+            offset = entries[-1][1] if entries else data_offset
+
+            while offset + _RECORD.size <= size:
+                capturefile.seek(offset)
+                length = _RECORD.unpack(capturefile.read(_RECORD.size))[2]
+                if offset + _RECORD.size + length > size:
+                    break
+                offset += _RECORD.size + length
+
+            if offset < size:
+                _LOGGER.warning('%s ends with a torn record, %d bytes are cut off.', path, size - offset)
+                capturefile.truncate(offset)
+
+        # An entry at the end points to a record that was never written
+        entries = [entry for entry in entries if entry[1] < offset]
+        with open(index_path(path), 'wb') as indexfile:
+            indexfile.write(b''.join(_INDEX_ENTRY.pack(*entry) for entry in entries))
+
+    def write_frames(self, direction, frames, timestamp=None, kernel_time=False):
+        """Append frames that were sent or received at the same time."""
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        flags = (FLAG_TX if direction == TX else 0) | (FLAG_KERNEL_TIME if kernel_time else 0)
+
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._index_record(timestamp)
+            for frame in frames:
+                self._file.write(_RECORD.pack(flags, timestamp, len(frame)))
+                self._file.write(frame)
+                self._offset += _RECORD.size + len(frame)
+                self.frames += 1
+
+            self._flush_if_due()
+
+    def write_parts(self, direction, parts, timestamp=None):
+        """Append a frame that is split in several buffers, like Message.encode_parts() returns them."""
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        length = sum(len(part) for part in parts)
+
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._index_record(timestamp)
+            self._file.write(_RECORD.pack(FLAG_TX if direction == TX else 0, timestamp, length))
+            for part in parts:
+                self._file.write(part)
+            self._offset += _RECORD.size + length
+            self.frames += 1
+
+            self._flush_if_due()
+
+    def _index_record(self, timestamp):
+        """Add the record that is written next to the index, when the last entry is old enough."""
+
+        if timestamp >= self._next_index:
+            self._index_buffer.append(_INDEX_ENTRY.pack(timestamp, self._offset))
+            self._next_index = timestamp + self.index_interval
+
+    def _flush_if_due(self):
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._flush()
+            self._last_flush = now
+
+    def _flush(self):
+        # The index may never point past the data that is on disk, so it's only written after the data
+        self._file.flush()
+        if self._index_buffer:
+            self._index.write(b''.join(self._index_buffer))
+            self._index.flush()
+            self._index_buffer = []
+
+    def flush(self):
+        """Write everything that is buffered to disk."""
+
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._index.close()
+                self._file = None
+
+
+class CaptureReader(object):
+    """Reads a capture file without loading it in memory, it's mapped and only the pages we look at are read."""
+
+    def __init__(self, path):
+        self.path = path
+
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise Exception('%s is empty.' % path)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise Exception('%s is not a capture file.' % path)
+
+        self.started = _HEADER.unpack_from(self._map, len(MAGIC))[0]
+        self._data_offset = len(MAGIC) + _HEADER.size
+
+        self._index_times, self._index_offsets = self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+    def _load_index(self):
+        """Read the time index. A capture without one is read from the start."""
+
+        times = array.array('d')
+        offsets = array.array('Q')
+
+        try:
+            with open(index_path(self.path), 'rb') as indexfile:
+                data = indexfile.read()
+        except FileNotFoundError:
+            return times, offsets
+
+        size = len(self._map)
+        for timestamp, offset in _INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % _INDEX_ENTRY.size]):
+            # The index can be ahead of a capture that wasn't closed properly
+            if offset >= size:
+                break
+            times.append(timestamp)
+            offsets.append(offset)
+
+        return times, offsets
+
+    def _seek(self, start):
+        """Returns the offset of a record at or before the first record from start on."""
+
+        if start is None or not self._index_times:
+            return self._data_offset
+
+        position = bisect.bisect_right(self._index_times, start - TIME_SLACK) - 1
+        if position < 0:
+            return self._data_offset
+
+        return self._index_offsets[position]
+
+    def _headers(self, offset):
+        """Yields the flags, timestamp, offset and length of every complete record from offset on."""
+
+        data = self._map
+        size = len(data)
+
+        while offset + _RECORD.size <= size:
+            flags, timestamp, length = _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+
+            if offset + length > size:
+                # The last record wasn't written completely
+                return
+
+            yield flags, timestamp, offset, length
+            offset += length
+
+    def frames(self, start=None, end=None):
+        """Yields the records with a timestamp from start up to end, in the order they were written."""
+
+        data = self._map
+        for flags, timestamp, offset, length in self._headers(self._seek(start)):
+            if end is not None and timestamp >= end + TIME_SLACK:
+                return
+
+            if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                yield CaptureRecord(timestamp, TX if flags & FLAG_TX else RX, bool(flags & FLAG_KERNEL_TIME),
+                                    data[offset:offset + length])
+
+    def __iter__(self):
+        return self.frames()
+
+    @property
+    def end(self):
+        """Returns the timestamp of the last record, or None for an empty capture."""
+
+        offset = self._index_offsets[-1] if self._index_offsets else self._data_offset
+        return max((timestamp for _, timestamp, _, _ in self._headers(offset)), default=None)
@@ -1,13 +1,22 @@
 import logging
 import queue
-import struct
 import threading
 import time
 
 from .bridge import Bridge
+from .cache import DiscoveryCache
+from .handoff import HANDOFF_ACK, HandoffServer, connect_handoff, receive_session
+from .reactor import Reactor, TimerHeap, Waker
+from .reconnect import ReconnectPolicy
+from .recorder import FlightRecorder
+from .rpdofilter import RpdoFilter
+from .sensorupdate import SensorUpdate, rpdo_value
+from .watchdog import Watchdog
 from .error import *
-from .message import Message
-from .zehnder_pb2 import *
+from .message import Message, TemplateCache
+from .zehnder_pb2 import CloseSessionRequest, CnRmiRequest, CnRpdoConfirm, CnRpdoRequest, CnTimeRequest, \
+    DeregisterAppRequest, GatewayOperation, KeepAlive, ListRegisteredAppsRequest, RegisterAppRequest, \
+    StartSessionRequest, VersionRequest
 from .const import *
 
 KEEPALIVE = 60
@@ -97,27 +106,76 @@ RPDO_TYPE_MAP = {
 
 
 class ComfoConnect(object):
-    """Implements the commands to communicate with the ComfoConnect ventilation unit."""
+    """Implements the commands to communicate with the ComfoConnect ventilation unit.
+
+    Pass a FlightRecorder with a path as recorder to keep the last frames on the wire, and have them written to a
+    file when the connection breaks or the bridge stops answering. Without one, nothing is recorded.
+    """
 
     """Callback function to invoke when sensor updates are received."""
     callback_sensor = None
 
+    """Callback function to invoke with the SensorUpdate of every sensor update that is received."""
+    callback_update = None
+
     def __init__(self, bridge: Bridge, local_uuid=DEFAULT_LOCAL_UUID, local_devicename=DEFAULT_LOCAL_DEVICENAME,
-                 pin=DEFAULT_PIN):
+                 pin=DEFAULT_PIN, reactor: Reactor = None, reconnect_policy: ReconnectPolicy = None,
+                 discovery_cache: DiscoveryCache = None, watchdog: Watchdog = None, rpdo_filter: RpdoFilter = None,
+                 recorder: FlightRecorder = None):
         self._bridge = bridge
         self._local_uuid = local_uuid
         self._local_devicename = local_devicename
         self._pin = pin
         self._reference = 1
 
+        # Pre-encoded frames of the commands we send
+        self._templates = TemplateCache(local_uuid, bridge.uuid)
+
         self._queue = queue.Queue()
         self._connected = threading.Event()
         self._stopping = False
+        self._stop_event = threading.Event()
         self._message_thread = None
         self._connection_thread = None
 
+        # Interrupts the message thread when it's waiting for the bridge
+        self._waker = Waker()
+
+        # Deadlines and backoff for (re)connecting, and the history of reconnect attempts
+        self.reconnect_policy = reconnect_policy or ReconnectPolicy()
+
+        # Optional DiscoveryCache to find the bridge again when it isn't at its address anymore
+        self._discovery_cache = discovery_cache
+
+        # Detects a connection that silently stopped delivering messages
+        self.watchdog = watchdog or Watchdog()
+        self._watchdog_timer = None
+
+        # Optional RpdoFilter that drops sensor updates we don't need before they are decoded
+        self.rpdo_filter = rpdo_filter
+        if rpdo_filter is not None:
+            self._bridge.frame_filter = rpdo_filter.accept
+
+        # Optional FlightRecorder that keeps the last frames on the wire, and dumps them when something goes wrong
+        self.recorder = recorder
+        self._bridge.recorder = self.recorder
+
+        # Optional shared Reactor that services our connection instead of the message thread
+        self._reactor = reactor
+        self._keepalive_timer = None
+        self._bridge.reactor = reactor
+
         self.sensors = {}
 
+        # The last SensorUpdate of every sensor
+        self.last_updates = {}
+
+    @property
+    def sensor_received(self) -> dict:
+        """Wall clock time the last update of every sensor arrived at the socket, see Bridge.timestamps."""
+
+        return dict((pdid, update.received) for pdid, update in self.last_updates.items())
+
     # ==================================================================================================================
     # Core functions
     # ==================================================================================================================
@@ -125,6 +183,10 @@ class ComfoConnect(object):
     def connect(self, takeover=False):
         """Connect to the bridge and login. Disconnect existing clients if needed by default."""
 
+        if self._reactor is not None:
+            # The reactor sends our messages, also during the login
+            self._reactor.start()
+
         try:
             # Start connection
             self._connect(takeover=takeover)
@@ -139,12 +201,140 @@ class ComfoConnect(object):
             _LOGGER.error(exc)
             raise Exception('Could not connect to the bridge.')
 
+        return self._start()
+
+    def disconnect(self):
+        """Disconnect from the bridge."""
+
+        self._stop()
+
+        if self._reactor is not None:
+            self._stop_reactor_session()
+
+        elif self._bridge.is_connected():
+            self._bridge.disconnect()
+
+    def serve_handoff(self, path) -> HandoffServer:
+        """Wait on the Unix socket at path for a new process that takes over our session, for example after an upgrade.
+
+        Check handed_off on the returned server to know when we can exit.
+        """
+
+        return HandoffServer(self, path).start()
+
+    def resume_handoff(self, path, timeout=10) -> bool:
+        """Take over the session of a previous process that runs serve_handoff(path), instead of connecting.
+
+        Returns False when there is no previous process, so we have to connect() ourselves.
+        """
+
+        conn = connect_handoff(path, timeout)
+        if conn is None:
+            return False
+
+        with conn:
+            tcpsocket, state = receive_session(conn)
+            try:
+                self.attach_session(tcpsocket, state)
+            except Exception:
+                tcpsocket.close()
+                raise
+
+            conn.sendall(HANDOFF_ACK)
+
+        return True
+
+    def detach_session(self):
+        """Stop servicing our session without closing it. Returns the socket and the state a successor needs."""
+
+        if not self._bridge.is_connected():
+            # We are reconnecting, and keep doing that
+            raise Exception('Not connected!')
+
+        self._stop()
+
+        if self._reactor is not None:
+            self._reactor.unregister(self._bridge)
+            for timer in (self._keepalive_timer, self._watchdog_timer):
+                if timer is not None:
+                    timer.cancel()
+
+            # Wait until the reactor doesn't touch our connection anymore
+            done = threading.Event()
+            self._reactor.call_soon_threadsafe(done.set)
+            done.wait()
+
+        tcpsocket, pending = self._bridge.detach()
+        if tcpsocket is None:
+            # The connection broke while we were stopping, so we have nothing to hand over
+            self._resume()
+            raise Exception('Not connected!')
+
+        return tcpsocket, {
+            'host': self._bridge.host,
+            'port': self._bridge.port,
+            'uuid': self._bridge.uuid.hex(),
+            'local_uuid': self._local_uuid.hex(),
+            'reference': self._reference,
+            'sensors': list(self.sensors.items()),
+            'pending': pending.hex(),
+        }
+
+    def attach_session(self, tcpsocket, state: dict):
+        """Continue a session that was detached with detach_session(), without logging in again."""
+
+        if bytes.fromhex(state['uuid']) != self._bridge.uuid or bytes.fromhex(state['local_uuid']) != self._local_uuid:
+            raise Exception('This session belongs to another bridge or app.')
+
+        if self._reactor is not None:
+            self._reactor.start()
+
+        self._bridge.host = state['host']
+        self._bridge.port = state['port']
+        self._bridge.attach(tcpsocket, bytes.fromhex(state['pending']))
+        self.watchdog.reset()
+
+        # Continue with the next reference, and keep the subscriptions the bridge already knows about
+        self._reference = state['reference']
+        self.sensors = {sensor_id: sensor_type for sensor_id, sensor_type in state['sensors']}
+        if self.rpdo_filter is not None:
+            for sensor_id in self.sensors:
+                self.rpdo_filter.subscribe(sensor_id)
+
+        return self._start(reregister=False)
+
+    def _resume(self):
+        """Reconnect in the background after detach_session() has stopped us, but couldn't hand anything over."""
+
+        self._stopping = False
+        self._stop_event.clear()
+
+        if self._reactor is not None:
+            self._connection_thread = threading.Thread(target=self._reactor_reconnect_loop)
+        else:
+            self._connection_thread = threading.Thread(target=self._connection_thread_loop)
+        self._connection_thread.start()
+
+    def is_connected(self):
+        """Returns whether there is a connection with the bridge."""
+
+        return self._bridge.is_connected()
+
+    def _start(self, reregister=True):
+        """Start servicing our connection."""
+
         # Set the stopping flag
         self._stopping = False
+        self._stop_event.clear()
         self._connected.clear()
 
+        if self._reactor is not None:
+            # The reactor services our connection, so we don't need our own threads
+            self._start_reactor_session(reregister)
+            return True
+
         # Start connection thread
-        self._connection_thread = threading.Thread(target=self._connection_thread_loop)
+        self._connection_thread = threading.Thread(target=self._connection_thread_loop, args=(reregister,))
         self._connection_thread.start()
 
         if not self._connected.wait(10):
@@ -152,20 +342,18 @@ class ComfoConnect(object):
 
         return True
 
-    def disconnect(self):
-        """Disconnect from the bridge."""
+    def _stop(self):
+        """Stop the background threads, but leave the connection open."""
 
         # Set the stopping flag
         self._stopping = True
+        self._stop_event.set()
+        self._waker.wake()
 
         # Wait for the background thread to finish
-        self._connection_thread.join()
-        self._connection_thread = None
-
-    def is_connected(self):
-        """Returns whether there is a connection with the bridge."""
-
-        return self._bridge.is_connected()
+        if self._connection_thread is not None:
+            self._connection_thread.join()
+            self._connection_thread = None
 
     def register_sensor(self, sensor_id: int, sensor_type: int = None):
         """Register a sensor on the bridge and keep it in memory that we are registered to this sensor."""
@@ -176,11 +364,17 @@ class ComfoConnect(object):
         if sensor_type is None:
             raise Exception("Registering sensor %d with unknown type" % sensor_id)
 
+        # Let the updates through before the bridge starts sending them
+        if self.rpdo_filter is not None:
+            self.rpdo_filter.subscribe(sensor_id)
+
         # Register on bridge
         try:
             reply = self.cmd_rpdo_request(sensor_id, sensor_type)
 
         except PyComfoConnectNotAllowed:
+            if self.rpdo_filter is not None:
+                self.rpdo_filter.unsubscribe(sensor_id)
             return None
 
         # Register in memory
@@ -199,25 +393,28 @@ class ComfoConnect(object):
 
         # Unregister in memory
         self.sensors.pop(sensor_id, None)
+        if self.rpdo_filter is not None:
+            self.rpdo_filter.unsubscribe(sensor_id)
 
         # Unregister on bridge
         self.cmd_rpdo_request(sensor_id, sensor_type, timeout=0)
 
-    def _command(self, command, params=None, use_queue=True):
-        """Sends a command and wait for a response if the request is known to return a result."""
+    def _create_message(self, command, params=None):
+        """Construct a message with the next reference. Commands we have sent before aren't serialized again."""
 
-        # Construct the message
-        message = Message.create(
-            self._local_uuid,
-            self._bridge.uuid,
-            command,
-            {'reference': self._reference},
-            params
-        )
+        message = self._templates.create(command, self._reference, params)
 
         # Increase message reference
         self._reference += 1
 
+        return message
+
+    def _command(self, command, params=None, use_queue=True, timeout=5):
+        """Sends a command and wait for a response if the request is known to return a result."""
+
+        # Construct the message
+        message = self._create_message(command, params)
+
         # Send the message
         self._bridge.write_message(message)
 
@@ -226,7 +423,7 @@ class ComfoConnect(object):
             confirm_type = message.class_to_confirm[command]
 
             # Read a message
-            reply = self._get_reply(confirm_type, use_queue=use_queue)
+            reply = self._get_reply(confirm_type, timeout=timeout, use_queue=use_queue)
 
             return reply
 
@@ -236,15 +433,16 @@ class ComfoConnect(object):
     def _get_reply(self, confirm_type=None, timeout=5, use_queue=True):
         """Pops a message of the queue, optionally looking for a specific type."""
 
-        start = time.time()
+        deadline = time.time() + timeout
 
         while True:
             message = None
+            remaining = max(0, deadline - time.time())
 
             if use_queue:
                 try:
                     # Fetch the message from the queue.  The network thread has put it there for us.
-                    message = self._queue.get(timeout=timeout)
+                    message = self._queue.get(timeout=remaining)
                     if message:
                         self._queue.task_done()
                 except queue.Empty:
@@ -253,33 +451,16 @@ class ComfoConnect(object):
 
             else:
                 # Fetch the message directly from the socket
-                message = self._bridge.read_message(timeout=timeout)
+                message = self._bridge.read_message(timeout=remaining)
 
             if message:
                 # Check status code
-                if message.cmd.result == GatewayOperation.OK:
-                    pass
-                elif message.cmd.result == GatewayOperation.BAD_REQUEST:
-                    raise PyComfoConnectBadRequest()
-                elif message.cmd.result == GatewayOperation.INTERNAL_ERROR:
-                    raise PyComfoConnectInternalError()
-                elif message.cmd.result == GatewayOperation.NOT_REACHABLE:
-                    raise PyComfoConnectNotReachable()
-                elif message.cmd.result == GatewayOperation.OTHER_SESSION:
-                    raise PyComfoConnectOtherSession(message.msg.devicename)
-                elif message.cmd.result == GatewayOperation.NOT_ALLOWED:
-                    raise PyComfoConnectNotAllowed()
-                elif message.cmd.result == GatewayOperation.NO_RESOURCES:
-                    raise PyComfoConnectNoResources()
-                elif message.cmd.result == GatewayOperation.NOT_EXIST:
-                    raise PyComfoConnectNotExist()
-                elif message.cmd.result == GatewayOperation.RMI_ERROR:
-                    raise PyComfoConnectRmiError()
+                message.raise_for_result()
 
                 if confirm_type is None:
                     # We just need a message
                     return message
-                elif message.msg.__class__ == confirm_type:
+                elif message.msg_class == confirm_type:
                     # We need the message with the correct type
                     return message
                 else:
@@ -287,132 +468,396 @@ class ComfoConnect(object):
                     # since we just put it back on the queue.
                     self._queue.put(message)
 
-            if time.time() - start > timeout:
+            if time.time() >= deadline:
+                self._dump('Timeout waiting for response')
                 raise ValueError('Timeout waiting for response.')
 
     # ==================================================================================================================
     # Connection thread
     # ==================================================================================================================
-    def _connection_thread_loop(self):
-        """Makes sure that there is a connection open."""
+    def _connection_thread_loop(self, reregister=True):
+        """Makes sure that there is a connection open. reregister is False when the bridge knows our sensors already."""
 
-        self._stopping = False
         while not self._stopping:
 
             # Start connection
+            attempt = None
             if not self.is_connected():
-
-                # Wait a bit to avoid hammering the bridge
-                time.sleep(5)
-
-                try:
-                    # Connect or re-connect
-                    self._connect()
-
-                except PyComfoConnectOtherSession:
-                    self._bridge.disconnect()
-                    _LOGGER.error('Could not connect to the bridge since there is already an open session.')
-                    continue
-
-                except Exception as exc:
-                    _LOGGER.error(exc)
-                    raise Exception('Could not connect to the bridge.')
+                attempt = self._reconnect()
+                if attempt is None:
+                    # We are stopping
+                    break
 
             # Start background thread
             self._message_thread = threading.Thread(target=self._message_thread_loop)
             self._message_thread.start()
 
-            # Re-register for sensor updates
-            for sensor_id in self.sensors:
-                self.cmd_rpdo_request(sensor_id, self.sensors[sensor_id])
+            try:
+                # Re-register for sensor updates
+                if reregister:
+                    self._reregister_sensors()
+
+            except Exception as exc:
+                # Close the connection, so the message thread stops and we start over after a backoff.
+                _LOGGER.error('Could not re-register the sensors: %s', exc)
+                if attempt is not None:
+                    self.reconnect_policy.finish_attempt(attempt, exc)
+                self._bridge.disconnect()
+                self._waker.wake()
+
+            else:
+                if attempt is not None:
+                    self.reconnect_policy.finish_attempt(attempt)
 
             # Send the event that we are ready
             self._connected.set()
+            reregister = True
 
             # Wait until the message thread stops working
             self._message_thread.join()
 
-            # Close socket connection
-            self._bridge.disconnect()
+            # Close socket connection, unless we are stopping and the caller decides what happens with it
+            if self._bridge.is_connected() and not self._stopping:
+                self._bridge.disconnect()
+
+    def _reconnect(self):
+        """Connect to the bridge, backing off exponentially between failed attempts.
+
+        Returns the attempt, or None when stopping. The caller finishes the attempt when the sensors are registered
+        again, a session that can't get its sensors back isn't a success.
+        """
+
+        policy = self.reconnect_policy
+
+        while not self._stopping:
+
+            # The first retry is immediate, the next ones wait a bit longer every time to avoid hammering the bridge
+            delay = policy.next_delay()
+            if delay and self._stop_event.wait(delay):
+                break
+
+            attempt = policy.start_attempt(delay)
+            try:
+                # Connect or re-connect
+                self._connect()
+
+            except PyComfoConnectOtherSession as exc:
+                self._bridge.disconnect()
+                _LOGGER.error('Could not connect to the bridge since there is already an open session.')
+                policy.finish_attempt(attempt, exc)
+                continue
+
+            except Exception as exc:
+                if self._bridge.is_connected():
+                    self._bridge.disconnect()
+                _LOGGER.error('Could not connect to the bridge: %s', exc)
+                policy.finish_attempt(attempt, exc)
+                continue
+
+            return attempt
+
+        return None
+
+    def _reregister_sensors(self):
+        """Register all known sensors again. The requests are queued at once, so they are sent together."""
+
+        messages = [
+            self._create_message(CnRpdoRequest, {'pdid': sensor_id, 'type': sensor_type, 'zone': 1})
+            for sensor_id, sensor_type in list(self.sensors.items())
+        ]
+        if not messages:
+            return
+
+        if not self._bridge.write_messages(messages):
+            raise Exception('Could not send the sensor registrations.')
+
+        for _ in messages:
+            self._get_reply(CnRpdoConfirm)
 
     def _connect(self, takeover=False):
         """Connect to the bridge and login. Disconnect existing clients if needed by default."""
 
-        try:
-            # Connect to the bridge
-            self._bridge.connect()
+        policy = self.reconnect_policy
+
+        # Connect to the bridge
+        self._connect_bridge(policy.connect_timeout)
+
+        deadline = time.time() + policy.handshake_timeout
 
+        def remaining():
+            return max(0, deadline - time.time())
+
+        try:
             # Login
-            self.cmd_start_session(takeover, use_queue=False)
+            self._command(StartSessionRequest, {'takeover': takeover}, use_queue=False, timeout=remaining())
 
         except PyComfoConnectNotAllowed:
             # No dice, maybe we are not registered yet...
 
             # Register
-            self.cmd_register_app(self._local_uuid, self._local_devicename, self._pin, use_queue=False)
+            self._command(
+                RegisterAppRequest,
+                {
+                    'uuid': self._local_uuid,
+                    'devicename': self._local_devicename,
+                    'pin': self._pin,
+                },
+                use_queue=False,
+                timeout=remaining()
+            )
 
             # Login
-            self.cmd_start_session(takeover, use_queue=False)
+            self._command(StartSessionRequest, {'takeover': takeover}, use_queue=False, timeout=remaining())
 
         return True
 
+    def _connect_bridge(self, timeout):
+        """Open the connection. When the bridge isn't at its cached address anymore, look it up by its UUID."""
+
+        try:
+            self._bridge.connect(timeout=timeout)
+
+        except OSError:
+            if self._discovery_cache is None:
+                raise
+
+            found = self._discovery_cache.rediscover(self._bridge)
+            if found is None or found.host == self._bridge.host:
+                raise
+
+            _LOGGER.info('The bridge has moved from %s to %s.', self._bridge.host, found.host)
+            self._bridge.host = found.host
+            self._bridge.connect(timeout=timeout)
+
+        # Let the kernel notice a dead connection too
+        watchdog = self.watchdog
+        watchdog.reset()
+        self._bridge.set_keepalive(watchdog.keepalive_idle, watchdog.keepalive_interval, watchdog.keepalive_count,
+                                   watchdog.stall_timeout)
+
+    def _dump(self, reason):
+        """Write the last frames on the wire to a file, when we have a recorder."""
+
+        if self.recorder is not None:
+            self.recorder.dump_on_error(reason)
+
+    def _check_watchdog(self):
+        """Probe a connection that has been quiet for a while. Returns False when the connection has stalled."""
+
+        status = self.watchdog.poll(self._bridge.last_received)
+
+        if status == Watchdog.STALLED:
+            _LOGGER.warning('The bridge stopped responding. We will try to reconnect.')
+            self._dump('The bridge stopped responding')
+            return False
+
+        if status == Watchdog.PROBE:
+            # A KeepAlive isn't confirmed, so we ask for the time instead
+            message = self._create_message(CnTimeRequest)
+            self.watchdog.probe_sent(message.cmd.reference)
+            self._bridge.queue_messages([message])
+
+        return True
+
+    # ==================================================================================================================
+    # Reactor
+    # ==================================================================================================================
+
+    def _start_reactor_session(self, reregister=True):
+        """Hand our connection to the reactor and re-register for sensor updates."""
+
+        # Reinitialise the queues
+        self._queue = queue.Queue()
+
+        self._reactor.register(self._bridge, self._reactor_messages, self._reactor_disconnected)
+        self._keepalive_timer = self._reactor.call_later(0, self._reactor_keepalive)
+        self._watchdog_timer = self._reactor.call_later(self.watchdog.next_check(self._bridge.last_received),
+                                                        self._reactor_watchdog)
+
+        # Re-register for sensor updates
+        if reregister:
+            self._reregister_sensors()
+
+        # Send the event that we are ready
+        self._connected.set()
+
+    def _stop_reactor_session(self):
+        """Take our connection away from the reactor and close it."""
+
+        self._reactor.unregister(self._bridge)
+        for timer in (self._keepalive_timer, self._watchdog_timer):
+            if timer is not None:
+                timer.cancel()
+        self._keepalive_timer = None
+        self._watchdog_timer = None
+
+        if self._bridge.is_connected():
+            self._bridge.disconnect()
+
+    def _reactor_keepalive(self):
+        """Sends a keepalive every KEEPALIVE seconds. This runs on the reactor thread."""
+
+        if not self._bridge.is_connected():
+            return
+
+        self._keepalive_timer = self._reactor.call_later(KEEPALIVE, self._reactor_keepalive)
+        self.cmd_keepalive()
+
+    def _reactor_watchdog(self):
+        """Check that the bridge still talks to us. This runs on the reactor thread."""
+
+        if not self._bridge.is_connected():
+            return
+
+        if not self._check_watchdog():
+            self._reactor_disconnected()
+            return
+
+        self._watchdog_timer = self._reactor.call_later(self.watchdog.next_check(self._bridge.last_received),
+                                                        self._reactor_watchdog)
+
+    def _reactor_messages(self, messages):
+        """Handle the messages the reactor has read for us. This runs on the reactor thread."""
+
+        if not self._handle_messages(messages):
+            self._reactor_disconnected()
+
+    def _reactor_disconnected(self):
+        """Close our connection and reconnect from a separate thread. This runs on the reactor thread."""
+
+        self._stop_reactor_session()
+
+        if self._stopping:
+            return
+
+        _LOGGER.warning('The connection was broken. We will try to reconnect later.')
+        self._dump('The connection was broken')
+        self._connection_thread = threading.Thread(target=self._reactor_reconnect_loop)
+        self._connection_thread.start()
+
+    def _reactor_reconnect_loop(self):
+        """Reconnect to the bridge, and hand the new connection to the reactor."""
+
+        attempt = self._reconnect()
+        if attempt is None:
+            return
+
+        try:
+            self._start_reactor_session()
+
+        except Exception as exc:
+            # Start over after a backoff
+            _LOGGER.error('Could not re-register the sensors: %s', exc)
+            self.reconnect_policy.finish_attempt(attempt, exc)
+            self._reactor.call_soon_threadsafe(self._reactor_disconnected)
+            return
+
+        self.reconnect_policy.finish_attempt(attempt)
+
     # ==================================================================================================================
     # Message thread
     # ==================================================================================================================
 
     def _message_thread_loop(self):
-        """Listen for incoming messages and queue them or send them to a callback method."""
+        """Listen for incoming messages and queue them or send them to a callback method.
+
+        The thread sleeps until a message arrives, a timer is due, or disconnect() wakes it up.
+        """
 
         # Reinitialise the queues
         self._queue = queue.Queue()
 
-        next_keepalive = 0
+        timers = TimerHeap()
+        timers.call_later(0, self._thread_keepalive, timers)
+        timers.call_later(self.watchdog.next_check(self._bridge.last_received), self._thread_watchdog, timers)
 
         while not self._stopping:
 
-            # Sends a keepalive every KEEPALIVE seconds.
-            if time.time() > next_keepalive:
-                next_keepalive = time.time() + KEEPALIVE
-                self.cmd_keepalive()
+            for timer in timers.pop_due():
+                if not self._bridge.is_connected():
+                    # The timers of a closed connection don't matter anymore, we start over with new ones
+                    break
+                timer.callback(*timer.args)
+
+            if not self._bridge.is_connected():
+                # The watchdog has closed a stalled connection. The connection_thread will restart us.
+                return
 
             try:
-                # Read a message from the bridge.
-                message = self._bridge.read_message()
+                # Read all messages that are available from the bridge.
+                messages = self._bridge.read_messages(timeout=timers.timeout(), waker=self._waker)
 
-            except BrokenPipeError as exc:
+            except OSError as exc:
                 # Close this thread. The connection_thread will restart us.
                 _LOGGER.warning('THe connection was broken. We will try to reconnect later.')
+                self._dump('The connection was broken: %r' % exc)
                 return
 
-            if message:
-                if message.cmd.type == GatewayOperation.CnRpdoNotificationType:
-                    self._handle_rpdo_notification(message)
+            if not self._handle_messages(messages):
+                # Close this thread. The connection_thread will restart us.
+                return
 
-                elif message.cmd.type == GatewayOperation.GatewayNotificationType:
-                    _LOGGER.info('Unhandled GatewayNotificationType')
-                    # TODO: We should probably handle these somehow
-                    pass
+        return
 
-                elif message.cmd.type == GatewayOperation.CnNodeNotificationType:
-                    _LOGGER.info('Unhandled CnNodeNotificationType')
-                    # TODO: We should probably handle these somehow
-                    pass
+    def _thread_keepalive(self, timers):
+        """Sends a keepalive every KEEPALIVE seconds."""
 
-                elif message.cmd.type == GatewayOperation.CnAlarmNotificationType:
-                    _LOGGER.info('Unhandled CnAlarmNotificationType')
-                    # TODO: We should probably handle these somehow
-                    pass
+        timers.call_later(KEEPALIVE, self._thread_keepalive, timers)
+        try:
+            self.cmd_keepalive()
+        except Exception as exc:
+            # The connection was closed under us, the message thread stops when it sees that
+            _LOGGER.debug('Could not send a keepalive: %s', exc)
 
-                elif message.cmd.type == GatewayOperation.CloseSessionRequestType:
-                    _LOGGER.info('The Bridge has asked us to close the connection. We will try to reconnect later.')
-                    # Close this thread. The connection_thread will restart us.
-                    return
+    def _thread_watchdog(self, timers):
+        """Check that the bridge still talks to us, and close the connection when it doesn't."""
 
-                else:
-                    # Send other messages to a queue
-                    self._queue.put(message)
+        try:
+            if not self._check_watchdog():
+                self._bridge.disconnect()
+                return
+        except Exception as exc:
+            # The connection was closed under us, the message thread stops when it sees that
+            _LOGGER.debug('Could not probe the bridge: %s', exc)
+            return
 
-        return
+        timers.call_later(self.watchdog.next_check(self._bridge.last_received), self._thread_watchdog, timers)
+
+    def _handle_messages(self, messages):
+        """Queue messages or send them to a callback method. Returns False when the bridge closed our session."""
+
+        for message in messages:
+            if message.cmd.type == GatewayOperation.CnRpdoNotificationType:
+                self._handle_rpdo_notification(message)
+
+            elif message.cmd.type == GatewayOperation.GatewayNotificationType:
+                _LOGGER.info('Unhandled GatewayNotificationType')
+                # TODO: We should probably handle these somehow
+                pass
+
+            elif message.cmd.type == GatewayOperation.CnNodeNotificationType:
+                _LOGGER.info('Unhandled CnNodeNotificationType')
+                # TODO: We should probably handle these somehow
+                pass
+
+            elif message.cmd.type == GatewayOperation.CnAlarmNotificationType:
+                _LOGGER.info('Unhandled CnAlarmNotificationType')
+                # TODO: We should probably handle these somehow
+                pass
+
+            elif message.cmd.type == GatewayOperation.CloseSessionRequestType:
+                _LOGGER.info('The Bridge has asked us to close the connection. We will try to reconnect later.')
+                return False
+
+            elif self.watchdog.is_probe_reply(message):
+                # We only needed to know that the bridge still answers
+                pass
+
+            else:
+                # Send other messages to a queue
+                self._queue.put(message)
+
+        return True
 
     def _handle_rpdo_notification(self, message):
         """Update internal sensor state and invoke callback."""
@@ -421,22 +866,18 @@ class ComfoConnect(object):
         if message.cmd.type != GatewayOperation.CnRpdoNotificationType:
             return False
 
-        # Extract data
-        data = message.msg.data.hex()
-        if len(data) == 2:
-            val = struct.unpack('b', message.msg.data)[0]
-        elif len(data) == 4:
-            val = struct.unpack('h', message.msg.data)[0]
-        elif len(data) == 8:
-            val = data
-        else:
-            val = data
+        # Extract data, we don't keep the message itself
+        update = SensorUpdate.from_message(message)
+        self.last_updates[update.pdid] = update
 
         # Update local state
         # self.sensors[message.msg.pdid] = val
 
         if self.callback_sensor:
-            self.callback_sensor(message.msg.pdid, val)
+            self.callback_sensor(update.pdid, update.value)
+
+        if self.callback_update:
+            self.callback_update(update)
 
         return True
 
@@ -0,0 +1,76 @@
+import ipaddress
+import logging
+import socket
+import struct
+
+_LOGGER = logging.getLogger('discovery')
+
+# ioctl to query the broadcast address of an interface (Linux)
+SIOCGIFBRDADDR = 0x8919
+
+# The largest CIDR range we probe, a /22
+MAX_RANGE_SIZE = 1024
+
+
+def broadcast_addresses():
+    """Returns the IPv4 broadcast address of every local interface that has one."""
+
+    try:
+        import fcntl
+        names = [name for _, name in socket.if_nameindex()]
+    except (ImportError, AttributeError, OSError):
+        # Not supported on this platform
+        return []
+
+    addresses = set()
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for name in names:
+            try:
+                result = fcntl.ioctl(probe.fileno(), SIOCGIFBRDADDR, struct.pack('256s', name.encode()[:15]))
+            except OSError:
+                # No IPv4 address or no broadcast on this interface
+                continue
+
+            address = socket.inet_ntoa(result[20:24])
+            if address != '0.0.0.0':
+                addresses.add(address)
+    finally:
+        probe.close()
+
+    return sorted(addresses)
+
+
+def expand_targets(targets):
+    """Expand a list of hosts and CIDR ranges (like 192.168.1.0/24) into the addresses to probe.
+
+    Ranges larger than a /22 are refused, a probe for every host of a /8 would flood the network.
+    """
+
+    addresses = []
+    for target in targets:
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+        except ValueError:
+            # A hostname
+            addresses.append(target)
+            continue
+
+        if network.num_addresses > MAX_RANGE_SIZE:
+            raise Exception('%s is too large to probe, split it in ranges of /22 or smaller.' % target)
+
+        if network.num_addresses == 1:
+            addresses.append(str(network.network_address))
+        else:
+            addresses.extend(str(address) for address in network.hosts())
+
+    return addresses
+
+
+def normalize_uuid(uuid):
+    """Accept a UUID as bytes or as a hex string."""
+
+    if isinstance(uuid, str):
+        return bytes.fromhex(uuid)
+
+    return bytes(uuid)
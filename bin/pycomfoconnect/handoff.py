@@ -0,0 +1,156 @@
+import array
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+
+_LOGGER = logging.getLogger('handoff')
+
+# Sent by the successor when it has taken over the session
+HANDOFF_ACK = b'\x01'
+
+
+def send_session(conn, tcpsocket, state: dict):
+    """Send the socket of a bridge session and its state over a Unix socket."""
+
+    data = json.dumps(state).encode()
+
+    # The descriptor travels with the first bytes, the kernel duplicates it in the receiving process
+    conn.sendmsg(
+        [struct.pack('>L', len(data)), data],
+        [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [tcpsocket.fileno()]))]
+    )
+
+
+def receive_session(conn):
+    """Receive the socket of a bridge session and its state from a Unix socket."""
+
+    fds = array.array('i')
+    header, ancdata, flags, address = conn.recvmsg(4, socket.CMSG_LEN(fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+
+    if not fds:
+        raise Exception('No session was received.')
+
+    tcpsocket = socket.socket(fileno=fds[0])
+    for fd in fds[1:]:
+        os.close(fd)
+
+    try:
+        header += _recv_exactly(conn, 4 - len(header))
+        data = _recv_exactly(conn, struct.unpack('>L', header)[0])
+    except Exception:
+        tcpsocket.close()
+        raise
+
+    return tcpsocket, json.loads(data.decode())
+
+
+def connect_handoff(path, timeout=10):
+    """Connect to the HandoffServer at path. Returns None when there is no previous process."""
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        conn.close()
+        return None
+
+    return conn
+
+
+def _recv_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise BrokenPipeError()
+        data += chunk
+
+    return data
+
+
+class HandoffServer(object):
+    """Waits on a Unix socket for a successor process, and hands it the session of a ComfoConnect.
+
+    We keep our copy of the socket until the successor confirms it has taken over. When it doesn't, we continue
+    the session ourselves.
+    """
+
+    def __init__(self, comfoconnect, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+        self.handed_off = threading.Event()
+        self._comfoconnect = comfoconnect
+
+        # A previous process may have left its socket behind
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        # Only our own user may take the session, also between creating the socket and listening on it
+        umask = os.umask(0o177)
+        try:
+            self._server.bind(path)
+        finally:
+            os.umask(umask)
+        self._server.listen(1)
+
+        self._thread = threading.Thread(target=self._serve, name='pycomfoconnect-handoff')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop waiting for a successor."""
+
+        self._server.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _serve(self):
+        while not self.handed_off.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+
+            with conn:
+                conn.settimeout(self.timeout)
+                self._hand_off(conn)
+
+        self.stop()
+
+    def _hand_off(self, conn):
+        try:
+            tcpsocket, state = self._comfoconnect.detach_session()
+        except Exception as exc:
+            _LOGGER.error('Could not hand off the session: %s', exc)
+            return
+
+        try:
+            send_session(conn, tcpsocket, state)
+            if conn.recv(1) != HANDOFF_ACK:
+                raise BrokenPipeError('No confirmation received.')
+
+        except OSError as exc:
+            _LOGGER.error('The successor did not take over the session: %s', exc)
+            self._comfoconnect.attach_session(tcpsocket, state)
+            return
+
+        # The successor has its own descriptor now, closing ours doesn't end the connection
+        tcpsocket.close()
+        _LOGGER.info('The session was handed off.')
+        self.handed_off.set()
@@ -0,0 +1,205 @@
+import collections
+import logging
+import select
+import socket
+import threading
+import time
+
+from google.protobuf.message import DecodeError
+
+from .bridge import Bridge
+from .zehnder_pb2 import DiscoveryOperation
+
+_LOGGER = logging.getLogger('liveness')
+
+# The search request of the discovery, bridges answer it even when another app holds their session
+SEARCH_GATEWAY_REQUEST = b"\x0a\x00"
+
+
+class ProbeResult(object):
+    """Record of a single liveness probe."""
+
+    def __init__(self, sent, rtt=None):
+        self.sent = sent
+        self.rtt = rtt
+
+    @property
+    def reachable(self):
+        return self.rtt is not None
+
+    def __repr__(self):
+        return 'ProbeResult(sent=%.3f, rtt=%s)' % (self.sent, self.rtt)
+
+
+class BridgeStatus(object):
+    """Reachability and round trip times of a bridge."""
+
+    def __init__(self, host, history_size=100):
+        self.host = host
+        self.uuid = None
+        self.last_seen = None
+        self.history = collections.deque(maxlen=history_size)
+
+        self.address = host
+        self.resolve()
+
+    def resolve(self):
+        """Look the address of the host up again, a bridge can get another address from DHCP."""
+
+        try:
+            self.address = socket.gethostbyname(self.host)
+        except OSError as exc:
+            _LOGGER.debug('Could not resolve %s: %s', self.host, exc)
+
+    @property
+    def reachable(self):
+        """Returns whether the bridge has answered the last probe."""
+
+        return bool(self.history) and self.history[-1].reachable
+
+    @property
+    def rtt(self):
+        """Returns the round trip time of the last probe that was answered, in seconds."""
+
+        for result in reversed(self.history):
+            if result.reachable:
+                return result.rtt
+
+        return None
+
+    @property
+    def loss(self):
+        """Returns the fraction of the probes in the history that weren't answered."""
+
+        if not self.history:
+            return 0
+
+        return len([result for result in self.history if not result.reachable]) / len(self.history)
+
+
+class LivenessMonitor(object):
+    """Polls many bridges with the UDP search request of the discovery, without touching their TCP sessions.
+
+    Every interval seconds, all bridges are probed at once, and a probe that isn't answered within timeout
+    seconds counts as lost. The host of a lost probe is resolved again in the background, and its new address is
+    used from the next round on, a slow DNS lookup doesn't hold up the probes of the other bridges.
+    """
+
+    def __init__(self, hosts, interval=10, timeout=1, history_size=100):
+        self.interval = interval
+        self.timeout = timeout
+
+        self.statuses = collections.OrderedDict((host, BridgeStatus(host, history_size)) for host in hosts)
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Threads that look up the hosts of lost probes again, by host
+        self._resolvers = {}
+
+    def start(self):
+        """Start probing in a background thread."""
+
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, name='pycomfoconnect-liveness')
+            self._thread.daemon = True
+            self._thread.start()
+
+        return self
+
+    def stop(self):
+        """Stop probing."""
+
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def status(self, host) -> BridgeStatus:
+        return self.statuses[host]
+
+    def probe(self) -> dict:
+        """Probe all bridges once. Returns the result for every host."""
+
+        udpsocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udpsocket.setblocking(0)
+
+        parser = DiscoveryOperation()
+        results = {}
+
+        # The probes that weren't answered yet by host, and the hosts by address. Hosts can share an address.
+        waiting = {}
+        hosts = collections.defaultdict(list)
+
+        try:
+            # Send all probes at once, and remember when they left
+            for status in self.statuses.values():
+                sent = time.monotonic()
+                try:
+                    udpsocket.sendto(SEARCH_GATEWAY_REQUEST, (status.address, Bridge.PORT))
+                except OSError as exc:
+                    _LOGGER.debug('Could not probe %s: %s', status.host, exc)
+                    results[status.host] = ProbeResult(time.time())
+                    continue
+                waiting[status.host] = (status, sent, time.time())
+                hosts[status.address].append(status.host)
+
+            deadline = time.monotonic() + self.timeout
+            while waiting:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                ready = select.select([udpsocket], [], [], remaining)
+                if not ready[0]:
+                    break
+
+                try:
+                    data, source = udpsocket.recvfrom(1024)
+                    parser.ParseFromString(data)
+                except (OSError, DecodeError):
+                    continue
+
+                received = time.monotonic()
+                for host in hosts.pop(source[0], []):
+                    status, sent, wall = waiting.pop(host)
+                    status.uuid = parser.searchGatewayResponse.uuid
+                    status.last_seen = time.time()
+                    results[host] = ProbeResult(wall, received - sent)
+
+        finally:
+            udpsocket.close()
+
+        # What is left didn't answer on time
+        for status, sent, wall in waiting.values():
+            results[status.host] = ProbeResult(wall)
+
+        for host, result in results.items():
+            self.statuses[host].history.append(result)
+
+        self._resolve([self.statuses[host] for host, result in results.items() if not result.reachable])
+
+        return results
+
+    def _resolve(self, statuses):
+        """Resolve the hosts of lost probes again, each in its own thread so one slow lookup doesn't hold up others."""
+
+        for status in statuses:
+            resolver = self._resolvers.get(status.host)
+            if resolver is not None and resolver.is_alive():
+                continue
+
+            resolver = threading.Thread(target=status.resolve, name='pycomfoconnect-resolve')
+            resolver.daemon = True
+            resolver.start()
+            self._resolvers[status.host] = resolver
+
+    def _loop(self):
+        next_probe = time.monotonic()
+        while not self._stop_event.wait(max(0, next_probe - time.monotonic())):
+            next_probe += self.interval
+            self.probe()
+
+            # Don't try to catch up with rounds we have missed
+            next_probe = max(next_probe, time.monotonic())
@@ -1,180 +1,199 @@
 import struct
 
+from . import zehnder_pb2
 from .error import *
-from .zehnder_pb2 import *
+from .zehnder_pb2 import GatewayOperation
+
+# Offset of the GatewayOperation in a frame: length, source UUID, destination UUID and the length of the operation
+CMD_OFFSET = 4 + 16 + 16 + 2
+
+# Key of the reference field (4) of a GatewayOperation, with the varint wire type
+REFERENCE_KEY = b'\x20'
+
+
+def encode_varint(value) -> bytes:
+    """Encode an unsigned protobuf varint."""
+
+    data = bytearray()
+    while value > 0x7f:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+
+    return bytes(data)
+
+
+# Replies that aren't called <command>Confirm
+CONFIRM_NAMES = {
+    'CnRmiRequest': 'CnRmiResponse',
+}
+
+
+class LazyMapping(dict):
+    """A dict that looks up missing keys with a function, and remembers the result."""
+
+    def __init__(self, lookup):
+        super().__init__()
+        self._lookup = lookup
+
+    def __missing__(self, key):
+        try:
+            value = self._lookup(key)
+        except (AttributeError, ValueError):
+            raise KeyError(key)
+
+        self[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def _operation_type(command) -> int:
+    """Returns the GatewayOperation type of a message class."""
+
+    return GatewayOperation.OperationType.Value(command.DESCRIPTOR.name + 'Type')
+
+
+def _confirm_class(command):
+    """Returns the class of the reply to a request class."""
+
+    name = command.DESCRIPTOR.name
+    if not name.endswith('Request'):
+        raise ValueError(name)
+
+    return getattr(zehnder_pb2, CONFIRM_NAMES.get(name, name[:-len('Request')] + 'Confirm'))
+
+
+def _message_class(operation_type):
+    """Returns the message class of a GatewayOperation type."""
+
+    name = GatewayOperation.OperationType.Name(operation_type)
+    if not name.endswith('Type'):
+        raise ValueError(name)
+
+    return getattr(zehnder_pb2, name[:-len('Type')])
 
 
 class Message(object):
-    class_to_type = {
-        SetAddressRequest: GatewayOperation.SetAddressRequestType,
-        RegisterAppRequest: GatewayOperation.RegisterAppRequestType,
-        StartSessionRequest: GatewayOperation.StartSessionRequestType,
-        CloseSessionRequest: GatewayOperation.CloseSessionRequestType,
-        ListRegisteredAppsRequest: GatewayOperation.ListRegisteredAppsRequestType,
-        DeregisterAppRequest: GatewayOperation.DeregisterAppRequestType,
-        ChangePinRequest: GatewayOperation.ChangePinRequestType,
-        GetRemoteAccessIdRequest: GatewayOperation.GetRemoteAccessIdRequestType,
-        SetRemoteAccessIdRequest: GatewayOperation.SetRemoteAccessIdRequestType,
-        GetSupportIdRequest: GatewayOperation.GetSupportIdRequestType,
-        SetSupportIdRequest: GatewayOperation.SetSupportIdRequestType,
-        GetWebIdRequest: GatewayOperation.GetWebIdRequestType,
-        SetWebIdRequest: GatewayOperation.SetWebIdRequestType,
-        SetPushIdRequest: GatewayOperation.SetPushIdRequestType,
-        DebugRequest: GatewayOperation.DebugRequestType,
-        UpgradeRequest: GatewayOperation.UpgradeRequestType,
-        SetDeviceSettingsRequest: GatewayOperation.SetDeviceSettingsRequestType,
-        VersionRequest: GatewayOperation.VersionRequestType,
-        SetAddressConfirm: GatewayOperation.SetAddressConfirmType,
-        RegisterAppConfirm: GatewayOperation.RegisterAppConfirmType,
-        StartSessionConfirm: GatewayOperation.StartSessionConfirmType,
-        CloseSessionConfirm: GatewayOperation.CloseSessionConfirmType,
-        ListRegisteredAppsConfirm: GatewayOperation.ListRegisteredAppsConfirmType,
-        DeregisterAppConfirm: GatewayOperation.DeregisterAppConfirmType,
-        ChangePinConfirm: GatewayOperation.ChangePinConfirmType,
-        GetRemoteAccessIdConfirm: GatewayOperation.GetRemoteAccessIdConfirmType,
-        SetRemoteAccessIdConfirm: GatewayOperation.SetRemoteAccessIdConfirmType,
-        GetSupportIdConfirm: GatewayOperation.GetSupportIdConfirmType,
-        SetSupportIdConfirm: GatewayOperation.SetSupportIdConfirmType,
-        GetWebIdConfirm: GatewayOperation.GetWebIdConfirmType,
-        SetWebIdConfirm: GatewayOperation.SetWebIdConfirmType,
-        SetPushIdConfirm: GatewayOperation.SetPushIdConfirmType,
-        DebugConfirm: GatewayOperation.DebugConfirmType,
-        UpgradeConfirm: GatewayOperation.UpgradeConfirmType,
-        SetDeviceSettingsConfirm: GatewayOperation.SetDeviceSettingsConfirmType,
-        VersionConfirm: GatewayOperation.VersionConfirmType,
-        GatewayNotification: GatewayOperation.GatewayNotificationType,
-        KeepAlive: GatewayOperation.KeepAliveType,
-        FactoryReset: GatewayOperation.FactoryResetType,
-        CnTimeRequest: GatewayOperation.CnTimeRequestType,
-        CnTimeConfirm: GatewayOperation.CnTimeConfirmType,
-        CnNodeRequest: GatewayOperation.CnNodeRequestType,
-        CnNodeNotification: GatewayOperation.CnNodeNotificationType,
-        CnRmiRequest: GatewayOperation.CnRmiRequestType,
-        CnRmiResponse: GatewayOperation.CnRmiResponseType,
-        CnRmiAsyncRequest: GatewayOperation.CnRmiAsyncRequestType,
-        CnRmiAsyncConfirm: GatewayOperation.CnRmiAsyncConfirmType,
-        CnRmiAsyncResponse: GatewayOperation.CnRmiAsyncResponseType,
-        CnRpdoRequest: GatewayOperation.CnRpdoRequestType,
-        CnRpdoConfirm: GatewayOperation.CnRpdoConfirmType,
-        CnRpdoNotification: GatewayOperation.CnRpdoNotificationType,
-        CnAlarmNotification: GatewayOperation.CnAlarmNotificationType,
-        CnFupReadRegisterRequest: GatewayOperation.CnFupReadRegisterRequestType,
-        CnFupReadRegisterConfirm: GatewayOperation.CnFupReadRegisterConfirmType,
-        CnFupProgramBeginRequest: GatewayOperation.CnFupProgramBeginRequestType,
-        CnFupProgramBeginConfirm: GatewayOperation.CnFupProgramBeginConfirmType,
-        CnFupProgramRequest: GatewayOperation.CnFupProgramRequestType,
-        CnFupProgramConfirm: GatewayOperation.CnFupProgramConfirmType,
-        CnFupProgramEndRequest: GatewayOperation.CnFupProgramEndRequestType,
-        CnFupProgramEndConfirm: GatewayOperation.CnFupProgramEndConfirmType,
-        CnFupReadRequest: GatewayOperation.CnFupReadRequestType,
-        CnFupReadConfirm: GatewayOperation.CnFupReadConfirmType,
-        CnFupResetRequest: GatewayOperation.CnFupResetRequestType,
-        CnFupResetConfirm: GatewayOperation.CnFupResetConfirmType,
-    }
-
-    class_to_confirm = {
-        SetAddressRequest: SetAddressConfirm,
-        RegisterAppRequest: RegisterAppConfirm,
-        StartSessionRequest: StartSessionConfirm,
-        CloseSessionRequest: CloseSessionConfirm,
-        ListRegisteredAppsRequest: ListRegisteredAppsConfirm,
-        DeregisterAppRequest: DeregisterAppConfirm,
-        ChangePinRequest: ChangePinConfirm,
-        GetRemoteAccessIdRequest: GetRemoteAccessIdConfirm,
-        SetRemoteAccessIdRequest: SetRemoteAccessIdConfirm,
-        GetSupportIdRequest: GetSupportIdConfirm,
-        SetSupportIdRequest: SetSupportIdConfirm,
-        GetWebIdRequest: GetWebIdConfirm,
-        SetWebIdRequest: SetWebIdConfirm,
-        SetPushIdRequest: SetPushIdConfirm,
-        DebugRequest: DebugConfirm,
-        UpgradeRequest: UpgradeConfirm,
-        SetDeviceSettingsRequest: SetDeviceSettingsConfirm,
-        VersionRequest: VersionConfirm,
-        CnTimeRequest: CnTimeConfirm,
-        CnRmiRequest: CnRmiResponse,
-        CnRmiAsyncRequest: CnRmiAsyncConfirm,
-        CnRpdoRequest: CnRpdoConfirm,
-        CnFupReadRegisterRequest: CnFupReadRegisterConfirm,
-        CnFupProgramBeginRequest: CnFupProgramBeginConfirm,
-        CnFupProgramRequest: CnFupProgramConfirm,
-        CnFupProgramEndRequest: CnFupProgramEndConfirm,
-        CnFupReadRequest: CnFupReadConfirm,
-        CnFupResetRequest: CnFupResetConfirm,
-    }
-
-    request_type_to_class_mapping = {
-        GatewayOperation.SetAddressRequestType: SetAddressRequest,
-        GatewayOperation.RegisterAppRequestType: RegisterAppRequest,
-        GatewayOperation.StartSessionRequestType: StartSessionRequest,
-        GatewayOperation.CloseSessionRequestType: CloseSessionRequest,
-        GatewayOperation.ListRegisteredAppsRequestType: ListRegisteredAppsRequest,
-        GatewayOperation.DeregisterAppRequestType: DeregisterAppRequest,
-        GatewayOperation.ChangePinRequestType: ChangePinRequest,
-        GatewayOperation.GetRemoteAccessIdRequestType: GetRemoteAccessIdRequest,
-        GatewayOperation.SetRemoteAccessIdRequestType: SetRemoteAccessIdRequest,
-        GatewayOperation.GetSupportIdRequestType: GetSupportIdRequest,
-        GatewayOperation.SetSupportIdRequestType: SetSupportIdRequest,
-        GatewayOperation.GetWebIdRequestType: GetWebIdRequest,
-        GatewayOperation.SetWebIdRequestType: SetWebIdRequest,
-        GatewayOperation.SetPushIdRequestType: SetPushIdRequest,
-        GatewayOperation.DebugRequestType: DebugRequest,
-        GatewayOperation.UpgradeRequestType: UpgradeRequest,
-        GatewayOperation.SetDeviceSettingsRequestType: SetDeviceSettingsRequest,
-        GatewayOperation.VersionRequestType: VersionRequest,
-        GatewayOperation.SetAddressConfirmType: SetAddressConfirm,
-        GatewayOperation.RegisterAppConfirmType: RegisterAppConfirm,
-        GatewayOperation.StartSessionConfirmType: StartSessionConfirm,
-        GatewayOperation.CloseSessionConfirmType: CloseSessionConfirm,
-        GatewayOperation.ListRegisteredAppsConfirmType: ListRegisteredAppsConfirm,
-        GatewayOperation.DeregisterAppConfirmType: DeregisterAppConfirm,
-        GatewayOperation.ChangePinConfirmType: ChangePinConfirm,
-        GatewayOperation.GetRemoteAccessIdConfirmType: GetRemoteAccessIdConfirm,
-        GatewayOperation.SetRemoteAccessIdConfirmType: SetRemoteAccessIdConfirm,
-        GatewayOperation.GetSupportIdConfirmType: GetSupportIdConfirm,
-        GatewayOperation.SetSupportIdConfirmType: SetSupportIdConfirm,
-        GatewayOperation.GetWebIdConfirmType: GetWebIdConfirm,
-        GatewayOperation.SetWebIdConfirmType: SetWebIdConfirm,
-        GatewayOperation.SetPushIdConfirmType: SetPushIdConfirm,
-        GatewayOperation.DebugConfirmType: DebugConfirm,
-        GatewayOperation.UpgradeConfirmType: UpgradeConfirm,
-        GatewayOperation.SetDeviceSettingsConfirmType: SetDeviceSettingsConfirm,
-        GatewayOperation.VersionConfirmType: VersionConfirm,
-        GatewayOperation.GatewayNotificationType: GatewayNotification,
-        GatewayOperation.KeepAliveType: KeepAlive,
-        GatewayOperation.FactoryResetType: FactoryReset,
-        GatewayOperation.CnTimeRequestType: CnTimeRequest,
-        GatewayOperation.CnTimeConfirmType: CnTimeConfirm,
-        GatewayOperation.CnNodeRequestType: CnNodeRequest,
-        GatewayOperation.CnNodeNotificationType: CnNodeNotification,
-        GatewayOperation.CnRmiRequestType: CnRmiRequest,
-        GatewayOperation.CnRmiResponseType: CnRmiResponse,
-        GatewayOperation.CnRmiAsyncRequestType: CnRmiAsyncRequest,
-        GatewayOperation.CnRmiAsyncConfirmType: CnRmiAsyncConfirm,
-        GatewayOperation.CnRmiAsyncResponseType: CnRmiAsyncResponse,
-        GatewayOperation.CnRpdoRequestType: CnRpdoRequest,
-        GatewayOperation.CnRpdoConfirmType: CnRpdoConfirm,
-        GatewayOperation.CnRpdoNotificationType: CnRpdoNotification,
-        GatewayOperation.CnAlarmNotificationType: CnAlarmNotification,
-        GatewayOperation.CnFupReadRegisterRequestType: CnFupReadRegisterRequest,
-        GatewayOperation.CnFupReadRegisterConfirmType: CnFupReadRegisterConfirm,
-        GatewayOperation.CnFupProgramBeginRequestType: CnFupProgramBeginRequest,
-        GatewayOperation.CnFupProgramBeginConfirmType: CnFupProgramBeginConfirm,
-        GatewayOperation.CnFupProgramRequestType: CnFupProgramRequest,
-        GatewayOperation.CnFupProgramConfirmType: CnFupProgramConfirm,
-        GatewayOperation.CnFupProgramEndRequestType: CnFupProgramEndRequest,
-        GatewayOperation.CnFupProgramEndConfirmType: CnFupProgramEndConfirm,
-        GatewayOperation.CnFupReadRequestType: CnFupReadRequest,
-        GatewayOperation.CnFupReadConfirmType: CnFupReadConfirm,
-        GatewayOperation.CnFupResetRequestType: CnFupResetRequest,
-        GatewayOperation.CnFupResetConfirmType: CnFupResetConfirm,
-    }
-
-    def __init__(self, cmd, msg, src, dst):
-        self.cmd = cmd
-        self.msg = msg
-        self.src = src
-        self.dst = dst
+    # Messages are kept in queues and histories, so they don't get a __dict__
+    __slots__ = ('_cmd', '_msg', '_src', '_dst', '_msg_buf', '_frame', 'received')
+
+    # Looked up by name, so only the message classes that are used get created
+    class_to_type = LazyMapping(_operation_type)
+    class_to_confirm = LazyMapping(_confirm_class)
+    request_type_to_class_mapping = LazyMapping(_message_class)
+
+    def __init__(self, cmd, msg, src, dst, received=None):
+        self._cmd = cmd
+        self._msg = msg
+        self._src = src
+        self._dst = dst
+
+        # Serialized body of a decoded message, until someone needs msg
+        self._msg_buf = None
+
+        # Complete frame of a message that was built from a FrameTemplate, until the message is changed
+        self._frame = None
+
+        # Wall clock time the message arrived on the socket, for messages we have received
+        self.received = received
+
+    @property
+    def src(self) -> bytes:
+        """UUID of the sender. Decoded messages only copy it out of the receive buffer when it is needed."""
+
+        if not isinstance(self._src, bytes):
+            self._src = bytes(self._src)
+        return self._src
+
+    @src.setter
+    def src(self, value):
+        self._drop_frame()
+        self._src = value
+
+    @property
+    def dst(self) -> bytes:
+        """UUID of the receiver. Decoded messages only copy it out of the receive buffer when it is needed."""
+
+        if not isinstance(self._dst, bytes):
+            self._dst = bytes(self._dst)
+        return self._dst
+
+    @dst.setter
+    def dst(self, value):
+        self._drop_frame()
+        self._dst = value
+
+    @property
+    def cmd(self):
+        """GatewayOperation header. Messages from a FrameTemplate only parse it when it is needed."""
+
+        if self._cmd is None and self._frame is not None:
+            cmd_end = CMD_OFFSET + struct.unpack_from('>H', self._frame, CMD_OFFSET - 2)[0]
+            cmd = GatewayOperation()
+            cmd.ParseFromString(memoryview(self._frame)[CMD_OFFSET:cmd_end])
+            self._cmd = cmd
+        return self._cmd
+
+    @cmd.setter
+    def cmd(self, value):
+        self._drop_frame()
+        self._cmd = value
+
+    @property
+    def msg(self):
+        """Body of the message. Decoded messages only parse it when it is needed."""
+
+        if self._msg is None and self._msg_buf is None and self._frame is not None:
+            cmd_end = CMD_OFFSET + struct.unpack_from('>H', self._frame, CMD_OFFSET - 2)[0]
+            self._msg_buf = memoryview(self._frame)[cmd_end:]
+
+        if self._msg is None and self._msg_buf is not None:
+            msg = self.request_type_to_class_mapping[self.cmd.type]()
+            msg.ParseFromString(self._msg_buf)
+            self._msg = msg
+            self._msg_buf = None
+        return self._msg
+
+    @msg.setter
+    def msg(self, value):
+        self._drop_frame()
+        self._msg = value
+        self._msg_buf = None
+
+    def _drop_frame(self):
+        """Parse the pre-encoded frame before the message is changed, so it's encoded again."""
+
+        if self._frame is not None:
+            self.cmd, self.msg
+            self._frame = None
+
+    def _frame_unchanged(self):
+        """Returns whether the parts of the pre-encoded frame that were parsed still serialize to the same bytes."""
+
+        if self._cmd is None and self._msg is None:
+            return True
+
+        frame = self._frame
+        cmd_end = CMD_OFFSET + struct.unpack_from('>H', frame, CMD_OFFSET - 2)[0]
+        if self._cmd is not None and self._cmd.SerializeToString() != frame[CMD_OFFSET:cmd_end]:
+            return False
+        if self._msg is not None and self._msg.SerializeToString() != frame[cmd_end:]:
+            return False
+
+        return True
+
+    @property
+    def msg_class(self):
+        """Class of the body, without parsing it."""
+
+        if self._msg is not None:
+            return self._msg.__class__
+        return self.request_type_to_class_mapping.get(self.cmd.type)
 
     @classmethod
     def create(cls, src, dst, command, cmd_params=None, msg_params=None):
@@ -194,6 +213,28 @@ class Message(object):
 
         return Message(cmd, msg, src, dst)
 
+    def raise_for_result(self):
+        """Raise the error that corresponds with the result code of this message."""
+
+        if self.cmd.result == GatewayOperation.OK:
+            pass
+        elif self.cmd.result == GatewayOperation.BAD_REQUEST:
+            raise PyComfoConnectBadRequest()
+        elif self.cmd.result == GatewayOperation.INTERNAL_ERROR:
+            raise PyComfoConnectInternalError()
+        elif self.cmd.result == GatewayOperation.NOT_REACHABLE:
+            raise PyComfoConnectNotReachable()
+        elif self.cmd.result == GatewayOperation.OTHER_SESSION:
+            raise PyComfoConnectOtherSession(self.msg.devicename)
+        elif self.cmd.result == GatewayOperation.NOT_ALLOWED:
+            raise PyComfoConnectNotAllowed()
+        elif self.cmd.result == GatewayOperation.NO_RESOURCES:
+            raise PyComfoConnectNoResources()
+        elif self.cmd.result == GatewayOperation.NOT_EXIST:
+            raise PyComfoConnectNotExist()
+        elif self.cmd.result == GatewayOperation.RMI_ERROR:
+            raise PyComfoConnectRmiError()
+
     def __str__(self):
         return "%s -> %s: %s %s\n%s\n%s" % (
             self.src.hex(),
@@ -205,29 +246,121 @@ class Message(object):
         )
 
     def encode(self):
+        return b''.join(self.encode_parts())
+
+    def encode_parts(self):
+        """Returns the packet as a list of buffers that can be sent with scatter-gather I/O."""
+
+        if self._frame is not None:
+            if self._frame_unchanged():
+                return [self._frame]
+
+            # Changed in place after it was created from a template
+            self._drop_frame()
+
         cmd_buf = self.cmd.SerializeToString()
-        msg_buf = self.msg.SerializeToString()
+        if self._msg is None and self._msg_buf is not None:
+            # Nobody has looked at the body, so it's still the same
+            msg_buf = bytes(self._msg_buf)
+        else:
+            msg_buf = self.msg.SerializeToString()
         cmd_len_buf = struct.pack('>H', len(cmd_buf))
         msg_len_buf = struct.pack('>L', 16 + 16 + 2 + len(cmd_buf) + len(msg_buf))
 
-        return msg_len_buf + self.src + self.dst + cmd_len_buf + cmd_buf + msg_buf
+        return [msg_len_buf, self.src, self.dst, cmd_len_buf, cmd_buf, msg_buf]
 
     @classmethod
-    def decode(cls, packet):
+    def decode(cls, packet, received=None):
+
+        # Work on slices of the packet without copying them
+        packet = memoryview(packet)
 
         src_buf = packet[4:20]
         dst_buf = packet[20:36]
-        cmd_len = struct.unpack('>H', packet[36:38])[0]
+        cmd_len = struct.unpack_from('>H', packet, 36)[0]
         cmd_buf = packet[38:38 + cmd_len]
         msg_buf = packet[38 + cmd_len:]
 
-        # Parse command
+        # Parse command, the message is only parsed when it is used
         cmd = GatewayOperation()
         cmd.ParseFromString(cmd_buf)
 
-        # Parse message
-        cmd_type = cls.request_type_to_class_mapping.get(cmd.type)
-        msg = cmd_type()
-        msg.ParseFromString(msg_buf)
+        message = Message(cmd, None, src_buf, dst_buf, received)
+        message._msg_buf = msg_buf
+
+        return message
+
+
+class FrameTemplate(object):
+    """A command that is serialized once. Every message that is created from it only gets its own reference.
+
+    The header of a frame is the serialized GatewayOperation without a reference, followed by the reference field,
+    exactly like protobuf would serialize it. Only the bytes of the reference are patched in a copy of the frame.
+    When cmd or msg of such a message is changed in place, it's noticed when it's encoded, and encoded again.
+    """
+
+    def __init__(self, src, dst, command, msg_params=None):
+        message = Message.create(src, dst, command, None, msg_params)
+
+        self.command = command
+        self._parts = (src, dst, message.cmd.SerializeToString(), message.msg.SerializeToString())
+
+        # Frames by the size of the reference, and the offset of the reference in them
+        self._frames = {}
+
+    def _frame(self, size):
+        frame = self._frames.get(size)
+        if frame is None:
+            src, dst, cmd_buf, msg_buf = self._parts
+            cmd_buf += REFERENCE_KEY + bytes(size)
+            data = b''.join([
+                struct.pack('>L', 16 + 16 + 2 + len(cmd_buf) + len(msg_buf)), src, dst,
+                struct.pack('>H', len(cmd_buf)), cmd_buf, msg_buf
+            ])
+            frame = self._frames[size] = (data, CMD_OFFSET + len(cmd_buf) - size)
+
+        return frame
+
+    def create(self, reference) -> Message:
+        """Returns a message of this command with the given reference."""
+
+        reference_buf = encode_varint(reference)
+        data, offset = self._frame(len(reference_buf))
+
+        frame = bytearray(data)
+        frame[offset:offset + len(reference_buf)] = reference_buf
+
+        message = Message(None, None, self._parts[0], self._parts[1])
+        message._frame = frame
+
+        return message
+
+
+class TemplateCache(object):
+    """Creates messages from a FrameTemplate for every command and parameters we have seen before."""
+
+    # We don't keep more templates than this, commands with other parameters are serialized every time
+    MAX_TEMPLATES = 256
+
+    def __init__(self, src, dst):
+        self.src = src
+        self.dst = dst
+        self._templates = {}
+
+    def create(self, command, reference, msg_params=None) -> Message:
+        """Returns a message of this command with the given reference."""
+
+        try:
+            key = (command, tuple(sorted(msg_params.items())) if msg_params else ())
+            template = self._templates.get(key)
+        except TypeError:
+            # We can't use these parameters as a key
+            key = template = None
+
+        if template is None:
+            if key is None or len(self._templates) >= self.MAX_TEMPLATES:
+                return Message.create(self.src, self.dst, command, {'reference': reference}, msg_params)
+
+            template = self._templates[key] = FrameTemplate(self.src, self.dst, command, msg_params)
 
-        return Message(cmd, msg, src_buf, dst_buf)
+        return template.create(reference)
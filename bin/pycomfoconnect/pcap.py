@@ -0,0 +1,514 @@
+import collections
+import socket
+import struct
+
+from .bridge import Bridge
+from .capture import CaptureWriter
+from .message import Message
+from .recorder import RX, TX
+
+# Magic numbers of a pcap file, and whether its timestamps are in nanoseconds
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', False),
+    b'\xa1\xb2\xc3\xd4': ('>', False),
+    b'\x4d\x3c\xb2\xa1': ('<', True),
+    b'\xa1\xb2\x3c\x4d': ('>', True),
+}
+
+# Block types of a pcapng file
+_SECTION_HEADER_BLOCK = 0x0a0d0d0a
+_INTERFACE_DESCRIPTION_BLOCK = 1
+_PACKET_BLOCK = 2
+_SIMPLE_PACKET_BLOCK = 3
+_ENHANCED_PACKET_BLOCK = 6
+
+# Options of an interface description block
+_OPTION_END = 0
+_OPTION_TSRESOL = 9
+_OPTION_TSOFFSET = 14
+
+# Link layer types
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+# Ether types we look through
+_ETHERTYPE_IPV4 = 0x0800
+_ETHERTYPE_IPV6 = 0x86dd
+_ETHERTYPE_VLAN = (0x8100, 0x88a8)
+
+_IPPROTO_TCP = 6
+
+# IPv6 extension headers we skip: hop-by-hop options, routing and destination options
+_IPV6_EXTENSIONS = (0, 43, 60)
+
+_TCP_FIN = 0x01
+_TCP_SYN = 0x02
+_TCP_RST = 0x04
+
+# A frame is at least the length, the two UUIDs and the length of the GatewayOperation. We don't believe a length
+# over MAX_FRAME_SIZE, that's a stream we aren't in sync with.
+_FRAME_HEADER_SIZE = 4 + 16 + 16 + 2
+MAX_FRAME_SIZE = 1 << 16
+
+PcapFrame = collections.namedtuple('PcapFrame', ['timestamp', 'direction', 'connection', 'data'])
+
+
+def read_packets(pcapfile):
+    """Yields the timestamp, link layer type and data of every packet in a pcap or pcapng file object.
+
+    The file is read as a stream, only the packet that is yielded is kept in memory. A truncated last packet is
+    ignored.
+    """
+
+    magic = pcapfile.read(4)
+    if magic in _PCAP_MAGIC:
+        return _read_pcap(pcapfile, *_PCAP_MAGIC[magic])
+
+    if len(magic) == 4 and struct.unpack('>L', magic)[0] == _SECTION_HEADER_BLOCK:
+        return _read_pcapng(pcapfile, magic)
+
+    raise Exception('Not a pcap or pcapng file.')
+
+
+def _read_pcap(pcapfile, byteorder, nanoseconds):
+    header = pcapfile.read(20)
+    if len(header) < 20:
+        return
+
+    linktype = struct.unpack(byteorder + 'HHiIII', header)[5] & 0xffff
+    resolution = 1e-9 if nanoseconds else 1e-6
+    record = struct.Struct(byteorder + 'IIII')
+
+    while True:
+        header = pcapfile.read(record.size)
+        if len(header) < record.size:
+            return
+
+        seconds, fraction, captured, length = record.unpack(header)
+        data = pcapfile.read(captured)
+        if len(data) < captured:
+            return
+
+        yield seconds + fraction * resolution, linktype, data
+
+
+def _read_pcapng(pcapfile, first):
+    byteorder = '<'
+
+    # Link layer type, timestamp resolution and offset of every interface in the current section
+    interfaces = []
+    timestamp = 0.0
+
+    block_type = struct.unpack('>L', first)[0]
+    while True:
+        header = pcapfile.read(4)
+        if len(header) < 4:
+            return
+
+        if block_type == _SECTION_HEADER_BLOCK:
+            # The byte order magic tells how to read the length too
+            body = pcapfile.read(4)
+            if len(body) < 4:
+                return
+            byteorder = '<' if body == b'\x4d\x3c\x2b\x1a' else '>'
+            total_length = struct.unpack(byteorder + 'L', header)[0]
+            body += pcapfile.read(total_length - 12)
+            interfaces = []
+        else:
+            total_length = struct.unpack(byteorder + 'L', header)[0]
+            body = pcapfile.read(total_length - 8)
+
+        if total_length < 12 or len(body) < total_length - 8:
+            return
+
+        if block_type == _INTERFACE_DESCRIPTION_BLOCK:
+            interfaces.append(_interface(body, byteorder))
+
+        elif block_type == _ENHANCED_PACKET_BLOCK:
+            interface, high, low, captured, length = struct.unpack_from(byteorder + 'IIIII', body)
+            linktype, resolution, offset = interfaces[interface]
+            timestamp = ((high << 32) | low) * resolution + offset
+            yield timestamp, linktype, body[20:20 + captured]
+
+        elif block_type == _PACKET_BLOCK:
+            interface, drops, high, low, captured, length = struct.unpack_from(byteorder + 'HHIIII', body)
+            linktype, resolution, offset = interfaces[interface]
+            timestamp = ((high << 32) | low) * resolution + offset
+            yield timestamp, linktype, body[20:20 + captured]
+
+        elif block_type == _SIMPLE_PACKET_BLOCK:
+            # These have no timestamp, they get the one of the packet before
+            length = struct.unpack_from(byteorder + 'I', body)[0]
+            yield timestamp, interfaces[0][0], body[4:4 + length]
+
+        block = pcapfile.read(4)
+        if len(block) < 4:
+            return
+        block_type = struct.unpack(byteorder + 'L', block)[0]
+
+
+def _interface(body, byteorder):
+    """Returns the link layer type, timestamp resolution and timestamp offset of an interface description block."""
+
+    linktype = struct.unpack_from(byteorder + 'H', body)[0]
+    resolution = 1e-6
+    offset = 0
+
+    position = 8
+    while position + 4 <= len(body) - 4:
+        code, length = struct.unpack_from(byteorder + 'HH', body, position)
+        value = body[position + 4:position + 4 + length]
+        if code == _OPTION_END:
+            break
+        if code == _OPTION_TSRESOL and length == 1:
+            resolution = 2.0 ** -(value[0] & 0x7f) if value[0] & 0x80 else 10.0 ** -value[0]
+        elif code == _OPTION_TSOFFSET and length == 8:
+            offset = struct.unpack(byteorder + 'q', value)[0]
+        position += 4 + (length + 3) // 4 * 4
+
+    return linktype, resolution, offset
+
+
+def _ip_packet(linktype, data):
+    """Returns the IP packet in a link layer frame, or None."""
+
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 14
+        ethertype = (data[12] << 8) | data[13]
+        while ethertype in _ETHERTYPE_VLAN:
+            ethertype = (data[offset + 2] << 8) | data[offset + 3]
+            offset += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        offset = 16
+        ethertype = (data[14] << 8) | data[15]
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        offset = 20
+        ethertype = (data[0] << 8) | data[1]
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # The address family is in the byte order of the machine that captured it, the IP version tells enough
+        return data[4:]
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return data
+    else:
+        return None
+
+    if ethertype not in (_ETHERTYPE_IPV4, _ETHERTYPE_IPV6):
+        return None
+
+    return data[offset:]
+
+
+def _tcp_segment(packet):
+    """Returns the source address, destination address and TCP segment of an IP packet, or None."""
+
+    version = packet[0] >> 4
+
+    if version == 4:
+        header_length = (packet[0] & 0x0f) * 4
+        total_length = (packet[2] << 8) | packet[3]
+        if packet[9] != _IPPROTO_TCP:
+            return None
+        if ((packet[6] << 8) | packet[7]) & 0x3fff:
+            # A fragment, TCP rarely has them and we don't reassemble them
+            return None
+        return packet[12:16], packet[16:20], packet[header_length:total_length]
+
+    if version == 6:
+        end = 40 + ((packet[4] << 8) | packet[5])
+        next_header = packet[6]
+        offset = 40
+        while next_header in _IPV6_EXTENSIONS:
+            next_header = packet[offset]
+            offset += (packet[offset + 1] + 1) * 8
+        if next_header != _IPPROTO_TCP:
+            return None
+        return packet[8:24], packet[24:40], packet[offset:end]
+
+    return None
+
+
+def _address(raw):
+    return socket.inet_ntop(socket.AF_INET if len(raw) == 4 else socket.AF_INET6, raw)
+
+
+class _TcpStream(object):
+    """Reassembles one direction of a TCP connection and splits it in frames.
+
+    Segments that arrive out of order wait until the data before them arrives, up to max_pending bytes. When the
+    missing data never comes, we skip over it and look for the start of a frame again. The UUIDs at the start of every
+    frame in this direction are the same, so we know them after the first frame.
+    """
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+
+        self._next_seq = None
+        self._buffer = bytearray()
+
+        # Whether the buffer starts at a frame
+        self._synced = False
+        self._uuids = None
+
+        self._pending = {}
+        self._pending_size = 0
+
+        # Statistics, the bytes of the stream that were missing or weren't part of a frame
+        self.skipped = 0
+
+    def add(self, seq, flags, payload) -> list:
+        """Add a segment. Returns the frames that were completed by it."""
+
+        if flags & _TCP_SYN:
+            self._next_seq = (seq + 1) & 0xffffffff
+            self._buffer.clear()
+            self._pending.clear()
+            self._pending_size = 0
+            self._synced = True
+            return []
+
+        if not payload:
+            return []
+
+        if self._next_seq is None:
+            # We didn't see the start of the connection, so we may be in the middle of a frame
+            self._next_seq = seq
+
+        delta = (seq - self._next_seq) & 0xffffffff
+        if delta and delta < 1 << 31:
+            # There is data missing before this segment
+            waiting = self._pending.get(seq)
+            if waiting is not None and len(waiting) >= len(payload):
+                return []
+
+            self._pending[seq] = payload
+            self._pending_size += len(payload) - (len(waiting) if waiting is not None else 0)
+            if self._pending_size <= self.max_pending:
+                return []
+
+            self._skip_gap()
+
+        else:
+            self._append(seq, payload)
+
+        while self._pending and self._append_pending():
+            pass
+
+        return self._frames()
+
+    def _append(self, seq, payload):
+        """Append a segment that starts at or before the next sequence number."""
+
+        overlap = (self._next_seq - seq) & 0xffffffff
+        if overlap >= 1 << 31 or overlap >= len(payload):
+            # Nothing new, a retransmission
+            return
+
+        self._buffer += payload[overlap:]
+        self._next_seq = (self._next_seq + len(payload) - overlap) & 0xffffffff
+
+    def _append_pending(self) -> bool:
+        """Append the waiting segments that can be appended now. Returns whether there were any."""
+
+        ready = [seq for seq in self._pending if ((seq - self._next_seq) & 0xffffffff) >= 1 << 31
+                 or seq == self._next_seq]
+        for seq in ready:
+            payload = self._pending.pop(seq)
+            self._pending_size -= len(payload)
+            self._append(seq, payload)
+
+        return bool(ready)
+
+    def _skip_gap(self):
+        """Give up on the missing data, and continue with the first segment that is waiting."""
+
+        seq = min(self._pending, key=lambda seq: (seq - self._next_seq) & 0xffffffff)
+        self.skipped += len(self._buffer) + ((seq - self._next_seq) & 0xffffffff)
+        self._next_seq = seq
+        self._buffer.clear()
+        self._synced = False
+
+    def _frames(self) -> list:
+        buf = self._buffer
+        frames = []
+
+        while self._synced or self._resync():
+            offset = 0
+            while len(buf) - offset >= 4:
+                end = offset + 4 + struct.unpack_from('>L', buf, offset)[0]
+                if end - offset < _FRAME_HEADER_SIZE or end - offset > MAX_FRAME_SIZE:
+                    # This isn't a frame, we lost track somewhere
+                    self._synced = False
+                    self.skipped += 1
+                    offset += 1
+                    break
+                if end > len(buf):
+                    break
+
+                frames.append(bytes(buf[offset:end]))
+                offset = end
+
+            del buf[:offset]
+
+            if self._synced:
+                break
+
+        if frames and self._uuids is None:
+            self._uuids = frames[0][4:36]
+
+        return frames
+
+    def _plausible(self, offset) -> bool:
+        """Returns whether a frame could start at offset of the buffer."""
+
+        buf = self._buffer
+        length = 4 + struct.unpack_from('>L', buf, offset)[0]
+        cmd_length = struct.unpack_from('>H', buf, offset + 36)[0]
+
+        return _FRAME_HEADER_SIZE <= length <= MAX_FRAME_SIZE and cmd_length <= length - _FRAME_HEADER_SIZE
+
+    def _resync(self) -> bool:
+        """Drop data until the buffer starts at a frame. Returns False when we need more data to find one."""
+
+        buf = self._buffer
+        offset = 0
+
+        while True:
+            if self._uuids is not None:
+                found = buf.find(self._uuids, offset + 4)
+                if found < 0:
+                    # Keep what could be the start of the UUIDs
+                    offset = max(0, len(buf) - 35)
+                    self.skipped += offset
+                    del buf[:offset]
+                    return False
+                offset = found - 4
+
+            if len(buf) < offset + _FRAME_HEADER_SIZE:
+                self.skipped += offset
+                del buf[:offset]
+                return False
+
+            if self._plausible(offset):
+                if self._uuids is not None:
+                    break
+
+                # Without the UUIDs, the frame after it has to be plausible too, with the same UUIDs
+                following = offset + 4 + struct.unpack_from('>L', buf, offset)[0]
+                if len(buf) < following + _FRAME_HEADER_SIZE:
+                    self.skipped += offset
+                    del buf[:offset]
+                    return False
+                if buf[following + 4:following + 36] == buf[offset + 4:offset + 36] and self._plausible(following):
+                    break
+
+            offset += 1
+
+        self.skipped += offset
+        del buf[:offset]
+        self._synced = True
+
+        return True
+
+
+class PcapReader(object):
+    """Reads the frames of ComfoConnect sessions out of a pcap or pcapng file, like tcpdump writes them.
+
+    The TCP connections on port are reassembled and split in frames. The file is read as a stream, so only the
+    partial frames and the segments that arrived out of order, up to max_pending bytes per connection, are kept in
+    memory. Frames from the bridge are RX, frames to it TX, like in a capture of our own.
+    """
+
+    def __init__(self, path, port=Bridge.PORT, max_pending=1 << 20, max_streams=1024):
+        self.path = path
+        self.port = port
+        self.max_pending = max_pending
+        self.max_streams = max_streams
+
+        # Statistics, skipped is the bytes of the streams that were missing or weren't part of a frame
+        self.packets = 0
+        self.segments = 0
+        self.skipped = 0
+
+    def frames(self):
+        """Yields a PcapFrame for every complete frame, in the order their last segment was captured."""
+
+        # Both directions of every connection, by source and destination address and port
+        streams = {}
+
+        with open(self.path, 'rb', buffering=1 << 20) as pcapfile:
+            for timestamp, linktype, data in read_packets(pcapfile):
+                self.packets += 1
+
+                try:
+                    packet = _ip_packet(linktype, data)
+                    segment = packet is not None and _tcp_segment(packet)
+                    if not segment:
+                        continue
+
+                    src, dst, tcp = segment
+                    src_port, dst_port, seq, ack, offset, flags = struct.unpack_from('>HHLLBB', tcp)
+
+                except (IndexError, struct.error):
+                    # A packet that was cut off by the snaplen, or isn't what it claims to be
+                    continue
+
+                if src_port == self.port:
+                    direction, connection = RX, (dst, dst_port)
+                elif dst_port == self.port:
+                    direction, connection = TX, (src, src_port)
+                else:
+                    continue
+
+                self.segments += 1
+                key = (src, src_port, dst, dst_port)
+
+                stream = streams.get(key)
+                if stream is None:
+                    if len(streams) >= self.max_streams:
+                        self._close(streams, next(iter(streams)))
+                    stream = streams[key] = _TcpStream(self.max_pending)
+
+                frames = stream.add(seq, flags, tcp[(offset >> 4) * 4:])
+                if frames:
+                    client = (_address(connection[0]), connection[1])
+                    for frame in frames:
+                        yield PcapFrame(timestamp, direction, client, frame)
+
+                if flags & (_TCP_FIN | _TCP_RST):
+                    self._close(streams, key)
+                    if flags & _TCP_RST:
+                        self._close(streams, (dst, dst_port, src, src_port))
+
+        for key in list(streams):
+            self._close(streams, key)
+
+    def _close(self, streams, key):
+        stream = streams.pop(key, None)
+        if stream is not None:
+            self.skipped += stream.skipped
+
+    def __iter__(self):
+        return self.frames()
+
+    def messages(self):
+        """Yields every frame decoded as a Message, with the capture time as received time, and its PcapFrame."""
+
+        for frame in self.frames():
+            yield Message.decode(frame.data, frame.timestamp), frame
+
+    def to_capture(self, path) -> int:
+        """Append every frame to a capture file. Returns the amount of frames."""
+
+        count = 0
+        with CaptureWriter(path) as capture:
+            for frame in self.frames():
+                capture.write_frames(frame.direction, [frame.data], frame.timestamp)
+                count += 1
+
+        return count
@@ -0,0 +1,279 @@
+import collections
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+
+_LOGGER = logging.getLogger('reactor')
+
+
+class Timer(object):
+    """A callback that is scheduled on the reactor."""
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Make sure the callback isn't invoked anymore."""
+
+        self.cancelled = True
+
+
+class TimerHeap(object):
+    """Timers ordered by their deadline."""
+
+    def __init__(self):
+        self._timers = []
+        self._sequence = itertools.count()
+
+    def call_later(self, delay, callback, *args) -> Timer:
+        """Schedule callback after delay seconds."""
+
+        timer = Timer(time.monotonic() + delay, callback, args)
+        self.push(timer)
+
+        return timer
+
+    def push(self, timer: Timer):
+        """Schedule a timer."""
+
+        heapq.heappush(self._timers, (timer.deadline, next(self._sequence), timer))
+
+    def timeout(self, now=None):
+        """Returns the seconds until the next timer is due, or None when there are no timers."""
+
+        # Forget about the cancelled timers, so they don't wake us up
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+
+        if not self._timers:
+            return None
+
+        if now is None:
+            now = time.monotonic()
+
+        return max(0, self._timers[0][0] - now)
+
+    def pop_due(self, now=None) -> list:
+        """Remove and return the timers that are due."""
+
+        if now is None:
+            now = time.monotonic()
+
+        due = []
+        while self._timers and self._timers[0][0] <= now:
+            timer = heapq.heappop(self._timers)[2]
+            if not timer.cancelled:
+                due.append(timer)
+
+        return due
+
+
+class Waker(object):
+    """A socketpair that lets other threads interrupt a select()."""
+
+    def __init__(self):
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(0)
+        self._writer.setblocking(0)
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def wake(self):
+        """Make the reader readable."""
+
+        try:
+            self._writer.send(b'\x00')
+        except BlockingIOError:
+            # There is already a wakeup pending
+            pass
+
+    def drain(self):
+        """Consume the pending wakeups."""
+
+        try:
+            self._reader.recv(4096)
+        except BlockingIOError:
+            pass
+
+
+class Reactor(object):
+    """Services the sockets, timers and wakeups of many bridges from a single thread."""
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._timers = TimerHeap()
+        self._callbacks = collections.deque()
+        self._registrations = {}
+        self._thread = None
+        self._stopping = False
+
+        # Other threads use this to wake us up
+        self._waker = Waker()
+        self._selector.register(self._waker, selectors.EVENT_READ)
+
+    def start(self):
+        """Start the reactor thread."""
+
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._loop, name='pycomfoconnect-reactor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the reactor thread and wait for it to finish."""
+
+        if self._thread is None:
+            return
+
+        self._stopping = True
+        self._waker.wake()
+
+        if not self.in_reactor_thread():
+            self._thread.join()
+        self._thread = None
+
+    def in_reactor_thread(self) -> bool:
+        """Returns whether we are running on the reactor thread."""
+
+        return self._thread is threading.current_thread()
+
+    def register(self, bridge, on_messages, on_disconnect):
+        """Deliver the messages of a connected bridge to on_messages, and call on_disconnect when the connection breaks."""
+
+        self.call_soon_threadsafe(self._register, bridge, on_messages, on_disconnect)
+
+    def unregister(self, bridge):
+        """Stop watching the connection of this bridge."""
+
+        self.call_soon_threadsafe(self._unregister, bridge)
+
+    def call_later(self, delay, callback, *args) -> Timer:
+        """Invoke callback on the reactor thread after delay seconds."""
+
+        timer = Timer(time.monotonic() + delay, callback, args)
+        self.call_soon_threadsafe(self._schedule, timer)
+
+        return timer
+
+    def call_soon_threadsafe(self, callback, *args):
+        """Invoke callback on the reactor thread as soon as possible."""
+
+        self._callbacks.append((callback, args))
+        if not self.in_reactor_thread():
+            self._waker.wake()
+
+    def _schedule(self, timer):
+        self._timers.push(timer)
+
+    def _register(self, bridge, on_messages, on_disconnect):
+        tcpsocket = bridge._socket
+        if tcpsocket is None:
+            on_disconnect()
+            return
+
+        self._unregister(bridge)
+        self._registrations[bridge] = tcpsocket
+        self._selector.register(tcpsocket, selectors.EVENT_READ, (bridge, on_messages, on_disconnect))
+
+        # Messages that were queued before we watched the connection
+        if bridge._tx_pending:
+            self.set_writing(bridge, True)
+
+        # Messages that were already buffered won't trigger a readiness event
+        if bridge._rx_frames:
+            self.call_soon_threadsafe(self._read, bridge, on_messages, on_disconnect)
+
+    def _unregister(self, bridge):
+        tcpsocket = self._registrations.pop(bridge, None)
+        if tcpsocket is not None:
+            try:
+                self._selector.unregister(tcpsocket)
+            except (KeyError, ValueError):
+                # The socket was already closed
+                pass
+
+    def set_writing(self, bridge, writing):
+        """Watch the connection of a bridge for room to write as well, or stop. This runs on the reactor thread."""
+
+        tcpsocket = self._registrations.get(bridge)
+        if tcpsocket is None:
+            return
+
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+        try:
+            key = self._selector.get_key(tcpsocket)
+            if key.events != events:
+                self._selector.modify(tcpsocket, events, key.data)
+        except (KeyError, ValueError, OSError):
+            # The socket was already closed, the reader notices that
+            pass
+
+    def _write(self, bridge, on_messages, on_disconnect):
+        tcpsocket = self._registrations.get(bridge)
+        if tcpsocket is None:
+            return
+
+        bridge._write_pending(tcpsocket)
+
+    def _read(self, bridge, on_messages, on_disconnect):
+        if bridge not in self._registrations:
+            return
+
+        try:
+            messages = bridge.read_available()
+        except OSError:
+            # Closed by the bridge, reset, or timed out by TCP_USER_TIMEOUT
+            self._unregister(bridge)
+            on_disconnect()
+            return
+
+        # A burst is decoded in batches, the rest follows after the other connections had their turn
+        if bridge._rx_frames:
+            self.call_soon_threadsafe(self._read, bridge, on_messages, on_disconnect)
+
+        if messages:
+            on_messages(messages)
+
+    def _loop(self):
+        """Wait for socket activity or the next timer, and dispatch them."""
+
+        while not self._stopping:
+
+            # Sleep until the next timer, or until we are woken up
+            timeout = 0 if self._callbacks else self._timers.timeout()
+
+            for key, events in self._selector.select(timeout):
+                if key.fileobj is self._waker:
+                    self._waker.drain()
+                    continue
+
+                if events & selectors.EVENT_WRITE:
+                    self._run(self._write, *key.data)
+                if events & selectors.EVENT_READ:
+                    self._run(self._read, *key.data)
+
+            # Run the callbacks that were queued by other threads
+            for _ in range(len(self._callbacks)):
+                callback, args = self._callbacks.popleft()
+                self._run(callback, *args)
+
+            # Run the timers that are due
+            for timer in self._timers.pop_due():
+                self._run(timer.callback, *timer.args)
+
+    @staticmethod
+    def _run(callback, *args):
+        try:
+            callback(*args)
+        except Exception as exc:
+            # Never let a single bridge take down the reactor
+            _LOGGER.exception(exc)
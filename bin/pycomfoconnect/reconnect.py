@@ -0,0 +1,78 @@
+import collections
+import random
+import time
+
+
+class ReconnectAttempt(object):
+    """Record of a single attempt to (re)connect to the bridge."""
+
+    def __init__(self, delay):
+        self.started = time.time()
+        self.delay = delay
+        self.duration = None
+        self.error = None
+
+    @property
+    def succeeded(self):
+        return self.duration is not None and self.error is None
+
+    def finish(self, error=None):
+        self.duration = time.time() - self.started
+        self.error = error
+
+    def __repr__(self):
+        return 'ReconnectAttempt(started=%.3f, delay=%.3f, duration=%s, error=%r)' % (
+            self.started, self.delay, self.duration, self.error)
+
+
+class ReconnectPolicy(object):
+    """Deadlines and exponential backoff with jitter for connecting to the bridge.
+
+    The first retry after losing a connection is immediate, every following retry waits twice as long, up to
+    max_delay. The delays are spread out by a random jitter so many clients don't retry at the same time.
+    """
+
+    def __init__(self, connect_timeout=5, handshake_timeout=10, initial_delay=0.5, max_delay=60, factor=2,
+                 jitter=0.5, history_size=50):
+        self.connect_timeout = connect_timeout
+        self.handshake_timeout = handshake_timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+
+        self.history = collections.deque(maxlen=history_size)
+        self._failures = 0
+
+    def reset(self):
+        """Start over with an immediate retry, we had a working connection."""
+
+        self._failures = 0
+
+    def next_delay(self) -> float:
+        """Returns the amount of seconds to wait before the next attempt."""
+
+        if self._failures == 0:
+            return 0
+
+        delay = min(self.max_delay, self.initial_delay * self.factor ** (self._failures - 1))
+
+        return delay * (1 - self.jitter * random.random())
+
+    def start_attempt(self, delay) -> ReconnectAttempt:
+        """Record a new attempt that starts after waiting delay seconds."""
+
+        attempt = ReconnectAttempt(delay)
+        self.history.append(attempt)
+
+        return attempt
+
+    def finish_attempt(self, attempt, error=None):
+        """Record the outcome of an attempt."""
+
+        attempt.finish(error)
+
+        if error is None:
+            self.reset()
+        else:
+            self._failures += 1
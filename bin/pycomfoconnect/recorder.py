@@ -0,0 +1,186 @@
+import array
+import collections
+import logging
+import os
+import struct
+import threading
+import time
+
+_LOGGER = logging.getLogger('recorder')
+
+# Direction of a recorded frame
+RX = 0
+TX = 1
+
+MAGIC = b'PCCFLT01'
+
+# Dump time, number of records and length of the reason, followed by the reason
+_HEADER = struct.Struct('>dLH')
+
+# Timestamp, direction, length of the frame and the number of bytes that were kept, followed by these bytes
+_RECORD = struct.Struct('>dBLL')
+
+FrameRecord = collections.namedtuple('FrameRecord', ['timestamp', 'direction', 'length', 'data'])
+
+
+def read_dump(path):
+    """Read a dump of a FlightRecorder. Returns the reason, the time of the dump and the records, oldest first."""
+
+    with open(path, 'rb') as dumpfile:
+        data = dumpfile.read()
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise Exception('%s is not a flight recorder dump.' % path)
+
+    offset = len(MAGIC)
+    dumped, count, reason_length = _HEADER.unpack_from(data, offset)
+    offset += _HEADER.size
+    reason = data[offset:offset + reason_length].decode('utf-8', 'replace')
+    offset += reason_length
+
+    records = []
+    for _ in range(count):
+        timestamp, direction, length, stored = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        records.append(FrameRecord(timestamp, direction, length, data[offset:offset + stored]))
+        offset += stored
+
+    return reason, dumped, records
+
+
+class FlightRecorder(object):
+    """Keeps the last frames that were sent and received, to dump them to a file when something goes wrong.
+
+    The frames are copied in preallocated slots of slot_size bytes, longer frames are truncated. Nothing is formatted
+    while recording, so this can stay on all the time. Without a path, dump_on_error() does nothing and only dump()
+    writes the frames.
+    """
+
+    def __init__(self, capacity=256, slot_size=512, path=None, dump_interval=60):
+        self.capacity = capacity
+        self.slot_size = slot_size
+
+        # Where dump_on_error() writes to, {timestamp} is replaced by the time of the dump
+        self.path = path
+
+        # Minimum seconds between automatic dumps, a reconnect loop shouldn't fill the disk
+        self.dump_interval = dump_interval
+        self._last_dump = None
+
+        self._slab = memoryview(bytearray(capacity * slot_size))
+        self._timestamps = array.array('d', bytes(8 * capacity))
+        self._lengths = array.array('L', [0]) * capacity
+        self._directions = bytearray(capacity)
+
+        # Number of frames that were ever recorded, the next slot is this modulo the capacity
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def record(self, direction, frame, timestamp=None):
+        """Record a single frame."""
+
+        self.record_frames(direction, [frame], timestamp)
+
+    def record_frames(self, direction, frames, timestamp=None):
+        """Record frames that were sent or received at the same time."""
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        slot_size = self.slot_size
+        with self._lock:
+            for frame in frames:
+                index = self._count % self.capacity
+                self._count += 1
+
+                stored = min(len(frame), slot_size)
+                start = index * slot_size
+                self._slab[start:start + stored] = frame[:stored]
+
+                self._timestamps[index] = timestamp
+                self._lengths[index] = len(frame)
+                self._directions[index] = direction
+
+    def record_parts(self, direction, parts, timestamp=None):
+        """Record a frame that is split in several buffers, like Message.encode_parts() returns them."""
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        slot_size = self.slot_size
+        with self._lock:
+            index = self._count % self.capacity
+            self._count += 1
+
+            start = index * slot_size
+            length = 0
+            for part in parts:
+                stored = max(0, min(len(part), slot_size - length))
+                self._slab[start + length:start + length + stored] = part[:stored]
+                length += len(part)
+
+            self._timestamps[index] = timestamp
+            self._lengths[index] = length
+            self._directions[index] = direction
+
+    def records(self) -> list:
+        """Returns the recorded frames, oldest first."""
+
+        with self._lock:
+            first = max(0, self._count - self.capacity)
+            records = []
+            for number in range(first, self._count):
+                index = number % self.capacity
+                start = index * self.slot_size
+                stored = min(self._lengths[index], self.slot_size)
+                records.append(FrameRecord(self._timestamps[index], self._directions[index], self._lengths[index],
+                                           self._slab[start:start + stored].tobytes()))
+
+        return records
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+
+    def dump(self, path, reason=''):
+        """Write the recorded frames to a file, see read_dump()."""
+
+        records = self.records()
+        reason = reason.encode('utf-8')
+
+        # Write to a temporary file first, so nobody reads half a dump
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as dumpfile:
+            dumpfile.write(MAGIC)
+            dumpfile.write(_HEADER.pack(time.time(), len(records), len(reason)))
+            dumpfile.write(reason)
+            for record in records:
+                dumpfile.write(_RECORD.pack(record.timestamp, record.direction, record.length, len(record.data)))
+                dumpfile.write(record.data)
+        os.replace(tmp_path, path)
+
+        return path
+
+    def dump_on_error(self, reason):
+        """Dump to path because of an error, unless there is no path or we have dumped recently."""
+
+        if self.path is None:
+            return None
+
+        now = time.monotonic()
+        if self._last_dump is not None and now - self._last_dump < self.dump_interval:
+            return None
+        self._last_dump = now
+
+        path = self.path.format(timestamp=time.strftime('%Y%m%d-%H%M%S'))
+        try:
+            self.dump(path, reason)
+        except OSError as exc:
+            _LOGGER.warning('Could not write flight recorder dump %s: %s', path, exc)
+            return None
+
+        _LOGGER.warning('%s. The last %d frames were written to %s.', reason, len(self), path)
+        return path
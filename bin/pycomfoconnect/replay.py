@@ -0,0 +1,296 @@
+import array
+import collections
+import socket
+import struct
+import threading
+import time
+
+from .capture import CaptureReader
+from .comfoconnect import RPDO_TYPE_MAP
+from .message import Message
+from .recorder import RX
+from .rpdofilter import _CMD_OFFSET, read_varint_field
+from .zehnder_pb2 import CnTimeConfirm, GatewayOperation
+
+# The frames the bridge sends on its own. Replies to requests of the captured session are not replayed, we didn't
+# send these requests.
+NOTIFICATION_TYPES = frozenset([
+    GatewayOperation.CnRpdoNotificationType,
+    GatewayOperation.GatewayNotificationType,
+    GatewayOperation.CnNodeNotificationType,
+    GatewayOperation.CnAlarmNotificationType,
+])
+
+# Frames that are due together are written at once, up to this many bytes
+BATCH_SIZE = 1 << 16
+
+# Latency stages: behind schedule when sent, sent until the kernel received it, received until callback_sensor ran
+STAGES = ('lag', 'socket', 'dispatch')
+
+
+def _operation(frame):
+    """Returns the type and the reference of the GatewayOperation in a frame, and the offset of the message."""
+
+    cmd_end = _CMD_OFFSET + ((frame[_CMD_OFFSET - 2] << 8) | frame[_CMD_OFFSET - 1])
+    return read_varint_field(frame, 1, _CMD_OFFSET, cmd_end), read_varint_field(frame, 4, _CMD_OFFSET, cmd_end), \
+        cmd_end
+
+
+def _received(reader, start, end):
+    """Yields the frames the bridge sent, with the type of their operation and the offset of the message."""
+
+    for record in reader.frames(start, end):
+        if record.direction == RX:
+            operation, _, msg_offset = _operation(record.data)
+            yield record, operation, msg_offset
+
+
+class ReplayStats(object):
+    """Throughput and the latency of every stage of a replay."""
+
+    def __init__(self):
+        self.frames = 0
+        self.skipped = 0
+        self.updates = 0
+
+        # Wall clock seconds of the replay, and the seconds of capture they covered
+        self.elapsed = 0.0
+        self.duration = 0.0
+
+        self.latencies = dict((stage, array.array('d')) for stage in STAGES)
+
+    @property
+    def frames_per_second(self):
+        return self.frames / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def speed(self):
+        """How many times faster than real time the capture was replayed."""
+
+        return self.duration / self.elapsed if self.elapsed else 0.0
+
+    def percentiles(self, stage, points=(50, 90, 99, 100)) -> list:
+        """Returns the latency in seconds of a stage at each percentile, or None when nothing was measured."""
+
+        values = sorted(self.latencies[stage])
+        if not values:
+            return [None] * len(points)
+
+        return [values[min(len(values) - 1, int(len(values) * point / 100))] for point in points]
+
+    def summary(self) -> str:
+        lines = ['%d frames (%d skipped), %d updates in %.3f s: %.0f frames/s, %.1fx real time' % (
+            self.frames, self.skipped, self.updates, self.elapsed, self.frames_per_second, self.speed)]
+
+        for stage in STAGES:
+            values = self.percentiles(stage)
+            if values[0] is None:
+                continue
+            lines.append('%-8s p50 %9.1f us  p90 %9.1f us  p99 %9.1f us  max %9.1f us' % (
+                (stage,) + tuple(value * 1e6 for value in values)))
+
+        return '\n'.join(lines)
+
+
+class _ReceiveStamps(object):
+    """Takes the place of the capture of the bridge, to learn when the kernel received every frame we sent.
+
+    Frames arrive in the order we sent them, so the oldest send time belongs to the next frame. A capture that was
+    already set still gets everything.
+    """
+
+    def __init__(self, sent, latencies, capture=None):
+        self._sent = sent
+        self._latencies = latencies
+        self.capture = capture
+
+    def write_frames(self, direction, frames, timestamp=None, kernel_time=False):
+        if direction == RX:
+            for _ in frames:
+                self._latencies.append(timestamp - self._sent.popleft())
+
+        if self.capture is not None:
+            self.capture.write_frames(direction, frames, timestamp, kernel_time)
+
+    def write_parts(self, direction, parts, timestamp=None):
+        if self.capture is not None:
+            self.capture.write_parts(direction, parts, timestamp)
+
+
+class Replayer(object):
+    """Plays the frames a bridge sent in a capture to a ComfoConnect, through a local TCP connection.
+
+    The ComfoConnect takes the connection over with attach_session(), so the frames take the same way as those of a
+    real bridge: read by the Bridge, decoded, dispatched by the message thread or the reactor, and handed to
+    callback_sensor. Only the notifications of the capture are replayed. We answer the CnTimeRequests of the
+    watchdog, and use one to know when everything has been handled.
+
+    speed 1.0 replays in real time, 10.0 ten times faster and None as fast as the ComfoConnect can take it. The
+    ComfoConnect is only used for the replay, its bridge is pointed at our connection. Create its Bridge with
+    timestamps=True to measure the socket stage with the receive time of the kernel.
+    """
+
+    def __init__(self, comfoconnect, speed=None, sensors=None):
+        self.comfoconnect = comfoconnect
+        self.speed = speed
+
+        # The sensors to subscribe the RpdoFilter to, every sensor in the capture by default
+        self.sensors = sensors
+
+        self._lock = threading.Lock()
+        self._sent = collections.deque()
+        self._conn = None
+
+    def run(self, path, start=None, end=None) -> ReplayStats:
+        """Replay the capture at path, or the part from start up to end. Returns the ReplayStats.
+
+        The capture is read while it's replayed, it isn't loaded in memory.
+        """
+
+        stats = ReplayStats()
+
+        with CaptureReader(path) as reader:
+            sensors = self.sensors
+            if sensors is None:
+                # A first pass over the capture, we subscribe before the first update is sent
+                sensors = set(read_varint_field(record.data, 1, msg_offset, len(record.data))
+                              for record, operation, msg_offset in _received(reader, start, end)
+                              if operation == GatewayOperation.CnRpdoNotificationType)
+
+            self._replay(_received(reader, start, end), sensors, stats)
+
+        return stats
+
+    def _replay(self, received, sensors, stats):
+        comfoconnect = self.comfoconnect
+        bridge = comfoconnect._bridge
+        callback_update = comfoconnect.callback_update
+        capture = bridge.capture
+
+        def on_update(update):
+            stats.updates += 1
+            stats.latencies['dispatch'].append(time.time() - update.received)
+            if callback_update:
+                callback_update(update)
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            server.bind(('127.0.0.1', 0))
+            server.listen(1)
+            client = socket.create_connection(server.getsockname())
+            self._conn, _ = server.accept()
+        finally:
+            server.close()
+
+        self._conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sent.clear()
+
+        responder = threading.Thread(target=self._respond_loop, name='replay-respond')
+        responder.daemon = True
+
+        comfoconnect.callback_update = on_update
+        bridge.capture = _ReceiveStamps(self._sent, stats.latencies['socket'], capture)
+        try:
+            responder.start()
+            comfoconnect.attach_session(client, {
+                'host': '127.0.0.1',
+                'port': client.getpeername()[1],
+                'uuid': bridge.uuid.hex(),
+                'local_uuid': comfoconnect._local_uuid.hex(),
+                'reference': 1,
+                'sensors': [(pdid, RPDO_TYPE_MAP.get(pdid, 1)) for pdid in sorted(sensors)],
+                'pending': '',
+            })
+
+            started = time.perf_counter()
+            self._send_frames(received, stats)
+
+            # Our reply is read after every replayed frame, so they have all been handled when it arrives
+            comfoconnect.cmd_time_request()
+            stats.elapsed = time.perf_counter() - started
+
+        finally:
+            comfoconnect.disconnect()
+            comfoconnect.callback_update = callback_update
+            bridge.capture = capture
+            self._conn.close()
+            responder.join()
+
+    def _send_frames(self, received, stats):
+        """Write the notifications when they are due, or as fast as possible without a speed."""
+
+        speed = self.speed
+        lag = stats.latencies['lag']
+        first = None
+        origin = time.monotonic()
+
+        batch = []
+        batch_due = []
+        batch_size = 0
+
+        for record, operation, _ in received:
+            if operation not in NOTIFICATION_TYPES:
+                stats.skipped += 1
+                continue
+
+            if first is None:
+                first = record.timestamp
+            stats.frames += 1
+            stats.duration = record.timestamp - first
+
+            due = origin + (record.timestamp - first) / speed if speed else origin
+
+            if batch and (batch_size >= BATCH_SIZE or due > time.monotonic()):
+                self._send(batch, batch_due if speed else None, lag)
+                batch, batch_due, batch_size = [], [], 0
+
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            batch.append(record.data)
+            batch_due.append(due)
+            batch_size += len(record.data)
+
+        if batch:
+            self._send(batch, batch_due if speed else None, lag)
+
+    def _send(self, frames, dues, lag):
+        with self._lock:
+            now = time.monotonic()
+            sent = time.time()
+            self._sent.extend([sent] * len(frames))
+            self._conn.sendall(b''.join(frames))
+
+        if dues is not None:
+            lag.extend(now - due for due in dues)
+
+    def _respond_loop(self):
+        """Answer the CnTimeRequests of the ComfoConnect, and ignore everything else it sends."""
+
+        bridge_uuid = self.comfoconnect._bridge.uuid
+        buf = b''
+
+        try:
+            while True:
+                data = self._conn.recv(4096)
+                if not data:
+                    return
+                buf += data
+
+                while len(buf) >= 4 and len(buf) >= 4 + struct.unpack_from('>L', buf)[0]:
+                    size = 4 + struct.unpack_from('>L', buf)[0]
+                    frame, buf = buf[:size], buf[size:]
+
+                    operation, reference, _ = _operation(frame)
+                    if operation != GatewayOperation.CnTimeRequestType:
+                        continue
+
+                    reply = Message.create(bridge_uuid, frame[4:20], CnTimeConfirm, {'reference': reference},
+                                           {'currentTime': 0}).encode()
+                    with self._lock:
+                        self._sent.append(time.time())
+                        self._conn.sendall(reply)
+
+        except OSError:
+            return
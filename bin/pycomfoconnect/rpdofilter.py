@@ -0,0 +1,119 @@
+from .zehnder_pb2 import GatewayOperation
+
+# Offset of the GatewayOperation in a frame: length, source UUID, destination UUID and the length of the operation
+_CMD_OFFSET = 4 + 16 + 16 + 2
+
+_RPDO_NOTIFICATION_TYPE = GatewayOperation.CnRpdoNotificationType
+
+
+def read_varint(buf, offset):
+    """Decode a protobuf varint at offset. Returns the value and the offset after it."""
+
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+
+def read_varint_field(buf, number, offset, end):
+    """Returns the value of the first varint field with this number in a serialized protobuf, or None."""
+
+    while offset < end:
+        key, offset = read_varint(buf, offset)
+        wire_type = key & 0x07
+        if wire_type == 0:
+            value, offset = read_varint(buf, offset)
+            if key >> 3 == number:
+                return value
+        elif wire_type == 2:
+            length, offset = read_varint(buf, offset)
+            offset += length
+        elif wire_type == 1:
+            offset += 8
+        elif wire_type == 5:
+            offset += 4
+        else:
+            return None
+
+    return None
+
+
+class RpdoFilter(object):
+    """Drops CnRpdoNotification frames before they are decoded.
+
+    Frames for sensors we aren't subscribed to are dropped, and with dedup also the frames that repeat the previous
+    value of a sensor. Only the raw bytes of the frame are looked at, no protobuf objects are created.
+
+    Without dedup it only pays off when enough updates are for sensors we aren't subscribed to. In bench_codec.py,
+    accept() takes just under 1 us per frame and decoding and handling a frame 15 to 18 us, so that's from about 1 in 20
+    updates. With 5% unsubscribed updates, filtering and decoding take as long as decoding everything.
+    """
+
+    def __init__(self, dedup=True):
+        self.dedup = dedup
+        self.subscribed = set()
+        self._last = {}
+
+        # Statistics
+        self.passed = 0
+        self.unchanged = 0
+        self.unsubscribed = 0
+
+    @property
+    def skipped(self):
+        return self.unchanged + self.unsubscribed
+
+    def subscribe(self, pdid):
+        """Let the updates of a sensor through, starting with the next one."""
+
+        self.subscribed.add(pdid)
+        self._last.pop(pdid, None)
+
+    def unsubscribe(self, pdid):
+        """Drop the updates of a sensor."""
+
+        self.subscribed.discard(pdid)
+        self._last.pop(pdid, None)
+
+    def accept(self, frame) -> bool:
+        """Returns whether a frame should be decoded."""
+
+        try:
+            cmd_end = _CMD_OFFSET + ((frame[_CMD_OFFSET - 2] << 8) | frame[_CMD_OFFSET - 1])
+
+            # The type and the pdid are the first fields protobuf writes, so we mostly get away with a few bytes
+            if frame[_CMD_OFFSET] == 0x08 and frame[_CMD_OFFSET + 1] < 0x80:
+                if frame[_CMD_OFFSET + 1] != _RPDO_NOTIFICATION_TYPE:
+                    return True
+            elif read_varint_field(frame, 1, _CMD_OFFSET, cmd_end) != _RPDO_NOTIFICATION_TYPE:
+                return True
+
+            if frame[cmd_end] == 0x08:
+                pdid = frame[cmd_end + 1]
+                if pdid & 0x80:
+                    pdid, _ = read_varint(frame, cmd_end + 1)
+            else:
+                pdid = read_varint_field(frame, 1, cmd_end, len(frame))
+
+        except IndexError:
+            # A broken frame, let the decoder complain about it
+            return True
+
+        if pdid not in self.subscribed:
+            self.unsubscribed += 1
+            return False
+
+        if self.dedup:
+            body = frame[cmd_end:]
+            if self._last.get(pdid) == body:
+                self.unchanged += 1
+                return False
+            self._last[pdid] = bytes(body)
+
+        self.passed += 1
+        return True
@@ -0,0 +1,41 @@
+import collections
+import struct
+import time
+
+
+def rpdo_value(data: bytes):
+    """Convert the raw data of a sensor update to its value."""
+
+    if len(data) == 1:
+        return struct.unpack('b', data)[0]
+    elif len(data) == 2:
+        return struct.unpack('h', data)[0]
+
+    return data.hex()
+
+
+class SensorUpdate(collections.namedtuple('SensorUpdate', ['pdid', 'value', 'raw', 'monotonic', 'received'])):
+    """Immutable record of a sensor update, to keep instead of the Message it arrived in.
+
+    raw is the data as the bridge sent it and value is what rpdo_value() makes of it. received is the wall clock time
+    the update arrived at the socket, monotonic is the same moment on the monotonic clock.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_message(cls, message):
+        """Returns the update in a CnRpdoNotification message."""
+
+        now = time.monotonic()
+        wall = time.time()
+
+        received = message.received
+        if received is None:
+            received = wall
+
+        # Move the arrival back on the monotonic clock by the time that passed since then
+        monotonic = now - max(0.0, wall - received)
+
+        msg = message.msg
+        return cls(msg.pdid, rpdo_value(msg.data), msg.data, monotonic, received)
@@ -0,0 +1,79 @@
+import time
+
+
+class Watchdog(object):
+    """Detects a connection that silently stopped delivering messages.
+
+    When nothing was received for probe_after seconds, we send a request that the bridge confirms (CnTimeRequest),
+    since a KeepAlive isn't answered. When nothing was received for stall_timeout seconds, the connection is
+    considered dead and we reconnect. The keepalive_* settings configure the TCP keepalive of the kernel, and
+    stall_timeout is also used as TCP_USER_TIMEOUT, so the kernel gives up on data that isn't acknowledged.
+    The connection is checked when poll() can change its answer, but never more often than every check_interval.
+    """
+
+    OK = 0
+    PROBE = 1
+    STALLED = 2
+
+    def __init__(self, probe_after=30, stall_timeout=75, check_interval=1, keepalive_idle=30, keepalive_interval=10,
+                 keepalive_count=3):
+        self.probe_after = probe_after
+        self.stall_timeout = stall_timeout
+        self.check_interval = check_interval
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+
+        self._probe_references = set()
+        self._last_probe = 0
+
+    def reset(self):
+        """Start watching a new connection."""
+
+        self._probe_references.clear()
+        self._last_probe = 0
+
+    def poll(self, last_received, now=None) -> int:
+        """Returns whether the connection is OK, should be probed, or has STALLED."""
+
+        if now is None:
+            now = time.monotonic()
+
+        idle = now - last_received
+        if idle >= self.stall_timeout:
+            return Watchdog.STALLED
+
+        if idle >= self.probe_after and now - self._last_probe >= self.probe_after:
+            return Watchdog.PROBE
+
+        return Watchdog.OK
+
+    def next_check(self, last_received, now=None) -> float:
+        """Returns the seconds until poll() can return something else, but at least check_interval."""
+
+        if now is None:
+            now = time.monotonic()
+
+        idle = now - last_received
+        if idle < self.probe_after:
+            delay = self.probe_after - idle
+        else:
+            # We are probing, wait for the next probe or until we give up
+            delay = min(self.stall_timeout - idle, self._last_probe + self.probe_after - now)
+
+        return max(self.check_interval, delay)
+
+    def probe_sent(self, reference, now=None):
+        """Remember the reference of a probe, so we can recognise its reply."""
+
+        self._last_probe = time.monotonic() if now is None else now
+        self._probe_references.add(reference)
+
+    def is_probe_reply(self, message) -> bool:
+        """Returns whether this message is the reply to one of our probes."""
+
+        if message.cmd.reference not in self._probe_references:
+            return False
+
+        self._probe_references.discard(message.cmd.reference)
+        return True
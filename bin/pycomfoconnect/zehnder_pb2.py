@@ -1,13 +1,16 @@
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: zehnder.proto
+#
+# Changed by protobuf/lazy_pb2.py: the message classes are created lazily at the end of this file. Run it again
+# every time this file is generated.
 
 import sys
+import threading
 _b=sys.version_info[0]<3 and (lambda x:x) or (lambda x:x.encode('latin1'))
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
 from google.protobuf import reflection as _reflection
 from google.protobuf import symbol_database as _symbol_database
-from google.protobuf import descriptor_pb2
 # @@protoc_insertion_point(imports)
 
 _sym_db = _symbol_database.Default()
@@ -2768,489 +2771,42 @@ DESCRIPTOR.message_types_by_name['CnFupReadConfirm'] = _CNFUPREADCONFIRM
 DESCRIPTOR.message_types_by_name['CnFupResetRequest'] = _CNFUPRESETREQUEST
 DESCRIPTOR.message_types_by_name['CnFupResetConfirm'] = _CNFUPRESETCONFIRM
 
-DiscoveryOperation = _reflection.GeneratedProtocolMessageType('DiscoveryOperation', (_message.Message,), dict(
-  DESCRIPTOR = _DISCOVERYOPERATION,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:DiscoveryOperation)
-  ))
-_sym_db.RegisterMessage(DiscoveryOperation)
-
-SearchGatewayRequest = _reflection.GeneratedProtocolMessageType('SearchGatewayRequest', (_message.Message,), dict(
-  DESCRIPTOR = _SEARCHGATEWAYREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SearchGatewayRequest)
-  ))
-_sym_db.RegisterMessage(SearchGatewayRequest)
-
-SearchGatewayResponse = _reflection.GeneratedProtocolMessageType('SearchGatewayResponse', (_message.Message,), dict(
-  DESCRIPTOR = _SEARCHGATEWAYRESPONSE,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SearchGatewayResponse)
-  ))
-_sym_db.RegisterMessage(SearchGatewayResponse)
-
-GatewayOperation = _reflection.GeneratedProtocolMessageType('GatewayOperation', (_message.Message,), dict(
-  DESCRIPTOR = _GATEWAYOPERATION,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:GatewayOperation)
-  ))
-_sym_db.RegisterMessage(GatewayOperation)
-
-GatewayNotification = _reflection.GeneratedProtocolMessageType('GatewayNotification', (_message.Message,), dict(
-  DESCRIPTOR = _GATEWAYNOTIFICATION,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:GatewayNotification)
-  ))
-_sym_db.RegisterMessage(GatewayNotification)
-
-KeepAlive = _reflection.GeneratedProtocolMessageType('KeepAlive', (_message.Message,), dict(
-  DESCRIPTOR = _KEEPALIVE,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:KeepAlive)
-  ))
-_sym_db.RegisterMessage(KeepAlive)
-
-FactoryReset = _reflection.GeneratedProtocolMessageType('FactoryReset', (_message.Message,), dict(
-  DESCRIPTOR = _FACTORYRESET,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:FactoryReset)
-  ))
-_sym_db.RegisterMessage(FactoryReset)
-
-SetDeviceSettingsRequest = _reflection.GeneratedProtocolMessageType('SetDeviceSettingsRequest', (_message.Message,), dict(
-  DESCRIPTOR = _SETDEVICESETTINGSREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetDeviceSettingsRequest)
-  ))
-_sym_db.RegisterMessage(SetDeviceSettingsRequest)
-
-SetDeviceSettingsConfirm = _reflection.GeneratedProtocolMessageType('SetDeviceSettingsConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _SETDEVICESETTINGSCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetDeviceSettingsConfirm)
-  ))
-_sym_db.RegisterMessage(SetDeviceSettingsConfirm)
-
-SetAddressRequest = _reflection.GeneratedProtocolMessageType('SetAddressRequest', (_message.Message,), dict(
-  DESCRIPTOR = _SETADDRESSREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetAddressRequest)
-  ))
-_sym_db.RegisterMessage(SetAddressRequest)
-
-SetAddressConfirm = _reflection.GeneratedProtocolMessageType('SetAddressConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _SETADDRESSCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetAddressConfirm)
-  ))
-_sym_db.RegisterMessage(SetAddressConfirm)
-
-RegisterAppRequest = _reflection.GeneratedProtocolMessageType('RegisterAppRequest', (_message.Message,), dict(
-  DESCRIPTOR = _REGISTERAPPREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:RegisterAppRequest)
-  ))
-_sym_db.RegisterMessage(RegisterAppRequest)
-
-RegisterAppConfirm = _reflection.GeneratedProtocolMessageType('RegisterAppConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _REGISTERAPPCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:RegisterAppConfirm)
-  ))
-_sym_db.RegisterMessage(RegisterAppConfirm)
-
-StartSessionRequest = _reflection.GeneratedProtocolMessageType('StartSessionRequest', (_message.Message,), dict(
-  DESCRIPTOR = _STARTSESSIONREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:StartSessionRequest)
-  ))
-_sym_db.RegisterMessage(StartSessionRequest)
-
-StartSessionConfirm = _reflection.GeneratedProtocolMessageType('StartSessionConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _STARTSESSIONCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:StartSessionConfirm)
-  ))
-_sym_db.RegisterMessage(StartSessionConfirm)
-
-CloseSessionRequest = _reflection.GeneratedProtocolMessageType('CloseSessionRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CLOSESESSIONREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CloseSessionRequest)
-  ))
-_sym_db.RegisterMessage(CloseSessionRequest)
-
-CloseSessionConfirm = _reflection.GeneratedProtocolMessageType('CloseSessionConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CLOSESESSIONCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CloseSessionConfirm)
-  ))
-_sym_db.RegisterMessage(CloseSessionConfirm)
-
-ListRegisteredAppsRequest = _reflection.GeneratedProtocolMessageType('ListRegisteredAppsRequest', (_message.Message,), dict(
-  DESCRIPTOR = _LISTREGISTEREDAPPSREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:ListRegisteredAppsRequest)
-  ))
-_sym_db.RegisterMessage(ListRegisteredAppsRequest)
-
-ListRegisteredAppsConfirm = _reflection.GeneratedProtocolMessageType('ListRegisteredAppsConfirm', (_message.Message,), dict(
-
-  App = _reflection.GeneratedProtocolMessageType('App', (_message.Message,), dict(
-    DESCRIPTOR = _LISTREGISTEREDAPPSCONFIRM_APP,
-    __module__ = 'zehnder_pb2'
-    # @@protoc_insertion_point(class_scope:ListRegisteredAppsConfirm.App)
-    ))
-  ,
-  DESCRIPTOR = _LISTREGISTEREDAPPSCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:ListRegisteredAppsConfirm)
-  ))
-_sym_db.RegisterMessage(ListRegisteredAppsConfirm)
-_sym_db.RegisterMessage(ListRegisteredAppsConfirm.App)
-
-DeregisterAppRequest = _reflection.GeneratedProtocolMessageType('DeregisterAppRequest', (_message.Message,), dict(
-  DESCRIPTOR = _DEREGISTERAPPREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:DeregisterAppRequest)
-  ))
-_sym_db.RegisterMessage(DeregisterAppRequest)
-
-DeregisterAppConfirm = _reflection.GeneratedProtocolMessageType('DeregisterAppConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _DEREGISTERAPPCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:DeregisterAppConfirm)
-  ))
-_sym_db.RegisterMessage(DeregisterAppConfirm)
-
-ChangePinRequest = _reflection.GeneratedProtocolMessageType('ChangePinRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CHANGEPINREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:ChangePinRequest)
-  ))
-_sym_db.RegisterMessage(ChangePinRequest)
-
-ChangePinConfirm = _reflection.GeneratedProtocolMessageType('ChangePinConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CHANGEPINCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:ChangePinConfirm)
-  ))
-_sym_db.RegisterMessage(ChangePinConfirm)
-
-GetRemoteAccessIdRequest = _reflection.GeneratedProtocolMessageType('GetRemoteAccessIdRequest', (_message.Message,), dict(
-  DESCRIPTOR = _GETREMOTEACCESSIDREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:GetRemoteAccessIdRequest)
-  ))
-_sym_db.RegisterMessage(GetRemoteAccessIdRequest)
-
-GetRemoteAccessIdConfirm = _reflection.GeneratedProtocolMessageType('GetRemoteAccessIdConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _GETREMOTEACCESSIDCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:GetRemoteAccessIdConfirm)
-  ))
-_sym_db.RegisterMessage(GetRemoteAccessIdConfirm)
-
-SetRemoteAccessIdRequest = _reflection.GeneratedProtocolMessageType('SetRemoteAccessIdRequest', (_message.Message,), dict(
-  DESCRIPTOR = _SETREMOTEACCESSIDREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetRemoteAccessIdRequest)
-  ))
-_sym_db.RegisterMessage(SetRemoteAccessIdRequest)
-
-SetRemoteAccessIdConfirm = _reflection.GeneratedProtocolMessageType('SetRemoteAccessIdConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _SETREMOTEACCESSIDCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetRemoteAccessIdConfirm)
-  ))
-_sym_db.RegisterMessage(SetRemoteAccessIdConfirm)
-
-GetSupportIdRequest = _reflection.GeneratedProtocolMessageType('GetSupportIdRequest', (_message.Message,), dict(
-  DESCRIPTOR = _GETSUPPORTIDREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:GetSupportIdRequest)
-  ))
-_sym_db.RegisterMessage(GetSupportIdRequest)
-
-GetSupportIdConfirm = _reflection.GeneratedProtocolMessageType('GetSupportIdConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _GETSUPPORTIDCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:GetSupportIdConfirm)
-  ))
-_sym_db.RegisterMessage(GetSupportIdConfirm)
-
-SetSupportIdRequest = _reflection.GeneratedProtocolMessageType('SetSupportIdRequest', (_message.Message,), dict(
-  DESCRIPTOR = _SETSUPPORTIDREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetSupportIdRequest)
-  ))
-_sym_db.RegisterMessage(SetSupportIdRequest)
-
-SetSupportIdConfirm = _reflection.GeneratedProtocolMessageType('SetSupportIdConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _SETSUPPORTIDCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetSupportIdConfirm)
-  ))
-_sym_db.RegisterMessage(SetSupportIdConfirm)
-
-GetWebIdRequest = _reflection.GeneratedProtocolMessageType('GetWebIdRequest', (_message.Message,), dict(
-  DESCRIPTOR = _GETWEBIDREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:GetWebIdRequest)
-  ))
-_sym_db.RegisterMessage(GetWebIdRequest)
-
-GetWebIdConfirm = _reflection.GeneratedProtocolMessageType('GetWebIdConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _GETWEBIDCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:GetWebIdConfirm)
-  ))
-_sym_db.RegisterMessage(GetWebIdConfirm)
-
-SetWebIdRequest = _reflection.GeneratedProtocolMessageType('SetWebIdRequest', (_message.Message,), dict(
-  DESCRIPTOR = _SETWEBIDREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetWebIdRequest)
-  ))
-_sym_db.RegisterMessage(SetWebIdRequest)
-
-SetWebIdConfirm = _reflection.GeneratedProtocolMessageType('SetWebIdConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _SETWEBIDCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetWebIdConfirm)
-  ))
-_sym_db.RegisterMessage(SetWebIdConfirm)
-
-SetPushIdRequest = _reflection.GeneratedProtocolMessageType('SetPushIdRequest', (_message.Message,), dict(
-  DESCRIPTOR = _SETPUSHIDREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetPushIdRequest)
-  ))
-_sym_db.RegisterMessage(SetPushIdRequest)
-
-SetPushIdConfirm = _reflection.GeneratedProtocolMessageType('SetPushIdConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _SETPUSHIDCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:SetPushIdConfirm)
-  ))
-_sym_db.RegisterMessage(SetPushIdConfirm)
-
-UpgradeRequest = _reflection.GeneratedProtocolMessageType('UpgradeRequest', (_message.Message,), dict(
-  DESCRIPTOR = _UPGRADEREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:UpgradeRequest)
-  ))
-_sym_db.RegisterMessage(UpgradeRequest)
-
-UpgradeConfirm = _reflection.GeneratedProtocolMessageType('UpgradeConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _UPGRADECONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:UpgradeConfirm)
-  ))
-_sym_db.RegisterMessage(UpgradeConfirm)
-
-DebugRequest = _reflection.GeneratedProtocolMessageType('DebugRequest', (_message.Message,), dict(
-  DESCRIPTOR = _DEBUGREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:DebugRequest)
-  ))
-_sym_db.RegisterMessage(DebugRequest)
-
-DebugConfirm = _reflection.GeneratedProtocolMessageType('DebugConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _DEBUGCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:DebugConfirm)
-  ))
-_sym_db.RegisterMessage(DebugConfirm)
-
-VersionRequest = _reflection.GeneratedProtocolMessageType('VersionRequest', (_message.Message,), dict(
-  DESCRIPTOR = _VERSIONREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:VersionRequest)
-  ))
-_sym_db.RegisterMessage(VersionRequest)
-
-VersionConfirm = _reflection.GeneratedProtocolMessageType('VersionConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _VERSIONCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:VersionConfirm)
-  ))
-_sym_db.RegisterMessage(VersionConfirm)
-
-CnTimeRequest = _reflection.GeneratedProtocolMessageType('CnTimeRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNTIMEREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnTimeRequest)
-  ))
-_sym_db.RegisterMessage(CnTimeRequest)
-
-CnTimeConfirm = _reflection.GeneratedProtocolMessageType('CnTimeConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNTIMECONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnTimeConfirm)
-  ))
-_sym_db.RegisterMessage(CnTimeConfirm)
-
-CnNodeRequest = _reflection.GeneratedProtocolMessageType('CnNodeRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNNODEREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnNodeRequest)
-  ))
-_sym_db.RegisterMessage(CnNodeRequest)
-
-CnNodeNotification = _reflection.GeneratedProtocolMessageType('CnNodeNotification', (_message.Message,), dict(
-  DESCRIPTOR = _CNNODENOTIFICATION,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnNodeNotification)
-  ))
-_sym_db.RegisterMessage(CnNodeNotification)
-
-CnRmiRequest = _reflection.GeneratedProtocolMessageType('CnRmiRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNRMIREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnRmiRequest)
-  ))
-_sym_db.RegisterMessage(CnRmiRequest)
-
-CnRmiResponse = _reflection.GeneratedProtocolMessageType('CnRmiResponse', (_message.Message,), dict(
-  DESCRIPTOR = _CNRMIRESPONSE,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnRmiResponse)
-  ))
-_sym_db.RegisterMessage(CnRmiResponse)
-
-CnRmiAsyncRequest = _reflection.GeneratedProtocolMessageType('CnRmiAsyncRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNRMIASYNCREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnRmiAsyncRequest)
-  ))
-_sym_db.RegisterMessage(CnRmiAsyncRequest)
-
-CnRmiAsyncConfirm = _reflection.GeneratedProtocolMessageType('CnRmiAsyncConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNRMIASYNCCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnRmiAsyncConfirm)
-  ))
-_sym_db.RegisterMessage(CnRmiAsyncConfirm)
-
-CnRmiAsyncResponse = _reflection.GeneratedProtocolMessageType('CnRmiAsyncResponse', (_message.Message,), dict(
-  DESCRIPTOR = _CNRMIASYNCRESPONSE,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnRmiAsyncResponse)
-  ))
-_sym_db.RegisterMessage(CnRmiAsyncResponse)
-
-CnRpdoRequest = _reflection.GeneratedProtocolMessageType('CnRpdoRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNRPDOREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnRpdoRequest)
-  ))
-_sym_db.RegisterMessage(CnRpdoRequest)
-
-CnRpdoConfirm = _reflection.GeneratedProtocolMessageType('CnRpdoConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNRPDOCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnRpdoConfirm)
-  ))
-_sym_db.RegisterMessage(CnRpdoConfirm)
-
-CnRpdoNotification = _reflection.GeneratedProtocolMessageType('CnRpdoNotification', (_message.Message,), dict(
-  DESCRIPTOR = _CNRPDONOTIFICATION,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnRpdoNotification)
-  ))
-_sym_db.RegisterMessage(CnRpdoNotification)
-
-CnAlarmNotification = _reflection.GeneratedProtocolMessageType('CnAlarmNotification', (_message.Message,), dict(
-  DESCRIPTOR = _CNALARMNOTIFICATION,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnAlarmNotification)
-  ))
-_sym_db.RegisterMessage(CnAlarmNotification)
-
-CnFupReadRegisterRequest = _reflection.GeneratedProtocolMessageType('CnFupReadRegisterRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPREADREGISTERREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupReadRegisterRequest)
-  ))
-_sym_db.RegisterMessage(CnFupReadRegisterRequest)
-
-CnFupReadRegisterConfirm = _reflection.GeneratedProtocolMessageType('CnFupReadRegisterConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPREADREGISTERCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupReadRegisterConfirm)
-  ))
-_sym_db.RegisterMessage(CnFupReadRegisterConfirm)
-
-CnFupProgramBeginRequest = _reflection.GeneratedProtocolMessageType('CnFupProgramBeginRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPPROGRAMBEGINREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupProgramBeginRequest)
-  ))
-_sym_db.RegisterMessage(CnFupProgramBeginRequest)
-
-CnFupProgramBeginConfirm = _reflection.GeneratedProtocolMessageType('CnFupProgramBeginConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPPROGRAMBEGINCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupProgramBeginConfirm)
-  ))
-_sym_db.RegisterMessage(CnFupProgramBeginConfirm)
-
-CnFupProgramRequest = _reflection.GeneratedProtocolMessageType('CnFupProgramRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPPROGRAMREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupProgramRequest)
-  ))
-_sym_db.RegisterMessage(CnFupProgramRequest)
-
-CnFupProgramConfirm = _reflection.GeneratedProtocolMessageType('CnFupProgramConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPPROGRAMCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupProgramConfirm)
-  ))
-_sym_db.RegisterMessage(CnFupProgramConfirm)
-
-CnFupProgramEndRequest = _reflection.GeneratedProtocolMessageType('CnFupProgramEndRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPPROGRAMENDREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupProgramEndRequest)
-  ))
-_sym_db.RegisterMessage(CnFupProgramEndRequest)
-
-CnFupProgramEndConfirm = _reflection.GeneratedProtocolMessageType('CnFupProgramEndConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPPROGRAMENDCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupProgramEndConfirm)
-  ))
-_sym_db.RegisterMessage(CnFupProgramEndConfirm)
-
-CnFupReadRequest = _reflection.GeneratedProtocolMessageType('CnFupReadRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPREADREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupReadRequest)
-  ))
-_sym_db.RegisterMessage(CnFupReadRequest)
-
-CnFupReadConfirm = _reflection.GeneratedProtocolMessageType('CnFupReadConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPREADCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupReadConfirm)
-  ))
-_sym_db.RegisterMessage(CnFupReadConfirm)
-
-CnFupResetRequest = _reflection.GeneratedProtocolMessageType('CnFupResetRequest', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPRESETREQUEST,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupResetRequest)
-  ))
-_sym_db.RegisterMessage(CnFupResetRequest)
-
-CnFupResetConfirm = _reflection.GeneratedProtocolMessageType('CnFupResetConfirm', (_message.Message,), dict(
-  DESCRIPTOR = _CNFUPRESETCONFIRM,
-  __module__ = 'zehnder_pb2'
-  # @@protoc_insertion_point(class_scope:CnFupResetConfirm)
-  ))
-_sym_db.RegisterMessage(CnFupResetConfirm)
+# The message classes are created when they are first used, see __getattr__ below. Creating all of them takes
+# longer than most scripts need the bridge for.
+_classes = {}
+_classes_lock = threading.RLock()
+
+__all__ = ['DESCRIPTOR'] + list(DESCRIPTOR.message_types_by_name)
+
+
+def _message_class(descriptor):
+  """Returns the class of a message type. It's created together with its nested types and the types it refers to."""
+
+  with _classes_lock:
+    cls = _classes.get(descriptor.full_name)
+    if cls is None:
+      attributes = dict(DESCRIPTOR=descriptor, __module__='zehnder_pb2')
+      for nested_type in descriptor.nested_types:
+        attributes[nested_type.name] = _message_class(nested_type)
+
+      cls = _reflection.GeneratedProtocolMessageType(descriptor.name, (_message.Message,), attributes)
+      _classes[descriptor.full_name] = cls
+      _sym_db.RegisterMessage(cls)
+
+      for field in descriptor.fields:
+        if field.message_type is not None:
+          _message_class(field.message_type)
+
+  return cls
+
+
+def __getattr__(name):
+  descriptor = DESCRIPTOR.message_types_by_name.get(name)
+  if descriptor is None:
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+  cls = globals()[name] = _message_class(descriptor)
+  return cls
 
 
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,117 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pycomfoconnect.capture import CaptureReader, CaptureWriter, index_path
+from pycomfoconnect.recorder import RX, TX
+
+START = 1700000000.0
+
+
+class CaptureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.cap')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, count, start=START, **kwargs):
+        """Write count frames, one every 0.1 seconds from start on, and return them."""
+
+        written = []
+        with CaptureWriter(self.path, **kwargs) as writer:
+            for i in range(count):
+                timestamp = start + i / 10
+                direction = TX if i % 3 == 0 else RX
+                frame = bytes([i % 256]) * (i % 50 + 1)
+                if direction == TX:
+                    writer.write_parts(direction, [frame[:1], frame[1:]], timestamp)
+                else:
+                    writer.write_frames(direction, [frame], timestamp, kernel_time=True)
+                written.append((timestamp, direction, direction == RX, frame))
+
+        return written
+
+    def _read(self, start=None, end=None):
+        with CaptureReader(self.path) as reader:
+            return [(record.timestamp, record.direction, record.kernel_time, bytes(record.data))
+                    for record in reader.frames(start, end)]
+
+    def test_round_trip(self):
+        written = self._write(100)
+
+        self.assertEqual(self._read(), written)
+        with CaptureReader(self.path) as reader:
+            self.assertEqual(reader.end, written[-1][0])
+
+    def test_append(self):
+        written = self._write(10)
+        written += self._write(10, start=START + 10)
+
+        self.assertEqual(self._read(), written)
+
+    def test_index_seek(self):
+        written = self._write(1000)
+
+        # An entry every second
+        self.assertEqual(os.path.getsize(index_path(self.path)) // 16, 100)
+
+        for start, end in ((None, START + 5), (START + 30, START + 30.55), (START + 99.9, None), (START + 200, None)):
+            expected = [record for record in written
+                        if (start is None or record[0] >= start) and (end is None or record[0] < end)]
+            self.assertEqual(self._read(start, end), expected)
+
+    def test_torn_tail(self):
+        written = self._write(100)
+
+        # A crash in the middle of the last record
+        with open(self.path, 'r+b') as capturefile:
+            capturefile.truncate(os.path.getsize(self.path) - 3)
+        self.assertEqual(self._read(), written[:-1])
+
+        written = written[:-1] + self._write(10, start=START + 20)
+
+        self.assertEqual(self._read(), written)
+        self.assertEqual(self._read(START + 20), written[-10:])
+
+    def test_torn_tail_with_index_past_it(self):
+        written = self._write(100)
+
+        # The index points to the record that is cut off, and to one that was never written
+        size = os.path.getsize(self.path)
+        last = size - 13 - len(written[-1][3])
+        with open(index_path(self.path), 'ab') as indexfile:
+            indexfile.write(struct.pack('>dQ', written[-1][0], last))
+            indexfile.write(struct.pack('>dQ', written[-1][0] + 1, size))
+        with open(self.path, 'r+b') as capturefile:
+            capturefile.truncate(size - 3)
+
+        written = written[:-1] + self._write(10, start=START + 20)
+
+        self.assertEqual(self._read(), written)
+        self.assertEqual(self._read(START + 20), written[-10:])
+
+    def test_torn_header(self):
+        with open(self.path, 'wb') as capturefile:
+            capturefile.write(b'PCCCAP01\x41')
+
+        written = self._write(10)
+
+        self.assertEqual(self._read(), written)
+
+    def test_not_a_capture(self):
+        with open(self.path, 'wb') as capturefile:
+            capturefile.write(b'something else')
+
+        with self.assertRaises(Exception):
+            CaptureWriter(self.path)
+        with self.assertRaises(Exception):
+            CaptureReader(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+from pycomfoconnect.message import FrameTemplate, Message, TemplateCache
+from pycomfoconnect.zehnder_pb2 import CnRmiRequest, CnRpdoRequest, CnTimeRequest, KeepAlive, StartSessionRequest
+
+LOCAL_UUID = bytes.fromhex('00000000000000000000000000001337')
+BRIDGE_UUID = bytes.fromhex('0000000000251010800170b3d54264b4')
+
+# Around every size of the varint of a reference
+REFERENCES = [0, 1, 127, 128, 300, 16383, 16384, (1 << 21) - 1, 1 << 21, (1 << 28) - 1, 1 << 28, (1 << 32) - 1]
+
+COMMANDS = [
+    (KeepAlive, None),
+    (CnTimeRequest, None),
+    (StartSessionRequest, {'takeover': True}),
+    (CnRpdoRequest, {'pdid': 65, 'type': 1, 'zone': 1}),
+    (CnRpdoRequest, {'pdid': 300, 'type': 2, 'zone': 1, 'timeout': 0}),
+    (CnRmiRequest, {'nodeId': 1, 'message': b'\x84\x15\x01\x06\x00\x00\x00\x00\x58\x02\x00\x00\x03'}),
+]
+
+
+def encode(command, reference, msg_params=None) -> bytes:
+    return Message.create(LOCAL_UUID, BRIDGE_UUID, command, {'reference': reference}, msg_params).encode()
+
+
+class FrameTemplateTest(unittest.TestCase):
+
+    def test_same_as_encode(self):
+        for command, msg_params in COMMANDS:
+            template = FrameTemplate(LOCAL_UUID, BRIDGE_UUID, command, msg_params)
+            for reference in REFERENCES:
+                message = template.create(reference)
+
+                expected = encode(command, reference, msg_params)
+                self.assertEqual(message.encode(), expected, (command, reference))
+                self.assertEqual(b''.join(message.encode_parts()), expected)
+
+                # Looking at it doesn't change it
+                self.assertEqual(message.cmd.reference, reference)
+                self.assertEqual(message.msg, Message.decode(expected).msg)
+                self.assertEqual(message.encode(), expected)
+
+    def test_reference_sizes_in_any_order(self):
+        template = FrameTemplate(LOCAL_UUID, BRIDGE_UUID, CnTimeRequest)
+
+        for reference in REFERENCES[::-1] + REFERENCES:
+            self.assertEqual(template.create(reference).encode(), encode(CnTimeRequest, reference))
+
+    def test_messages_are_independent(self):
+        template = FrameTemplate(LOCAL_UUID, BRIDGE_UUID, CnTimeRequest)
+
+        first = template.create(1)
+        second = template.create(2)
+
+        self.assertEqual(first.encode(), encode(CnTimeRequest, 1))
+        self.assertEqual(second.encode(), encode(CnTimeRequest, 2))
+
+    def test_changed_in_place(self):
+        template = FrameTemplate(LOCAL_UUID, BRIDGE_UUID, CnRpdoRequest, {'pdid': 65, 'type': 1, 'zone': 1})
+
+        message = template.create(5)
+        message.cmd.reference = 6
+        self.assertEqual(message.encode(), encode(CnRpdoRequest, 6, {'pdid': 65, 'type': 1, 'zone': 1}))
+
+        message = template.create(5)
+        message.msg.pdid = 66
+        self.assertEqual(message.encode(), encode(CnRpdoRequest, 5, {'pdid': 66, 'type': 1, 'zone': 1}))
+
+        # The template itself isn't changed by that
+        self.assertEqual(template.create(5).encode(), encode(CnRpdoRequest, 5, {'pdid': 65, 'type': 1, 'zone': 1}))
+
+    def test_replaced(self):
+        template = FrameTemplate(LOCAL_UUID, BRIDGE_UUID, CnTimeRequest)
+
+        message = template.create(5)
+        message.cmd = Message.decode(encode(CnTimeRequest, 7)).cmd
+        self.assertEqual(message.encode(), encode(CnTimeRequest, 7))
+
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def test_same_as_encode(self):
+        templates = TemplateCache(LOCAL_UUID, BRIDGE_UUID)
+
+        for reference in REFERENCES:
+            for command, msg_params in COMMANDS:
+                self.assertEqual(templates.create(command, reference, msg_params).encode(),
+                                 encode(command, reference, msg_params))
+
+        self.assertEqual(len(templates._templates), len(COMMANDS))
+
+    def test_full(self):
+        templates = TemplateCache(LOCAL_UUID, BRIDGE_UUID)
+
+        for pdid in range(templates.MAX_TEMPLATES + 10):
+            msg_params = {'pdid': pdid, 'type': 1, 'zone': 1}
+            self.assertEqual(templates.create(CnRpdoRequest, pdid, msg_params).encode(),
+                             encode(CnRpdoRequest, pdid, msg_params))
+
+        self.assertEqual(len(templates._templates), templates.MAX_TEMPLATES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pycomfoconnect.message import Message
+from pycomfoconnect.pcap import PcapReader
+from pycomfoconnect.recorder import RX, TX
+from pycomfoconnect.zehnder_pb2 import CnRpdoNotification
+
+LOCAL_UUID = bytes.fromhex('00000000000000000000000000001337')
+BRIDGE_UUID = bytes.fromhex('0000000000251010800170b3d54264b4')
+
+BRIDGE_ADDRESS = bytes([192, 168, 1, 50])
+APP_ADDRESS = bytes([192, 168, 1, 20])
+APP_PORT = 50123
+BRIDGE_PORT = 56747
+
+SYN = 0x02
+PSH_ACK = 0x18
+FIN_ACK = 0x11
+
+
+def rpdo_frames(count):
+    """Returns count notifications like the bridge sends them."""
+
+    return [Message.create(BRIDGE_UUID, LOCAL_UUID, CnRpdoNotification, {'reference': number + 1},
+                           {'pdid': 65 + number % 10, 'data': bytes([number % 256]) * (number % 4 + 1)}).encode()
+            for number in range(count)]
+
+
+def segments(stream, seq, sizes):
+    """Split stream in segments of the given sizes, the last one takes the rest."""
+
+    result = []
+    offset = 0
+    for size in sizes:
+        result.append((seq + offset, PSH_ACK, stream[offset:offset + size]))
+        offset += size
+    result.append((seq + offset, PSH_ACK, stream[offset:]))
+
+    return result
+
+
+class PcapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.pcap')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, packets):
+        """Write a pcap with Ethernet frames. A packet is the sequence number, the flags and the payload of a segment
+        from the bridge, or the same with TX in front for a segment to it."""
+
+        with open(self.path, 'wb') as pcapfile:
+            pcapfile.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+            for number, packet in enumerate(packets):
+                if packet[0] == TX:
+                    src, dst, src_port, dst_port = APP_ADDRESS, BRIDGE_ADDRESS, APP_PORT, BRIDGE_PORT
+                    packet = packet[1:]
+                else:
+                    src, dst, src_port, dst_port = BRIDGE_ADDRESS, APP_ADDRESS, BRIDGE_PORT, APP_PORT
+                seq, flags, payload = packet
+
+                tcp = struct.pack('>HHLLBBHHH', src_port, dst_port, seq & 0xffffffff, 0, 5 << 4, flags, 65535, 0, 0)
+                ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 40 + len(payload), 0, 0x4000, 64, 6, 0, src, dst)
+                data = b'\x00' * 12 + b'\x08\x00' + ip + tcp + payload
+
+                pcapfile.write(struct.pack('<IIII', 1600000000, number, len(data), len(data)))
+                pcapfile.write(data)
+
+    def _read(self, **kwargs):
+        reader = PcapReader(self.path, **kwargs)
+        return [frame.data for frame in reader], reader
+
+    def test_in_order(self):
+        frames = rpdo_frames(20)
+        stream = b''.join(frames)
+        self._write([(999, SYN, b'')] + segments(stream, 1000, [1, 3, 50, 7, 200]) +
+                    [(1000 + len(stream), FIN_ACK, b'')])
+
+        read, reader = self._read()
+
+        self.assertEqual(read, frames)
+        self.assertEqual(reader.skipped, 0)
+
+    def test_directions(self):
+        sent = [Message.create(LOCAL_UUID, BRIDGE_UUID, CnRpdoNotification, {'reference': 1},
+                               {'pdid': 1, 'data': b'\x01'}).encode()]
+        received = rpdo_frames(2)
+        self._write([(TX, 4999, SYN, b''), (999, SYN, b''), (TX, 5000, PSH_ACK, sent[0]),
+                     (1000, PSH_ACK, received[0] + received[1])])
+
+        reader = PcapReader(self.path)
+        read = [(frame.direction, frame.connection, frame.data) for frame in reader]
+
+        client = ('192.168.1.20', APP_PORT)
+        self.assertEqual(read, [(TX, client, sent[0]), (RX, client, received[0]), (RX, client, received[1])])
+
+    def test_out_of_order(self):
+        frames = rpdo_frames(20)
+        stream = b''.join(frames)
+        packets = segments(stream, 1000, [10, 60, 5, 100, 33, 200])
+
+        # The third segment arrives last, the others wait for it
+        packets = [(999, SYN, b'')] + packets[:2] + packets[3:] + packets[2:3]
+        self._write(packets)
+
+        read, reader = self._read()
+
+        self.assertEqual(read, frames)
+        self.assertEqual(reader.skipped, 0)
+
+    def test_retransmitted(self):
+        frames = rpdo_frames(20)
+        stream = b''.join(frames)
+        packets = segments(stream, 1000, [10, 60, 5, 100, 33, 200])
+
+        # A segment that is sent twice, one that is sent again with more data, and one that is sent again late
+        packets = ([(999, SYN, b'')] + packets[:2] + packets[1:3] + [(1070, PSH_ACK, stream[70:175])] +
+                   packets[3:] + packets[4:5])
+        self._write(packets)
+
+        read, reader = self._read()
+
+        self.assertEqual(read, frames)
+        self.assertEqual(reader.skipped, 0)
+
+    def test_retransmitted_out_of_order(self):
+        frames = rpdo_frames(20)
+        stream = b''.join(frames)
+        packets = segments(stream, 1000, [10, 60, 5, 100, 33, 200])
+
+        # A segment that is waiting for the data before it arrives twice
+        packets = [(999, SYN, b'')] + packets[:1] + packets[2:3] + packets[2:] + packets[1:2]
+        self._write(packets)
+
+        read, reader = self._read()
+
+        self.assertEqual(read, frames)
+        self.assertEqual(reader.skipped, 0)
+
+    def test_sequence_wraps(self):
+        frames = rpdo_frames(20)
+        stream = b''.join(frames)
+        seq = (1 << 32) - 100
+        packets = segments(stream, seq, [50, 60, 70])
+        packets = [(seq - 1, SYN, b'')] + packets[:1] + packets[2:3] + packets[1:2] + packets[3:]
+        self._write(packets)
+
+        read, reader = self._read()
+
+        self.assertEqual(read, frames)
+
+    def test_missing_segment(self):
+        frames = rpdo_frames(40)
+        stream = b''.join(frames)
+        middle = sum(len(frame) for frame in frames[:20])
+        packets = segments(stream, 1000, [middle - 10, 20])
+
+        # The segment in the middle is never captured, so the frames it is part of are skipped
+        self._write([(999, SYN, b'')] + packets[:1] + packets[2:])
+
+        read, reader = self._read(max_pending=100)
+
+        self.assertEqual(read[:19], frames[:19])
+        self.assertEqual(read[19:], frames[-len(read) + 19:])
+        self.assertGreaterEqual(len(read), 19 + 18)
+        self.assertGreater(reader.skipped, 0)
+
+    def test_without_syn(self):
+        frames = rpdo_frames(20)
+        stream = b''.join(frames)
+
+        # The capture started in the middle of a frame
+        self._write(segments(stream[len(frames[0]) - 5:], 1000, [30, 30, 30]))
+
+        read, reader = self._read()
+
+        self.assertEqual(read, frames[1:])
+        self.assertEqual(reader.skipped, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
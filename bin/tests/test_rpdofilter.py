@@ -0,0 +1,152 @@
+import random
+import struct
+import unittest
+
+from pycomfoconnect.comfoconnect import RPDO_TYPE_MAP
+from pycomfoconnect.message import Message, encode_varint
+from pycomfoconnect.rpdofilter import RpdoFilter
+from pycomfoconnect.zehnder_pb2 import CnAlarmNotification, CnNodeNotification, CnRpdoNotification, GatewayOperation
+
+LOCAL_UUID = bytes.fromhex('00000000000000000000000000001337')
+BRIDGE_UUID = bytes.fromhex('0000000000251010800170b3d54264b4')
+
+# Size of the data of a sensor update by its type
+DATA_SIZES = {0: 1, 1: 1, 2: 2, 3: 4, 6: 2}
+
+
+def rpdo_frame(reference, pdid, data):
+    return Message.create(BRIDGE_UUID, LOCAL_UUID, CnRpdoNotification, {'reference': reference},
+                          {'pdid': pdid, 'data': data}).encode()
+
+
+def raw_frame(cmd, msg):
+    """Returns a frame with a GatewayOperation and a message that were serialized by hand."""
+
+    return struct.pack('>L', 16 + 16 + 2 + len(cmd) + len(msg)) + BRIDGE_UUID + LOCAL_UUID + \
+        struct.pack('>H', len(cmd)) + cmd + msg
+
+
+class Decoder(object):
+    """Decides like RpdoFilter does, but on fully decoded messages."""
+
+    def __init__(self, dedup):
+        self.dedup = dedup
+        self.subscribed = set()
+        self._last = {}
+
+    def subscribe(self, pdid):
+        self.subscribed.add(pdid)
+        self._last.pop(pdid, None)
+
+    def unsubscribe(self, pdid):
+        self.subscribed.discard(pdid)
+        self._last.pop(pdid, None)
+
+    def accept(self, frame) -> bool:
+        message = Message.decode(frame)
+        if message.cmd.type != GatewayOperation.CnRpdoNotificationType:
+            return True
+
+        pdid = message.msg.pdid
+        if pdid not in self.subscribed:
+            return False
+
+        if self.dedup:
+            if self._last.get(pdid) == message.msg.data:
+                return False
+            self._last[pdid] = message.msg.data
+
+        return True
+
+
+class RpdoFilterTest(unittest.TestCase):
+
+    def _compare(self, dedup):
+        rng = random.Random(1)
+        rpdo_filter = RpdoFilter(dedup)
+        decoder = Decoder(dedup)
+
+        sensors = sorted(RPDO_TYPE_MAP.items())
+        for pdid, _ in sensors[::2]:
+            rpdo_filter.subscribe(pdid)
+            decoder.subscribe(pdid)
+
+        for number in range(5000):
+            reference = rng.choice((number + 1, rng.randrange(1 << 32)))
+
+            if number % 500 == 250:
+                # Change the subscriptions on the way
+                pdid = rng.choice(sensors)[0]
+                if pdid in decoder.subscribed:
+                    rpdo_filter.unsubscribe(pdid)
+                    decoder.unsubscribe(pdid)
+                else:
+                    rpdo_filter.subscribe(pdid)
+                    decoder.subscribe(pdid)
+
+            if number % 50 == 0:
+                frame = Message.create(BRIDGE_UUID, LOCAL_UUID, CnNodeNotification, {'reference': reference},
+                                       {'nodeId': 1, 'productId': 1, 'zoneId': 1}).encode()
+            elif number % 50 == 1:
+                frame = Message.create(BRIDGE_UUID, LOCAL_UUID, CnAlarmNotification, {'reference': reference},
+                                       {'zone': 1, 'nodeId': 1}).encode()
+            elif number % 50 == 2:
+                # A sensor we don't know
+                frame = rpdo_frame(reference, rng.randrange(1 << 16), b'\x01')
+            else:
+                pdid, sensor_type = rng.choice(sensors)
+                size = DATA_SIZES[sensor_type]
+                value = rng.choice((0, 1, rng.randrange(1 << (8 * size))))
+                frame = rpdo_frame(reference, pdid, value.to_bytes(size, 'little'))
+
+            self.assertEqual(rpdo_filter.accept(frame), decoder.accept(frame), Message.decode(frame))
+
+        self.assertEqual(rpdo_filter.passed + rpdo_filter.skipped, 5000 - 5000 // 50 * 2)
+        self.assertGreater(rpdo_filter.unsubscribed, 0)
+        if dedup:
+            self.assertGreater(rpdo_filter.unchanged, 0)
+
+    def test_compare_with_decode(self):
+        self._compare(dedup=False)
+
+    def test_compare_with_decode_dedup(self):
+        self._compare(dedup=True)
+
+    def test_every_sensor_type(self):
+        for pdid, sensor_type in sorted(RPDO_TYPE_MAP.items()):
+            rpdo_filter = RpdoFilter()
+            data = bytes(range(1, DATA_SIZES[sensor_type] + 1))
+
+            self.assertFalse(rpdo_filter.accept(rpdo_frame(1, pdid, data)))
+
+            rpdo_filter.subscribe(pdid)
+            self.assertTrue(rpdo_filter.accept(rpdo_frame(2, pdid, data)))
+            self.assertFalse(rpdo_filter.accept(rpdo_frame(3, pdid, data)))
+            self.assertTrue(rpdo_filter.accept(rpdo_frame(4, pdid, b'\x00' * len(data))))
+
+            # Subscribing again lets the next update through, even when it didn't change
+            rpdo_filter.subscribe(pdid)
+            self.assertTrue(rpdo_filter.accept(rpdo_frame(5, pdid, b'\x00' * len(data))))
+
+    def test_fields_out_of_order(self):
+        rpdo_filter = RpdoFilter()
+        rpdo_filter.subscribe(300)
+
+        # The reference before the type, and the data before the pdid
+        cmd = b'\x20' + encode_varint(1000) + b'\x08' + encode_varint(GatewayOperation.CnRpdoNotificationType)
+        for pdid, expected in ((300, True), (301, False)):
+            frame = raw_frame(cmd, b'\x12\x01\x05\x08' + encode_varint(pdid))
+            self.assertEqual(Message.decode(frame).msg.pdid, pdid)
+            self.assertEqual(rpdo_filter.accept(frame), expected)
+
+    def test_broken_frame(self):
+        rpdo_filter = RpdoFilter()
+
+        # Left for the decoder to complain about
+        frame = rpdo_frame(1, 65, b'\x01')
+        self.assertTrue(rpdo_filter.accept(frame[:40]))
+        self.assertTrue(rpdo_filter.accept(frame[:38 + struct.unpack_from('>H', frame, 36)[0]]))
+
+
+if __name__ == '__main__':
+    unittest.main()